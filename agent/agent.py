@@ -1,10 +1,27 @@
+import os
+import queue
+import sys
+import threading
+import time
 import psutil
 import socket
 import platform
 import shutil
 import requests
+import gzip
+import hashlib
+import http.server
+import json
+import random
+import struct
+import tempfile
 from datetime import datetime, timezone
 
+try:
+    import zstandard
+except ImportError:  # optional: only needed for compression="zstd"
+    zstandard = None
+
 
 # Embedded default config
 DEFAULT_CONFIG = {
@@ -12,113 +29,906 @@ DEFAULT_CONFIG = {
     "api_key": "TESTKEY123",
     # How often to post snapshots (seconds)
     "interval_sec": 2,
-    # Sleep used between priming and reading cpu_percent (milliseconds)
-    "sample_sleep_ms": 200,
     # Whether to include full command lines (expensive on Windows)
     "include_cmdline": False,
     # If set, only keep top N processes by memory to reduce payload
     "top_n_processes": None,
+    # On Linux, read /proc directly instead of going through psutil per process
+    "procfs_fast_path": True,
+    # Send only added/changed/removed processes against the last acknowledged snapshot
+    "delta_mode": True,
+    # Send a full process list every N ticks even in delta mode
+    "keyframe_every": 30,
+    # "json" or "columnar" (compact binary columns, see backend monitor/columnar.py)
+    "wire_format": "columnar",
+    # Compression for the columnar format: "gzip", "zstd" or None
+    "compression": "gzip",
+    # Bulk endpoint used to replay spooled snapshots (default: backend_url + "/batch")
+    "batch_url": None,
+    # Snapshots taken while the backend is unreachable are buffered here
+    "spool_dir": os.path.join(tempfile.gettempdir(), "monitor-agent-spool"),
+    # Oldest spooled snapshots are dropped beyond this size
+    "spool_max_mb": 64,
+    # Snapshots per bulk request, and bulk requests per tick, when replaying the spool
+    "spool_batch_size": 100,
+    "spool_batches_per_tick": 5,
+    # Upper bound of the randomized retry delay after failures (seconds)
+    "backoff_max_sec": 60,
+    # Posts in flight at once; collection never waits for them
+    "max_in_flight": 2,
+    # Collected ticks waiting to be sent; beyond this they go straight to the spool
+    "send_queue_size": 10,
+    # Local Prometheus endpoint with the agent's own metrics ("host:port"), or None
+    "metrics_addr": "127.0.0.1:9102",
+    # The agent's own CPU use (% of one core) the governor keeps it under, or None
+    "cpu_budget_percent": 5.0,
+    # What the governor falls back to when over budget
+    "governor_top_n": 200,
+    "governor_max_interval_sec": 30,
 }
 
+COLUMNAR_MEDIA_TYPE = "application/x-monitor-columnar"
+
 def load_config():
     return DEFAULT_CONFIG
 
+def collect_inventory():
+    """Static facts about the machine; sent only when they change (see inventory_digest)."""
+    return {
+        "os": platform.platform(),
+        "processor": platform.processor(),
+        "cores": psutil.cpu_count(logical=False) or 0,
+        "threads": psutil.cpu_count(logical=True) or 0,
+        "ram_gb": round(psutil.virtual_memory().total / (1024**3), 2),
+        "storage_total_gb": round(shutil.disk_usage("/").total / (1024**3), 2),
+    }
+
+def inventory_digest(inventory):
+    """Version id of an inventory. Must match digest_hex in backend monitor/inventory.py."""
+    doc = {
+        "os": str(inventory["os"]),
+        "processor": str(inventory.get("processor") or ""),
+        "cores": int(inventory["cores"]),
+        "threads": int(inventory["threads"]),
+        "ram_gb": float(inventory["ram_gb"]),
+        "storage_total_gb": float(inventory["storage_total_gb"]),
+    }
+    text = json.dumps(doc, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(text.encode("utf-8"), digest_size=8).hexdigest()
+
 def collect_system_info():
     vm = psutil.virtual_memory()
     disk = shutil.disk_usage("/")
     cpu_freq = psutil.cpu_freq()
 
     return {
-        "os": platform.platform(),
-        "processor": platform.processor(),
-        "cores": psutil.cpu_count(logical=False) or 0,
-        "threads": psutil.cpu_count(logical=True) or 0,
-        "ram_gb": round(vm.total / (1024**3), 2),
         "used_ram_gb": round((vm.total - vm.available) / (1024**3), 2),
         "available_ram_gb": round(vm.available / (1024**3), 2),
-        "storage_total_gb": round(disk.total / (1024**3), 2),
         "storage_used_gb": round(disk.used / (1024**3), 2),
         "storage_free_gb": round(disk.free / (1024**3), 2),
         "cpu_freq_mhz": round(cpu_freq.current, 2) if cpu_freq else None,
     }
 
-def collect_processes(include_cmdline: bool = False, sample_sleep_ms: int = 200, top_n: int | None = None):
-    # First pass: prime CPU counters for each process (returns 0.0 initially)
-    procs = []
-    for p in psutil.process_iter(["pid", "ppid", "name"]):
-        try:
-            p.cpu_percent(None)
-            procs.append(p)
-        except (psutil.NoSuchProcess, psutil.AccessDenied):
-            continue
-
-    # Small sampling interval to measure CPU deltas
-    sleep_secs = max(0.05, (sample_sleep_ms or 200) / 1000.0)
-    __import__('time').sleep(sleep_secs)
-
-    # Second pass: read cpu_percent and memory
-    processes = []
-    for p in procs:
-        try:
-            with p.oneshot():
-                info = {
-                    "pid": p.pid,
-                    "ppid": p.ppid(),
-                    "name": p.name() or "unknown",
-                    "cpu_percent": float(p.cpu_percent(None)),
-                    "memory_mb": round(p.memory_info().rss / (1024 * 1024), 2),
-                }
-                if include_cmdline:
-                    try:
-                        cmd = p.cmdline()
-                        info["cmdline"] = " ".join(cmd) if cmd else ""
-                    except Exception:
-                        info["cmdline"] = ""
-                processes.append(info)
-        except (psutil.NoSuchProcess, psutil.AccessDenied):
-            continue
-
-    # Optionally down-select to reduce payload size and time
-    if top_n:
-        processes.sort(key=lambda x: x["memory_mb"], reverse=True)
-        processes = processes[: int(top_n)]
-    return processes
+class ProcessCollector:
+    """
+    Collects the process list in a single pass per tick.
+
+    Per-process state survives between calls, keyed by pid and create time so
+    a reused pid starts fresh. Each process reports its start time in epoch
+    seconds (`started`), which the backend uses to tell a reused pid apart. CPU% is the change in CPU time since the
+    previous call divided by the wall time between calls (100 = one core), so
+    no sampling sleep is needed. A process reports 0.0 the first time it is
+    seen, including on the very first call.
+
+    On Linux the fast path reads /proc/[pid]/stat and /proc/[pid]/statm
+    directly; elsewhere psutil handles are kept across ticks.
+    """
+
+    def __init__(self, include_cmdline: bool = False, top_n: int | None = None, procfs: bool | None = None):
+        self.include_cmdline = include_cmdline
+        self.top_n = int(top_n) if top_n else None
+        if procfs is None:
+            procfs = sys.platform.startswith("linux") and os.path.exists("/proc/self/stat")
+        self.procfs = procfs
+        # pid -> [create_time, cpu_time, name, cmdline, psutil handle]
+        self._known = {}
+        self._last_tick = None
+        if procfs:
+            self._clk_tck = os.sysconf("SC_CLK_TCK")
+            self._page_mb = os.sysconf("SC_PAGE_SIZE") / (1024 * 1024)
+            # /proc/[pid]/stat start times count clock ticks since boot
+            self._boot_time = int(psutil.boot_time())
+
+    def set_include_cmdline(self, enabled: bool):
+        if enabled and not self.include_cmdline:
+            # Identities cached while off have no command line; read them again
+            for state in self._known.values():
+                state[2] = None
+        self.include_cmdline = enabled
+
+    def collect(self):
+        now = time.monotonic()
+        elapsed = now - self._last_tick if self._last_tick is not None else None
+        self._last_tick = now
+
+        rows = self._scan_procfs() if self.procfs else self._scan_psutil()
+        seen = set()
+        processes = []
+        for pid, ppid, create_time, cpu_time, rss_mb, state in rows:
+            seen.add(pid)
+            prev = self._known.get(pid)
+            if prev is None or prev[0] != create_time:
+                prev = self._known[pid] = [create_time, None, None, None, state]
+            cpu = 0.0
+            if elapsed and prev[1] is not None:
+                cpu = round(max(0.0, cpu_time - prev[1]) / elapsed * 100, 1)
+            prev[1] = cpu_time
+
+            if prev[2] is None:
+                prev[2], prev[3] = self._identity(pid, state)
+            info = {
+                "pid": pid,
+                "ppid": ppid,
+                "name": prev[2],
+                "cpu_percent": cpu,
+                "memory_mb": round(rss_mb, 2),
+                "started": self._started(create_time),
+            }
+            if self.include_cmdline:
+                info["cmdline"] = prev[3]
+            processes.append(info)
+
+        for pid in self._known.keys() - seen:
+            del self._known[pid]
+
+        # Optionally down-select to reduce payload size
+        if self.top_n:
+            processes.sort(key=lambda x: x["memory_mb"], reverse=True)
+            processes = processes[: self.top_n]
+        return processes
+
+    def _started(self, create_time):
+        """Epoch seconds from a create time: ticks since boot (procfs) or epoch seconds (psutil)."""
+        if not self.procfs:
+            return int(create_time)
+        return self._boot_time + int(create_time // self._clk_tck)
+
+    def _identity(self, pid, state):
+        """Name and command line, read once per process lifetime. `state` is the comm (procfs) or handle (psutil)."""
+        if not self.procfs:
+            try:
+                name = state.name() or "unknown"
+            except psutil.Error:
+                name = "unknown"
+            cmdline = ""
+            if self.include_cmdline:
+                # Protected processes (Windows, macOS) hide their command line but not their name
+                try:
+                    cmdline = " ".join(state.cmdline())
+                except psutil.Error:
+                    pass
+            return name, cmdline
+
+        comm = state
+        cmdline = ""
+        # comm is truncated to 15 bytes; recover the full name from argv[0] like psutil does
+        if self.include_cmdline or len(comm) >= 15:
+            argv = _read_proc(f"/proc/{pid}/cmdline")
+            args = argv.rstrip(b"\0").split(b"\0") if argv else []
+            cmdline = " ".join(a.decode("utf-8", "replace") for a in args)
+            if len(comm) >= 15 and args:
+                exe = os.path.basename(args[0].decode("utf-8", "replace"))
+                if exe.startswith(comm):
+                    comm = exe
+        return comm or "unknown", cmdline
+
+    def _scan_procfs(self):
+        """Yield (pid, ppid, create_time, cpu_seconds, rss_mb, comm) for every readable /proc entry."""
+        clk_tck, page_mb = self._clk_tck, self._page_mb
+        for entry in os.scandir("/proc"):
+            if not entry.name.isdigit():
+                continue
+            stat = _read_proc(f"/proc/{entry.name}/stat")
+            statm = _read_proc(f"/proc/{entry.name}/statm")
+            if not stat or not statm:
+                continue  # exited mid-scan
+            # "pid (comm) state ppid ..."; comm may itself contain spaces or ')'
+            lpar, rpar = stat.find(b"("), stat.rfind(b")")
+            fields = stat[rpar + 2 :].split()
+            try:
+                utime, stime, start = int(fields[11]), int(fields[12]), int(fields[19])
+                rss_pages = int(statm.split()[1])
+                ppid = int(fields[1])
+            except (IndexError, ValueError):
+                continue
+            comm = stat[lpar + 1 : rpar].decode("utf-8", "replace")
+            yield int(entry.name), ppid, start, (utime + stime) / clk_tck, rss_pages * page_mb, comm
+
+    def _scan_psutil(self):
+        """Same rows via psutil, reusing one Process handle per live process."""
+        for pid in psutil.pids():
+            known = self._known.get(pid)
+            try:
+                p = known[4] if known and known[4].is_running() else psutil.Process(pid)
+                with p.oneshot():
+                    create_time = p.create_time()
+                    times = p.cpu_times()
+                    rss_mb = p.memory_info().rss / (1024 * 1024)
+                    ppid = p.ppid()
+            except (psutil.NoSuchProcess, psutil.AccessDenied):
+                continue
+            yield pid, ppid, create_time, times.user + times.system, rss_mb, p
+
+
+def _read_proc(path):
+    try:
+        fd = os.open(path, os.O_RDONLY)
+    except OSError:
+        return None
+    try:
+        return os.read(fd, 65536)
+    except OSError:
+        return None
+    finally:
+        os.close(fd)
+
+def encode_columnar(payload, compression="gzip"):
+    """
+    Encode an ingest payload into the backend's columnar wire format.
+    Returns (body bytes, extra request headers).
+    """
+    header = {k: v for k, v in payload.items() if k not in ("processes", "delta")}
+    if "delta" in payload:
+        procs = payload["delta"]["added"] + payload["delta"]["changed"]
+        header["added"] = len(payload["delta"]["added"])
+        header["removed"] = payload["delta"]["removed"]
+    else:
+        procs = payload["processes"]
+
+    n = len(procs)
+    name_ids = {}
+    layout = f"<{n}i{n}i{n}I{n}d{n}d"
+    columns = [p["pid"] for p in procs] + [p["ppid"] for p in procs]
+    columns += [name_ids.setdefault(p["name"], len(name_ids)) for p in procs]
+    columns += [float(p["cpu_percent"]) for p in procs] + [float(p["memory_mb"]) for p in procs]
+    if any("cmdline" in p for p in procs):
+        cmd_ids = {}
+        columns += [cmd_ids.setdefault(p.get("cmdline") or "", len(cmd_ids)) for p in procs]
+        header["cmdlines"] = list(cmd_ids)
+        layout += f"{n}I"
+    if any(p.get("started") is not None for p in procs):
+        # -1: start time unknown
+        columns += [p["started"] if p.get("started") is not None else -1 for p in procs]
+        header["started"] = True
+        layout += f"{n}q"
+    header["count"] = n
+    header["names"] = list(name_ids)
+
+    head = json.dumps(header, separators=(",", ":")).encode("utf-8")
+    raw = struct.pack("<4sBI", b"MCOL", 1, len(head)) + head + struct.pack(layout, *columns)
+
+    headers = {"Content-Type": COLUMNAR_MEDIA_TYPE}
+    if compression == "zstd" and zstandard is not None:
+        raw = zstandard.ZstdCompressor(level=3).compress(raw)
+        headers["Content-Encoding"] = "zstd"
+    elif compression in ("gzip", "zstd"):
+        raw = gzip.compress(raw, compresslevel=6)
+        headers["Content-Encoding"] = "gzip"
+    return raw, headers
+
+
+class DeltaEncoder:
+    """
+    Tracks the last snapshot the backend acknowledged and encodes each new
+    process list as a delta against it. A keyframe (full list) is sent on the
+    first tick, every `keyframe_every` ticks, and whenever reset() is called.
+
+    Deltas only ever reference an acknowledged snapshot, so several can be in
+    flight at once. Acks may then arrive out of order; an ack for a tick older
+    than the current base is ignored.
+    """
+
+    def __init__(self, keyframe_every: int = 30):
+        self.keyframe_every = max(1, int(keyframe_every))
+        self.reset()
+
+    def reset(self):
+        self.base_seq = -1
+        self.base_captured_at = None
+        self.base = {}
+        self.since_keyframe = 0
+
+    def encode(self, processes):
+        if self.base_captured_at is None or self.since_keyframe >= self.keyframe_every:
+            return {"processes": processes}
+
+        current = {p["pid"]: p for p in processes}
+        added, changed = [], []
+        for pid, p in current.items():
+            prev = self.base.get(pid)
+            if prev is None:
+                added.append(p)
+            elif prev != p:
+                changed.append(p)
+        removed = [pid for pid in self.base if pid not in current]
+        return {
+            "base_captured_at": self.base_captured_at,
+            "delta": {"added": added, "changed": changed, "removed": removed},
+        }
+
+    def ack(self, seq, captured_at, body, processes):
+        if seq < self.base_seq:
+            return
+        self.since_keyframe = 0 if "processes" in body else self.since_keyframe + 1
+        self.base_seq = seq
+        self.base_captured_at = captured_at
+        self.base = {p["pid"]: p for p in processes}
+
+
+class Telemetry:
+    """
+    The agent's own cost: per-stage timings (collect, serialize, post), payload
+    bytes, error and spool counters, and the agent process's CPU and memory
+    use. Shared by the collector and shipper threads. snapshot() goes out with
+    every tick as `agent`; prometheus() backs the local metrics endpoint.
+    """
+
+    STAGES = ("collect", "serialize", "post")
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._stages = {stage: [0, 0.0, 0.0] for stage in self.STAGES}  # count, total seconds, last seconds
+        self._counters = {"posts": 0, "payload_bytes": 0, "errors": 0, "spooled": 0, "spool_dropped": 0, "skipped_ticks": 0}
+        self._gauges = {}
+        self._process = psutil.Process()
+        self._cpu_sample = None
+
+    def observe(self, stage, seconds):
+        with self._lock:
+            stats = self._stages[stage]
+            stats[0] += 1
+            stats[1] += seconds
+            stats[2] = seconds
+
+    def count(self, name, n=1):
+        with self._lock:
+            self._counters[name] += n
+
+    def set(self, **gauges):
+        with self._lock:
+            self._gauges.update(gauges)
+
+    def sample_process(self):
+        """Agent CPU % of one core (all threads) since the previous call, or None on the first. Call once per tick."""
+        now = time.monotonic()
+        times = self._process.cpu_times()
+        cpu_time = times.user + times.system
+        percent = None
+        if self._cpu_sample is not None and now > self._cpu_sample[0]:
+            percent = round((cpu_time - self._cpu_sample[1]) / (now - self._cpu_sample[0]) * 100, 1)
+        self._cpu_sample = (now, cpu_time)
+        self.set(cpu_percent=percent, rss_mb=round(self._process.memory_info().rss / (1024 * 1024), 1))
+        return percent
+
+    def snapshot(self):
+        with self._lock:
+            out = {}
+            for stage, (n, total, last) in self._stages.items():
+                out[f"{stage}_ms"] = round(last * 1000, 2)
+                out[f"{stage}_ms_avg"] = round(total / n * 1000, 2) if n else None
+            out.update(self._counters)
+            out.update(self._gauges)
+            return out
+
+    def prometheus(self):
+        with self._lock:
+            lines = []
+            for stage, (n, total, last) in self._stages.items():
+                lines.append(f'monitor_agent_stage_seconds_total{{stage="{stage}"}} {total}')
+                lines.append(f'monitor_agent_stage_runs_total{{stage="{stage}"}} {n}')
+                lines.append(f'monitor_agent_stage_last_seconds{{stage="{stage}"}} {last}')
+            lines += [f"monitor_agent_{name}_total {value}" for name, value in self._counters.items()]
+            for name, value in self._gauges.items():
+                if isinstance(value, (int, float)):  # bools included
+                    lines.append(f"monitor_agent_{name} {float(value)}")
+            return "\n".join(lines) + "\n"
+
+
+def serve_metrics(telemetry, address):
+    """Serve telemetry.prometheus() at http://<address>/metrics from a daemon thread."""
+    host, _, port = address.rpartition(":")
+
+    class Handler(http.server.BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = telemetry.prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = http.server.ThreadingHTTPServer((host or "127.0.0.1", int(port)), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="metrics", daemon=True).start()
+    return server
+
+
+class Governor:
+    """
+    Keeps the agent's own CPU use under `budget` percent of one core. While the
+    smoothed usage is over budget it sheds work one step at a time: stop
+    reading command lines, keep only the top `top_n` processes, then double
+    the interval up to `max_interval`. Once usage is below half the budget it
+    gives the steps back in reverse order. After every change it waits
+    `settle` ticks before judging again, so one slow tick does not flap it.
+    """
+
+    def __init__(self, budget, collector, ticker, top_n=200, max_interval=30, settle=5, alpha=0.3):
+        self.budget = budget
+        self.collector = collector
+        self.ticker = ticker
+        self.settle = settle
+        self.alpha = alpha
+        include_cmdline, limit, interval = collector.include_cmdline, collector.top_n, ticker.interval
+        self.steps = [(include_cmdline, limit, interval)]
+        if include_cmdline:
+            include_cmdline = False
+            self.steps.append((include_cmdline, limit, interval))
+        if not limit or limit > top_n:
+            limit = top_n
+            self.steps.append((include_cmdline, limit, interval))
+        while interval * 2 <= max_interval:
+            interval *= 2
+            self.steps.append((include_cmdline, limit, interval))
+        self.level = 0
+        self.smoothed = None
+        self.wait = settle
+
+    def update(self, cpu_percent):
+        """Feed one tick's agent CPU %. Returns a description of the change made, or None."""
+        if cpu_percent is None:
+            return None
+        if self.smoothed is None:
+            self.smoothed = cpu_percent
+        else:
+            self.smoothed = self.alpha * cpu_percent + (1 - self.alpha) * self.smoothed
+        if self.wait > 0:
+            self.wait -= 1
+            return None
+        if self.smoothed > self.budget and self.level < len(self.steps) - 1:
+            self.level += 1
+            verb = "over"
+        elif self.smoothed < self.budget / 2 and self.level > 0:
+            self.level -= 1
+            verb = "under"
+        else:
+            return None
+        usage = self.smoothed
+        self._apply()
+        return f"{usage:.1f}% CPU is {verb} the {self.budget}% budget; now {self.state()}"
+
+    def _apply(self):
+        include_cmdline, limit, interval = self.steps[self.level]
+        self.collector.set_include_cmdline(include_cmdline)
+        self.collector.top_n = limit
+        self.ticker.interval = interval
+        self.smoothed = None
+        self.wait = self.settle
+
+    def state(self):
+        return {
+            "governor_level": self.level,
+            "interval_sec": self.ticker.interval,
+            "top_n_processes": self.collector.top_n,
+            "include_cmdline": self.collector.include_cmdline,
+        }
+
+
+class Ticker:
+    """
+    Fixed-rate schedule on the monotonic clock: tick k is due at start + k *
+    interval, so the time spent collecting never accumulates as drift and
+    wall-clock adjustments do not move it. Ticks missed while the process was
+    stalled are skipped rather than run back to back.
+    """
+
+    def __init__(self, interval: float, clock=time.monotonic):
+        self.interval = interval
+        self.clock = clock
+        self.due = clock()
+
+    def wait(self, stop: threading.Event):
+        """Sleep until the next tick. Returns how many ticks were skipped, or None once `stop` is set."""
+        now = self.clock()
+        skipped = 0
+        if now >= self.due + self.interval:
+            skipped = int((now - self.due) // self.interval)
+            self.due += skipped * self.interval
+        if stop.wait(max(0.0, self.due - now)):
+            return None
+        self.due += self.interval
+        return skipped
+
+
+class Backoff:
+    """
+    Exponential backoff with full jitter: after the n-th consecutive failure the
+    next attempt waits a random time in [0, min(cap, base * 2**n)], or at least
+    the server's Retry-After. Randomizing spreads a fleet's reconnects after a
+    backend restart instead of having every agent retry in lockstep.
+    """
+
+    def __init__(self, base: float = 1.0, cap: float = 60.0):
+        self.base = base
+        self.cap = cap
+        self.failures = 0
+        self.next_attempt = 0.0
+
+    def ready(self):
+        return time.monotonic() >= self.next_attempt
+
+    def failure(self, retry_after: float | None = None):
+        self.failures += 1
+        delay = random.uniform(0, min(self.cap, self.base * 2 ** self.failures))
+        if retry_after:
+            delay = max(delay, retry_after)
+        self.next_attempt = time.monotonic() + delay
+        return delay
+
+    def success(self):
+        self.failures = 0
+        self.next_attempt = 0.0
+
+
+class Spool:
+    """
+    Bounded on-disk buffer of snapshot payloads.
+
+    Payloads are appended as JSON lines to numbered segment files; the newest
+    segment is rolled once it reaches `segment_bytes`, and the oldest segments
+    are deleted once the spool exceeds `max_bytes`. peek()/commit() consume from
+    the oldest segment; a segment is removed when fully delivered. After a
+    restart a partly delivered segment is sent again from the start, which the
+    bulk endpoint de-duplicates by hostname and captured_at. Safe to share
+    between the collector and the shipper threads.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, segment_bytes: int | None = None):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.segment_bytes = segment_bytes or max(64 * 1024, max_bytes // 16)
+        self.dropped = 0
+        self._offset = 0  # lines of the oldest segment already delivered
+        self._peeked = 0
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+
+    def _segments(self):
+        names = sorted(n for n in os.listdir(self.directory) if n.startswith("segment-") and n.endswith(".jsonl"))
+        return [os.path.join(self.directory, n) for n in names]
+
+    def __bool__(self):
+        with self._lock:
+            return bool(self._segments())
+
+    def append(self, doc):
+        line = json.dumps(doc, separators=(",", ":"), default=str).encode("utf-8") + b"\n"
+        with self._lock:
+            self._append(line)
+
+    def _append(self, line):
+        segments = self._segments()
+        if segments and os.path.getsize(segments[-1]) + len(line) <= self.segment_bytes:
+            path = segments[-1]
+        else:
+            seq = int(os.path.basename(segments[-1])[8:-6]) + 1 if segments else 0
+            path = os.path.join(self.directory, f"segment-{seq:010d}.jsonl")
+            segments.append(path)
+        with open(path, "ab") as f:
+            f.write(line)
+
+        # Over budget: drop whole segments, oldest first (never the one just written)
+        total = sum(os.path.getsize(p) for p in segments)
+        while total > self.max_bytes and len(segments) > 1:
+            oldest = segments.pop(0)
+            total -= os.path.getsize(oldest)
+            with open(oldest, "rb") as f:
+                self.dropped += max(0, sum(1 for _ in f) - self._offset)
+            os.remove(oldest)
+            self._offset = self._peeked = 0
+
+    def peek(self, n: int):
+        """Up to `n` undelivered payloads from the oldest segment."""
+        with self._lock:
+            segments = self._segments()
+            if not segments:
+                return []
+            with open(segments[0], "rb") as f:
+                lines = f.read().splitlines()[self._offset : self._offset + n]
+            self._peeked = len(lines)
+        docs = []
+        for line in lines:
+            try:
+                docs.append(json.loads(line))
+            except ValueError:
+                continue  # torn write from a crash
+        return docs
+
+    def commit(self):
+        """Mark the payloads returned by the last peek() as delivered."""
+        with self._lock:
+            segments = self._segments()
+            if not segments:
+                return
+            self._offset += self._peeked
+            self._peeked = 0
+            with open(segments[0], "rb") as f:
+                remaining = sum(1 for _ in f) - self._offset
+            if remaining <= 0:
+                os.remove(segments[0])
+                self._offset = 0
+
+
+def _retry_after(response):
+    try:
+        return float(response.headers.get("Retry-After", ""))
+    except ValueError:
+        return None
+
+
+def _transient(response):
+    """Server-side trouble worth retrying later (as opposed to a payload the backend rejects)."""
+    return response.status_code == 429 or response.status_code >= 500
+
 
 def main():
-    import time
+    """
+    Two stages joined by a bounded queue. The collector (main thread) samples
+    on a fixed monotonic schedule and never touches the network. `max_in_flight`
+    shipper threads take ticks off the queue and post them. When the backend
+    is slow or down, ticks pile up in the queue and then overflow to the spool,
+    so sample timing does not depend on network latency.
+
+    Each tick carries the agent's own telemetry (`agent`), and the optional
+    governor trades detail for CPU when the agent goes over its budget.
+    """
     config = load_config()
     backend_url = config["backend_url"]
+    batch_url = config.get("batch_url") or backend_url.rstrip("/") + "/batch"
     api_key = config["api_key"]
     interval = max(1, int(config.get("interval_sec", 2)))
-    sample_sleep_ms = int(config.get("sample_sleep_ms", 200))
-    include_cmdline = bool(config.get("include_cmdline", False))
-    top_n = config.get("top_n_processes")
+    collector = ProcessCollector(
+        include_cmdline=bool(config.get("include_cmdline", False)),
+        top_n=config.get("top_n_processes"),
+        procfs=None if config.get("procfs_fast_path", True) else False,
+    )
+    encoder = DeltaEncoder(config.get("keyframe_every", 30)) if config.get("delta_mode") else None
+    columnar = config.get("wire_format") == "columnar"
+    compression = config.get("compression")
+    spool = Spool(config["spool_dir"], int(config.get("spool_max_mb", 64) * 1024 * 1024))
+    spool_batch_size = int(config.get("spool_batch_size", 100))
+    spool_batches_per_tick = int(config.get("spool_batches_per_tick", 5))
+    backoff = Backoff(cap=float(config.get("backoff_max_sec", 60)))
+    in_flight = max(1, int(config.get("max_in_flight", 2)))
+    outbox = queue.Queue(maxsize=max(1, int(config.get("send_queue_size", 10))))
+    telemetry = Telemetry()
+    ticker = Ticker(interval)
+    governor = None
+    if config.get("cpu_budget_percent"):
+        governor = Governor(
+            float(config["cpu_budget_percent"]), collector, ticker,
+            top_n=int(config.get("governor_top_n", 200)),
+            max_interval=max(interval, int(config.get("governor_max_interval_sec", 30))),
+        )
 
-    headers = {"X-API-KEY": api_key}
     hostname = socket.gethostname()
+    # encoder, backoff and the acknowledged inventory hash are shared by the shipper threads
+    state_lock = threading.Lock()
+    draining = threading.Lock()
+    local = threading.local()
+    stop = threading.Event()
 
-    print(f"Agent started for {hostname}. Posting every {interval}s to {backend_url}.")
+    def session():
+        # One keep-alive connection per shipper thread, reused across ticks
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+            local.session.headers["X-API-KEY"] = api_key
+            local.session.mount("http://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=2))
+            local.session.mount("https://", requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=2))
+        return local.session
+
+    def post(doc):
+        started = time.perf_counter()
+        if columnar:
+            data, extra = encode_columnar(doc, compression)
+        else:
+            data, extra = json.dumps(doc).encode("utf-8"), {"Content-Type": "application/json"}
+        sent = time.perf_counter()
+        telemetry.observe("serialize", sent - started)
+        telemetry.count("posts")
+        telemetry.count("payload_bytes", len(data))
+        try:
+            return session().post(backend_url, data=data, headers=extra, timeout=10)
+        finally:
+            telemetry.observe("post", time.perf_counter() - sent)
+
+    # Inventory hash the backend has acknowledged; until then the full inventory goes along
+    acked_inventory = None
+
+    def send(seq, payload, processes, inventory):
+        """Post one tick. Returns False when the backend is unreachable or overloaded."""
+        nonlocal acked_inventory
+        with state_lock:
+            static = {} if payload["inventory_hash"] == acked_inventory else {"inventory": inventory}
+            body = encoder.encode(processes) if encoder else {"processes": processes}
+        r = post({**payload, **static, **body})
+        if r.status_code == 409 and r.json().get("inventory_required"):
+            # Backend does not know our inventory version (e.g. its database was reset)
+            static = {"inventory": inventory}
+            r = post({**payload, **static, **body})
+        if r.status_code == 409 and encoder and r.json().get("keyframe_required"):
+            # Backend lost our base snapshot: resend this tick as a keyframe
+            with state_lock:
+                encoder.reset()
+                body = encoder.encode(processes)
+            r = post({**payload, **static, **body})
+        if _transient(r):
+            telemetry.count("errors")
+            with state_lock:
+                backoff.failure(_retry_after(r))
+            return False
+        r.raise_for_status()
+        result = r.json()
+        with state_lock:
+            acked_inventory = payload["inventory_hash"]
+            if encoder:
+                encoder.ack(seq, payload["captured_at"], body, processes)
+                if result.get("keyframe_required"):
+                    encoder.reset()
+        kind = "keyframe" if "processes" in body else "delta"
+        print(f"Sent {len(processes)} processes ({kind}). Snapshot ID: {result.get('snapshot_id', 'queued')}")
+        return True
+
+    def drain_spool():
+        for _ in range(spool_batches_per_tick):
+            docs = spool.peek(spool_batch_size)
+            if not docs:
+                spool.commit()  # skip over a segment of unreadable lines
+                if not spool:
+                    return
+                continue
+            r = session().post(batch_url, json={"snapshots": docs}, timeout=30)
+            if _transient(r):
+                with state_lock:
+                    backoff.failure(_retry_after(r))
+                return
+            if r.status_code >= 400:
+                # The backend refuses the batch as a whole: resending it would fail forever
+                # and hold back everything spooled after it
+                print(f"Backend rejected a batch of {len(docs)} spooled snapshots "
+                      f"({r.status_code}): {r.text[:200]}")
+                telemetry.count("errors")
+                telemetry.count("spool_dropped", len(docs))
+                spool.commit()
+                continue
+            rejected = [item for item in r.json()["results"] if item["status"] >= 400]
+            if rejected:
+                print(f"Backend rejected {len(rejected)} spooled snapshots: {rejected[0]}")
+            spool.commit()
+            print(f"Replayed {len(docs)} spooled snapshots.")
+
+    def spool_tick(payload, processes, inventory):
+        # Spooled snapshots are always keyframes with the full inventory: a delta's base
+        # (or the inventory version) may be gone by replay time
+        spool.append({**payload, "inventory": inventory, "processes": processes})
+        telemetry.count("spooled")
+        if spool.dropped:
+            print(f"Spool full: dropped {spool.dropped} oldest snapshots.")
+            telemetry.count("spool_dropped", spool.dropped)
+            spool.dropped = 0
+
+    def ship():
+        while True:
+            item = outbox.get()
+            if item is None:
+                return
+            seq, payload, processes, inventory = item
+            with state_lock:
+                ready = backoff.ready()
+            sent = False
+            if ready:
+                try:
+                    sent = send(seq, payload, processes, inventory)
+                    if sent:
+                        with state_lock:
+                            backoff.success()
+                        # One shipper replays the spool; the others keep sending live ticks
+                        if spool and draining.acquire(blocking=False):
+                            try:
+                                drain_spool()
+                            finally:
+                                draining.release()
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    print("Backend unreachable:", e)
+                    telemetry.count("errors")
+                    with state_lock:
+                        backoff.failure()
+                except Exception as e:
+                    # Rejected payload: retrying the same data will not help
+                    print("Error sending data:", e)
+                    telemetry.count("errors")
+                    sent = True
+            if not sent:
+                spool_tick(payload, processes, inventory)
+
+    shippers = [threading.Thread(target=ship, name=f"shipper-{i}", daemon=True) for i in range(in_flight)]
+    for t in shippers:
+        t.start()
+
+    if config.get("metrics_addr"):
+        try:
+            serve_metrics(telemetry, config["metrics_addr"])
+        except OSError as e:
+            print(f"Metrics endpoint disabled ({config['metrics_addr']}): {e}")
+
+    print(f"Agent started for {hostname}. Posting every {interval}s to {backend_url} ({in_flight} in flight).")
+    seq = 0
     try:
         while True:
-            t0 = time.time()
+            skipped = ticker.wait(stop)
+            if skipped is None:
+                break
+            if skipped:
+                print(f"Collection fell behind: skipped {skipped} ticks.")
+                telemetry.count("skipped_ticks", skipped)
+            captured_at = datetime.now(timezone.utc).isoformat()
+            started = time.perf_counter()
+            inventory = collect_inventory()
             payload = {
                 "hostname": hostname,
-                "captured_at": datetime.now(timezone.utc).isoformat(),
+                "captured_at": captured_at,
                 "system_info": collect_system_info(),
-                "processes": collect_processes(include_cmdline=include_cmdline, sample_sleep_ms=sample_sleep_ms, top_n=top_n),
+                "inventory_hash": inventory_digest(inventory),
             }
+            processes = collector.collect()
+            telemetry.observe("collect", time.perf_counter() - started)
+
+            cpu_percent = telemetry.sample_process()
+            if governor:
+                change = governor.update(cpu_percent)
+                if change:
+                    print(f"Governor: {change}")
+                telemetry.set(**governor.state())
+            telemetry.set(processes=len(processes), queue_depth=outbox.qsize())
+            payload["agent"] = telemetry.snapshot()
             try:
-                r = requests.post(backend_url, json=payload, headers=headers, timeout=10)
-                r.raise_for_status()
-                print(f"Sent {len(payload['processes'])} processes. Snapshot ID: {r.json().get('snapshot_id')}")
-            except Exception as e:
-                print("Error sending data:", e)
-
-            # Sleep remaining time in the interval
-            dt = time.time() - t0
-            time.sleep(max(0, interval - dt))
+                outbox.put_nowait((seq, payload, processes, inventory))
+            except queue.Full:
+                # Every shipper is stuck on a slow backend: keep the sample, do not wait
+                spool_tick(payload, processes, inventory)
+            seq += 1
     except KeyboardInterrupt:
-        print("Agent stopped.")
+        pass
+    stop.set()
+    # Ticks still queued are spooled for the next run rather than lost
+    while True:
+        try:
+            item = outbox.get_nowait()
+        except queue.Empty:
+            break
+        if item is not None:
+            spool_tick(*item[1:])
+    for _ in shippers:
+        outbox.put(None)
+    for t in shippers:
+        t.join(timeout=10)
+    print("Agent stopped.")
 
 if __name__ == "__main__":
     main()
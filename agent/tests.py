@@ -0,0 +1,315 @@
+import os
+import shutil
+import tempfile
+import unittest
+from types import SimpleNamespace
+from unittest import mock
+
+import psutil
+
+import agent
+from agent import Backoff, DeltaEncoder, Governor, ProcessCollector, Spool, Ticker
+
+
+def procs(*pids, cpu=0.0):
+    return [{"pid": pid, "ppid": 1, "name": f"p{pid}", "cpu_percent": cpu, "memory_mb": 1.0} for pid in pids]
+
+
+class SpoolTests(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.dir)
+
+    def test_append_peek_commit(self):
+        spool = Spool(self.dir, max_bytes=1 << 20)
+        self.assertFalse(spool)
+        for i in range(5):
+            spool.append({"n": i})
+        self.assertTrue(spool)
+        self.assertEqual(spool.peek(3), [{"n": 0}, {"n": 1}, {"n": 2}])
+        # Not committed: the same payloads come back
+        self.assertEqual(spool.peek(3), [{"n": 0}, {"n": 1}, {"n": 2}])
+        spool.commit()
+        self.assertEqual(spool.peek(3), [{"n": 3}, {"n": 4}])
+        spool.commit()
+        self.assertFalse(spool)
+        self.assertEqual(spool.peek(3), [])
+
+    def test_reads_segments_oldest_first(self):
+        spool = Spool(self.dir, max_bytes=1 << 20, segment_bytes=20)
+        for i in range(4):
+            spool.append({"n": i})
+        self.assertGreater(len(os.listdir(self.dir)), 1)
+        seen = []
+        while spool:
+            seen += [d["n"] for d in spool.peek(10)]
+            spool.commit()
+        self.assertEqual(seen, [0, 1, 2, 3])
+
+    def test_drops_oldest_segments_when_full(self):
+        spool = Spool(self.dir, max_bytes=60, segment_bytes=20)
+        for i in range(10):
+            spool.append({"n": i})
+        self.assertGreater(spool.dropped, 0)
+        docs = []
+        while spool:
+            docs += [d["n"] for d in spool.peek(10)]
+            spool.commit()
+        self.assertEqual(docs[-1], 9)  # the newest is always kept
+        self.assertEqual(docs, list(range(spool.dropped, 10)))
+
+    def test_skips_torn_lines(self):
+        spool = Spool(self.dir, max_bytes=1 << 20)
+        spool.append({"n": 0})
+        with open(os.path.join(self.dir, os.listdir(self.dir)[0]), "ab") as f:
+            f.write(b'{"n": 1\n')
+        spool.append({"n": 2})
+        self.assertEqual(spool.peek(10), [{"n": 0}, {"n": 2}])
+
+
+class BackoffTests(unittest.TestCase):
+    def test_delay_grows_within_the_cap_and_resets(self):
+        backoff = Backoff(base=1.0, cap=5.0)
+        with mock.patch.object(agent.random, "uniform", side_effect=lambda a, b: b):
+            self.assertEqual([backoff.failure() for _ in range(4)], [2.0, 4.0, 5.0, 5.0])
+        self.assertFalse(backoff.ready())
+        backoff.success()
+        self.assertEqual(backoff.failures, 0)
+        self.assertTrue(backoff.ready())
+
+    def test_retry_after_is_a_lower_bound(self):
+        backoff = Backoff(base=1.0, cap=5.0)
+        with mock.patch.object(agent.random, "uniform", return_value=0.5):
+            self.assertEqual(backoff.failure(retry_after=30.0), 30.0)
+            self.assertEqual(backoff.failure(retry_after=None), 0.5)
+
+    def test_retry_after_header(self):
+        response = SimpleNamespace(headers={"Retry-After": "12"}, status_code=429)
+        self.assertEqual(agent._retry_after(response), 12.0)
+        response.headers = {"Retry-After": "Wed, 21 Oct 2015 07:28:00 GMT"}
+        self.assertIsNone(agent._retry_after(response))
+        response.headers = {}
+        self.assertIsNone(agent._retry_after(response))
+
+    def test_only_429_and_5xx_are_transient(self):
+        self.assertEqual(
+            [agent._transient(SimpleNamespace(status_code=s)) for s in (200, 400, 409, 413, 429, 500, 503)],
+            [False, False, False, False, True, True, True],
+        )
+
+
+class DeltaEncoderTests(unittest.TestCase):
+    def test_keyframe_then_deltas_against_the_acked_base(self):
+        encoder = DeltaEncoder(keyframe_every=30)
+        first = procs(1, 2, 3)
+        body = encoder.encode(first)
+        self.assertEqual(body, {"processes": first})
+        encoder.ack(0, "t0", body, first)
+
+        second = procs(1, 3, 4)
+        second[0]["cpu_percent"] = 50.0
+        body = encoder.encode(second)
+        self.assertEqual(body["base_captured_at"], "t0")
+        self.assertEqual(body["delta"], {"added": [second[2]], "changed": [second[0]], "removed": [2]})
+
+    def test_reset_after_409_sends_a_keyframe(self):
+        encoder = DeltaEncoder()
+        encoder.ack(0, "t0", {"processes": procs(1)}, procs(1))
+        self.assertIn("delta", encoder.encode(procs(1, 2)))
+        # The backend answered keyframe_required: the next body is a full list
+        encoder.reset()
+        self.assertEqual(encoder.encode(procs(1, 2)), {"processes": procs(1, 2)})
+
+    def test_keyframe_every_n_acked_deltas(self):
+        encoder = DeltaEncoder(keyframe_every=2)
+        kinds = []
+        for seq in range(5):
+            body = encoder.encode(procs(1))
+            kinds.append("keyframe" if "processes" in body else "delta")
+            encoder.ack(seq, f"t{seq}", body, procs(1))
+        self.assertEqual(kinds, ["keyframe", "delta", "delta", "keyframe", "delta"])
+
+    def test_stale_ack_is_ignored(self):
+        encoder = DeltaEncoder()
+        encoder.ack(2, "t2", {"processes": procs(1)}, procs(1))
+        encoder.ack(1, "t1", {"processes": procs(9)}, procs(9))
+        self.assertEqual(encoder.encode(procs(1))["base_captured_at"], "t2")
+
+
+class FakeClock:
+    def __init__(self, now=100.0):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+class FakeStop:
+    """threading.Event stand-in whose wait() advances the fake clock instead of sleeping."""
+
+    def __init__(self, clock):
+        self.clock = clock
+        self.waits = []
+        self.stopped = False
+
+    def wait(self, timeout):
+        self.waits.append(timeout)
+        self.clock.now += timeout
+        return self.stopped
+
+
+class TickerTests(unittest.TestCase):
+    def test_fixed_rate_without_drift(self):
+        clock = FakeClock()
+        ticker = Ticker(2.0, clock=clock)
+        stop = FakeStop(clock)
+        self.assertEqual(ticker.wait(stop), 0)
+        clock.now += 0.5  # collection time is absorbed by the next wait
+        self.assertEqual(ticker.wait(stop), 0)
+        self.assertEqual(stop.waits, [0.0, 1.5])
+        self.assertEqual(clock.now, 102.0)
+
+    def test_skips_missed_ticks(self):
+        clock = FakeClock()
+        ticker = Ticker(2.0, clock=clock)
+        stop = FakeStop(clock)
+        ticker.wait(stop)
+        clock.now += 7.0  # stalled past the ticks due at 102, 104 and 106
+        # 102 and 104 are skipped; 106 runs at once and the schedule stays on even seconds
+        self.assertEqual(ticker.wait(stop), 2)
+        self.assertEqual(stop.waits[-1], 0.0)
+        self.assertEqual(ticker.wait(stop), 0)
+        self.assertEqual(clock.now, 108.0)
+
+    def test_returns_none_once_stopped(self):
+        clock = FakeClock()
+        stop = FakeStop(clock)
+        stop.stopped = True
+        self.assertIsNone(Ticker(2.0, clock=clock).wait(stop))
+
+
+class GovernorTests(unittest.TestCase):
+    def setUp(self):
+        self.collector = ProcessCollector(include_cmdline=True, procfs=False)
+        self.ticker = SimpleNamespace(interval=2)
+        self.governor = Governor(5.0, self.collector, self.ticker, top_n=200, max_interval=8, settle=0, alpha=1.0)
+
+    def test_sheds_work_step_by_step_over_budget(self):
+        self.assertIsNotNone(self.governor.update(20.0))
+        self.assertEqual((self.collector.include_cmdline, self.collector.top_n, self.ticker.interval), (False, None, 2))
+        self.governor.update(20.0)
+        self.assertEqual((self.collector.top_n, self.ticker.interval), (200, 2))
+        self.governor.update(20.0)
+        self.governor.update(20.0)
+        self.assertEqual(self.ticker.interval, 8)
+        self.assertIsNone(self.governor.update(20.0))  # nothing left to shed
+        self.assertEqual(self.governor.state()["governor_level"], 4)
+
+    def test_gives_steps_back_under_half_the_budget(self):
+        for _ in range(4):
+            self.governor.update(20.0)
+        self.assertIsNone(self.governor.update(3.0))  # between half and full budget: hold
+        for _ in range(4):
+            self.assertIsNotNone(self.governor.update(1.0))
+        self.assertEqual((self.collector.include_cmdline, self.collector.top_n, self.ticker.interval), (True, None, 2))
+
+    def test_waits_settle_ticks_after_a_change(self):
+        governor = Governor(5.0, self.collector, self.ticker, top_n=200, max_interval=8, settle=2, alpha=1.0)
+        self.assertEqual([governor.update(20.0) is not None for _ in range(6)], [False, False, True, False, False, True])
+        self.assertIsNone(governor.update(None))
+
+
+class FakeProcess:
+    def __init__(self, pid, cpu=1.0, create_time=1000.0, error_on=None):
+        self.pid, self.cpu, self._create_time, self.error_on = pid, cpu, create_time, error_on
+
+    def _check(self, call):
+        if self.error_on == call:
+            raise psutil.NoSuchProcess(self.pid)
+
+    def oneshot(self):
+        return mock.MagicMock()
+
+    def is_running(self):
+        return True
+
+    def create_time(self):
+        self._check("create_time")
+        return self._create_time
+
+    def cpu_times(self):
+        return SimpleNamespace(user=self.cpu, system=0.0)
+
+    def memory_info(self):
+        return SimpleNamespace(rss=10 * 1024 * 1024)
+
+    def ppid(self):
+        return 1
+
+    def name(self):
+        return f"proc{self.pid}"
+
+    def cmdline(self):
+        return [f"/bin/proc{self.pid}", "--flag"]
+
+
+class ProcessCollectorTests(unittest.TestCase):
+    def collect(self, collector, table, now):
+        with mock.patch.object(agent.psutil, "pids", return_value=list(table)), \
+                mock.patch.object(agent.psutil, "Process", side_effect=lambda pid: table[pid]), \
+                mock.patch.object(agent.time, "monotonic", return_value=now):
+            return {p["pid"]: p for p in collector.collect()}
+
+    def test_cpu_percent_from_cpu_time_deltas(self):
+        collector = ProcessCollector(include_cmdline=True, procfs=False)
+        table = {10: FakeProcess(10, cpu=1.0)}
+        first = self.collect(collector, table, now=50.0)
+        self.assertEqual(first[10], {
+            "pid": 10, "ppid": 1, "name": "proc10", "cpu_percent": 0.0, "memory_mb": 10.0,
+            "started": 1000, "cmdline": "/bin/proc10 --flag",
+        })
+        table[10].cpu = 2.0  # one CPU second over two wall seconds
+        self.assertEqual(self.collect(collector, table, now=52.0)[10]["cpu_percent"], 50.0)
+
+    def test_reused_pid_starts_fresh(self):
+        collector = ProcessCollector(procfs=False)
+        self.collect(collector, {10: FakeProcess(10, cpu=1.0)}, now=50.0)
+        reused = {10: FakeProcess(10, cpu=5.0, create_time=2000.0)}
+        collector._known[10][4] = reused[10]
+        second = self.collect(collector, reused, now=52.0)[10]
+        self.assertEqual((second["cpu_percent"], second["started"]), (0.0, 2000))
+
+    def test_process_exiting_mid_scan_is_skipped(self):
+        collector = ProcessCollector(procfs=False)
+        table = {10: FakeProcess(10), 11: FakeProcess(11, error_on="create_time")}
+        self.assertEqual(list(self.collect(collector, table, now=50.0)), [10])
+
+    def test_hidden_cmdline_keeps_the_name(self):
+        collector = ProcessCollector(include_cmdline=True, procfs=False)
+        table = {10: FakeProcess(10)}
+
+        def denied():
+            raise psutil.AccessDenied(10)
+        table[10].cmdline = denied
+        self.assertEqual(self.collect(collector, table, now=50.0)[10]["name"], "proc10")
+        self.assertEqual(collector._known[10][2:4], ["proc10", ""])
+
+    def test_top_n_keeps_the_largest(self):
+        collector = ProcessCollector(top_n=1, procfs=False)
+        table = {10: FakeProcess(10), 11: FakeProcess(11)}
+        table[11].memory_info = lambda: SimpleNamespace(rss=50 * 1024 * 1024)
+        self.assertEqual(list(self.collect(collector, table, now=50.0)), [11])
+
+    @unittest.skipUnless(os.path.exists("/proc/self/stat"), "procfs only")
+    def test_procfs_sees_this_process(self):
+        collector = ProcessCollector(procfs=True)
+        mine = [p for p in collector.collect() if p["pid"] == os.getpid()]
+        self.assertEqual(len(mine), 1)
+        self.assertEqual(mine[0]["ppid"], os.getppid())
+        self.assertGreater(mine[0]["memory_mb"], 0)
+        # Same clock as psutil's create time, to within a clock tick
+        self.assertAlmostEqual(mine[0]["started"], psutil.Process().create_time(), delta=1)
+
+
+if __name__ == "__main__":
+    unittest.main()
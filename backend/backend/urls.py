@@ -21,8 +21,18 @@ from monitor import views
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/v1/ingest', views.ingest),
+    path('api/v1/ingest/batch', views.ingest_batch),
     path('api/v1/hosts', views.hosts),
+    path('api/v1/hosts/<str:hostname>/metrics', views.host_metrics),
+    # <path:> so process names containing "/" (e.g. kworker/0:1) can be selected
+    path('api/v1/hosts/<str:hostname>/processes/<path:selector>/series', views.process_series),
+    path('api/v1/fleet/top', views.fleet_top),
+    path('api/v1/fleet/summary', views.fleet_summary),
+    path('api/v1/alerts', views.alerts),
     path('api/v1/snapshots/latest', views.latest_snapshot),
     path('api/v1/snapshots/<int:snapshot_id>/processes', views.snapshot_processes),
+    path('api/v1/snapshots/<int:snapshot_id>/tree', views.snapshot_tree),
+    path('api/v1/stream', views.stream),
+    path('metrics', views.export_metrics),
     path('', views.index, name='index'),
 ]
\ No newline at end of file
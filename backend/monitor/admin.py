@@ -1,11 +1,12 @@
 from django.contrib import admin
-from .models import Host, Snapshot, Process
+from .models import Alert, AlertRule, CommandLine, Host, HostInventory, LatestProcess, MetricRollup, Process, ProcessName, Snapshot
 
 
 @admin.register(Host)
 class HostAdmin(admin.ModelAdmin):
     list_display = ("hostname", "api_key")
     search_fields = ("hostname", "api_key")
+    readonly_fields = ("agent",)
 
 
 @admin.register(Snapshot)
@@ -14,26 +15,74 @@ class SnapshotAdmin(admin.ModelAdmin):
         "id",
         "host",
         "captured_at",
-        "os",
-        "processor",
-        "cores",
-        "threads",
-        "ram_gb",
+        "inventory",
         "used_ram_gb",
         "available_ram_gb",
-        "storage_total_gb",
         "storage_used_gb",
         "storage_free_gb",
         "cpu_freq_mhz",
         "process_count",
     )
-    list_filter = ("host", "os")
+    list_filter = ("host", "inventory__os")
+    list_select_related = ("host", "inventory")
+    raw_id_fields = ("inventory",)
     search_fields = ("host__hostname",)
     date_hierarchy = "captured_at"
 
 
+@admin.register(HostInventory)
+class HostInventoryAdmin(admin.ModelAdmin):
+    list_display = ("os", "processor", "cores", "threads", "ram_gb", "storage_total_gb", "digest")
+    list_filter = ("os",)
+    search_fields = ("os", "processor")
+
+
 @admin.register(Process)
 class ProcessAdmin(admin.ModelAdmin):
-    list_display = ("snapshot", "pid", "ppid", "name", "cpu_percent", "memory_mb")
+    list_display = ("snapshot", "pid", "ppid", "name_ref", "cpu_percent", "memory_mb")
     list_filter = ("snapshot",)
-    search_fields = ("name", "pid", "ppid")
+    list_select_related = ("name_ref",)
+    raw_id_fields = ("snapshot", "name_ref", "cmdline_ref")
+    search_fields = ("name_ref__value", "pid", "ppid")
+
+
+@admin.register(ProcessName)
+class ProcessNameAdmin(admin.ModelAdmin):
+    list_display = ("value", "digest")
+    search_fields = ("value",)
+
+
+@admin.register(CommandLine)
+class CommandLineAdmin(admin.ModelAdmin):
+    list_display = ("value", "digest")
+    search_fields = ("value",)
+
+
+@admin.register(LatestProcess)
+class LatestProcessAdmin(admin.ModelAdmin):
+    list_display = ("host", "pid", "name_ref", "cpu_percent", "memory_mb", "captured_at")
+    list_filter = ("host",)
+    list_select_related = ("host", "name_ref")
+    raw_id_fields = ("host", "snapshot", "name_ref")
+
+
+@admin.register(MetricRollup)
+class MetricRollupAdmin(admin.ModelAdmin):
+    list_display = ("host", "resolution", "bucket_start", "samples", "used_ram_gb_max", "cpu_freq_mhz_max")
+    list_filter = ("resolution", "host")
+    date_hierarchy = "bucket_start"
+
+
+@admin.register(AlertRule)
+class AlertRuleAdmin(admin.ModelAdmin):
+    list_display = ("name", "hostname", "process_name", "expression", "for_seconds", "enabled")
+    list_filter = ("enabled",)
+    search_fields = ("name", "hostname", "process_name")
+
+
+@admin.register(Alert)
+class AlertAdmin(admin.ModelAdmin):
+    list_display = ("rule", "host", "fired_at", "resolved_at", "value")
+    list_filter = ("rule", "host")
+    list_select_related = ("rule", "host")
+    date_hierarchy = "fired_at"
@@ -0,0 +1,296 @@
+"""
+Threshold alerts evaluated as snapshots are ingested.
+
+AlertRule expressions are parsed once into restricted Python expressions
+(numbers, snapshot gauges, arithmetic, comparisons, and/or/not) and compiled
+to code objects. Rules are grouped per hostname the first time a host is
+seen, so each snapshot only costs the rules that apply to its host.
+
+After each ingest commits, the engine checks every stored snapshot against
+its host's rules. Per-(rule, host) state lives in memory: when the condition
+started holding, and whether it is firing. A rule fires once its condition
+has held continuously for `for_seconds` of snapshot time. It resolves on the
+first snapshot where the condition is false. Snapshots older than the last
+one seen for a (rule, host) are ignored.
+
+Transitions are stored as Alert rows, published on the SSE stream (event
+`alert`) and POSTed to MONITOR_ALERT_WEBHOOK_URL from a background thread.
+In-memory state is per server process. Open Alert rows are reloaded the
+first time a host is evaluated, so a restart does not fire them twice.
+"""
+import ast
+import atexit
+import json
+import logging
+import queue
+import threading
+import time
+import urllib.request
+from fnmatch import fnmatchcase
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .inventory import FIELDS as INVENTORY_FIELDS
+from .models import Alert, AlertRule
+from .stream import broker
+
+logger = logging.getLogger(__name__)
+
+HOST_VARIABLES = (
+    "ram_gb", "used_ram_gb", "available_ram_gb", "storage_total_gb", "storage_used_gb", "storage_free_gb",
+    "cpu_freq_mhz", "cores", "threads", "process_count",
+)
+# Totals over the processes named by AlertRule.process_name
+PROCESS_VARIABLES = ("count", "cpu_percent", "memory_mb")
+
+_NODES = (
+    ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.USub, ast.UAdd,
+    ast.BinOp, ast.Add, ast.Sub, ast.Mult, ast.Div, ast.Compare, ast.Gt, ast.GtE, ast.Lt, ast.LtE,
+    ast.Eq, ast.NotEq, ast.Name, ast.Load, ast.Constant,
+)
+_NO_BUILTINS = {"__builtins__": {}}
+
+
+class RuleError(ValueError):
+    """An AlertRule expression outside the supported subset."""
+
+
+def compile_expression(text, process=False):
+    """
+    Returns (condition, value) code objects for `text`. `value` is the left
+    side of the first comparison, reported with the alert.
+    """
+    try:
+        tree = ast.parse(text.strip(), mode="eval")
+    except SyntaxError as e:
+        raise RuleError(f"invalid expression: {e.msg}")
+    names = set(HOST_VARIABLES + (PROCESS_VARIABLES if process else ()))
+    for node in ast.walk(tree):
+        if not isinstance(node, _NODES):
+            raise RuleError(f"{type(node).__name__} is not allowed in an expression")
+        if isinstance(node, ast.Name) and node.id not in names:
+            raise RuleError(f"unknown variable {node.id!r}; use one of {', '.join(sorted(names))}")
+        if isinstance(node, ast.Constant) and (isinstance(node.value, bool) or not isinstance(node.value, (int, float))):
+            raise RuleError("only numeric constants are allowed")
+    comparisons = [node for node in ast.walk(tree) if isinstance(node, ast.Compare)]
+    if not comparisons:
+        raise RuleError("expression must contain a comparison, e.g. used_ram_gb / ram_gb > 0.9")
+    value = ast.Expression(body=comparisons[0].left)
+    return compile(tree, "<alert rule>", "eval"), compile(ast.fix_missing_locations(value), "<alert value>", "eval")
+
+
+def _evaluate(code, variables):
+    try:
+        return eval(code, _NO_BUILTINS, variables)
+    except (ArithmeticError, TypeError):
+        # Division by zero, or an optional gauge (cpu_freq_mhz) missing from the snapshot
+        return None
+
+
+class _Rule:
+    __slots__ = ("id", "name", "hostname", "process_name", "expression", "for_seconds", "condition", "value")
+
+    def __init__(self, rule):
+        self.id = rule.id
+        self.name = rule.name
+        self.hostname = rule.hostname
+        self.process_name = rule.process_name
+        self.expression = rule.expression
+        self.for_seconds = rule.for_seconds
+        self.condition, self.value = compile_expression(rule.expression, process=bool(rule.process_name))
+
+    def applies_to(self, hostname):
+        return not self.hostname or fnmatchcase(hostname, self.hostname)
+
+
+class AlertEngine:
+    def __init__(self, reload_sec=30):
+        self.reload_sec = reload_sec
+        self._lock = threading.Lock()
+        self._rules = None
+        self._loaded_at = 0.0
+        self._by_host = {}          # hostname -> [_Rule]
+        self._state = {}            # (rule id, host id) -> [held since, last snapshot time, firing]
+        self._known_hosts = set()   # host ids whose open alerts are reflected in _state
+
+    def reset(self):
+        with self._lock:
+            self._rules = None
+            self._by_host.clear()
+            self._state.clear()
+            self._known_hosts.clear()
+
+    def invalidate_rules(self):
+        with self._lock:
+            self._rules = None
+
+    def _load_rules(self):
+        # Caller holds the lock
+        if self._rules is None or time.monotonic() - self._loaded_at > self.reload_sec:
+            rules = []
+            for rule in AlertRule.objects.filter(enabled=True):
+                try:
+                    rules.append(_Rule(rule))
+                except RuleError as e:
+                    logger.warning("Skipping alert rule %r: %s", rule.name, e)
+            self._rules = rules
+            self._loaded_at = time.monotonic()
+            self._by_host.clear()
+            live = {r.id for r in rules}
+            self._state = {key: s for key, s in self._state.items() if key[0] in live}
+        return self._rules
+
+    def _rules_for(self, hostname):
+        # Caller holds the lock
+        self._load_rules()
+        rules = self._by_host.get(hostname)
+        if rules is None:
+            rules = self._by_host[hostname] = [r for r in self._rules if r.applies_to(hostname)]
+        return rules
+
+    def has_rules(self):
+        with self._lock:
+            return bool(self._load_rules())
+
+    def evaluate(self, items):
+        """Check (host, snapshot, processes) triples against their hosts' rules and record transitions."""
+        with self._lock:
+            work = [(host, snapshot, processes, self._rules_for(host.hostname)) for host, snapshot, processes in items]
+            unknown = {host.id for host, _, _, rules in work if rules and host.id not in self._known_hosts}
+        if unknown:
+            open_alerts = Alert.objects.filter(host_id__in=unknown, resolved_at__isnull=True)
+            opened = list(open_alerts.values_list("rule_id", "host_id", "fired_at"))
+
+        transitions = []
+        with self._lock:
+            if unknown:
+                for rule_id, host_id, fired_at in opened:
+                    self._state.setdefault((rule_id, host_id), [fired_at, fired_at, True])
+                self._known_hosts.update(unknown)
+            for host, snapshot, processes, rules in sorted(work, key=lambda w: w[1].captured_at):
+                if rules:
+                    transitions.extend(self._check(host, snapshot, processes, rules))
+        for transition in transitions:
+            self._record(*transition)
+
+    def _check(self, host, snapshot, processes, rules):
+        static = snapshot.inventory
+        variables = {name: getattr(static if name in INVENTORY_FIELDS else snapshot, name) for name in HOST_VARIABLES}
+        wanted = {r.process_name for r in rules if r.process_name}
+        totals = {}
+        if wanted:
+            totals = {name: [0, 0.0, 0.0] for name in wanted}
+            for p in processes:
+                t = totals.get(p["name"])
+                if t is not None:
+                    t[0] += 1
+                    t[1] += p["cpu_percent"]
+                    t[2] += p["memory_mb"]
+
+        now = snapshot.captured_at
+        for rule in rules:
+            scope = variables
+            if rule.process_name:
+                count, cpu, mem = totals[rule.process_name]
+                scope = {**variables, "count": count, "cpu_percent": cpu, "memory_mb": mem}
+            key = (rule.id, host.id)
+            state = self._state.get(key)
+            if state is not None and now < state[1]:
+                continue  # late snapshot: already past it
+            if _evaluate(rule.condition, scope):
+                if state is None:
+                    state = self._state[key] = [now, now, False]
+                state[1] = now
+                if not state[2] and (now - state[0]).total_seconds() >= rule.for_seconds:
+                    state[2] = True
+                    yield ("firing", rule, host, now, _evaluate(rule.value, scope))
+            elif state is not None:
+                del self._state[key]
+                if state[2]:
+                    yield ("resolved", rule, host, now, _evaluate(rule.value, scope))
+
+    def _record(self, state, rule, host, at, value):
+        value = float(value) if isinstance(value, (int, float)) else None
+        if state == "firing":
+            try:
+                with transaction.atomic():
+                    Alert.objects.create(rule_id=rule.id, host_id=host.id, fired_at=at, value=value)
+            except IntegrityError:
+                return  # another server process already opened it
+        elif not Alert.objects.filter(rule_id=rule.id, host_id=host.id, resolved_at__isnull=True).update(resolved_at=at):
+            return
+        event = {
+            "state": state,
+            "rule": rule.name,
+            "expression": rule.expression,
+            "process_name": rule.process_name or None,
+            "hostname": host.hostname,
+            "at": at.isoformat(),
+            "value": value,
+        }
+        broker.publish(host.hostname, event, name="alert")
+        webhook.send(event)
+
+
+class Webhook:
+    """Delivers alert events to MONITOR_ALERT_WEBHOOK_URL off the ingest path; drops them when the queue is full."""
+
+    def __init__(self, maxsize=1000):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def send(self, event):
+        if not settings.MONITOR_ALERT_WEBHOOK_URL:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="monitor-alert-webhook", daemon=True)
+                self._thread.start()
+                atexit.register(self.queue.put, None)
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            logger.warning("Alert webhook queue full; dropping %s for %s", event["rule"], event["hostname"])
+
+    def _run(self):
+        while True:
+            event = self.queue.get()
+            if event is None:
+                return
+            request = urllib.request.Request(
+                settings.MONITOR_ALERT_WEBHOOK_URL,
+                data=json.dumps(event).encode("utf-8"),
+                headers={"Content-Type": "application/json"},
+                method="POST",
+            )
+            try:
+                with urllib.request.urlopen(request, timeout=settings.MONITOR_ALERT_WEBHOOK_TIMEOUT):
+                    pass
+            except OSError as e:
+                logger.warning("Alert webhook failed for %s on %s: %s", event["rule"], event["hostname"], e)
+
+
+engine = AlertEngine(settings.MONITOR_ALERT_RULES_RELOAD_SEC)
+webhook = Webhook()
+
+
+def evaluate_on_commit(items):
+    """Evaluate (host, snapshot, processes) triples once the ingest transaction commits."""
+    if engine.has_rules():
+        # robust: an alerting failure must not turn a stored snapshot into an error response
+        transaction.on_commit(lambda: engine.evaluate(items), robust=True)
+
+
+@receiver(post_save, sender=AlertRule, dispatch_uid="monitor.alerts.rule_saved")
+@receiver(post_delete, sender=AlertRule, dispatch_uid="monitor.alerts.rule_deleted")
+def _rule_changed(sender, instance, **kwargs):
+    if kwargs.get("signal") is post_save and not instance.enabled:
+        # A disabled rule stops evaluating; close what it left open
+        Alert.objects.filter(rule=instance, resolved_at__isnull=True).update(resolved_at=timezone.now())
+    transaction.on_commit(engine.invalidate_rules)
+    engine.invalidate_rules()
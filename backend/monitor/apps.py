@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class MonitorConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'monitor'
+
+    def ready(self):
+        # Host and AlertRule save/delete signals invalidate in-process caches
+        from . import alerts, hostcache  # noqa: F401
@@ -1,6 +1,6 @@
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
-from .models import Host
+from .hostcache import hosts
 
 class APIKeyAuthentication(BaseAuthentication):
     """
@@ -12,9 +12,9 @@ class APIKeyAuthentication(BaseAuthentication):
         if not key:
             return None  # Skip → AllowAny or other permission classes decide
 
-        try:
-            host = Host.objects.get(api_key=key)
-        except Host.DoesNotExist:
+        # Cached by key, so steady-state agents cost no query here (see hostcache.py)
+        host = hosts.by_api_key(key)
+        if host is None:
             # Return None to let the view handle first-time hosts / auto-create logic
             return None
 
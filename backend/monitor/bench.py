@@ -0,0 +1,365 @@
+"""
+Throughput / latency benchmark for ingest and the read endpoints.
+
+SyntheticFleet generates agent payloads for a configurable number of hosts,
+processes per host, per-tick process churn and command-line length. It is
+seeded, so two runs send identical data. run() posts the fleet's snapshots
+to /api/v1/ingest, then replays a mix of read requests. It returns a
+JSON-serializable report: snapshots/s, p50/p99 latency, queries per request
+and database growth, so results can be diffed across commits.
+
+Targets:
+- ClientTarget: the Django test client in this process, with per-request
+  query counts. `manage.py bench` runs it against a throwaway test database.
+- ServerTarget: a running server over HTTP (`manage.py bench --url ...`),
+  optionally with concurrent agents. It cannot see queries or the server's
+  database.
+
+codec() times the JSON steps of one ingest request in isolation: parsing,
+validating and rendering a snapshot with DRF's classes and with the
+monitor.fastjson / JSONIngestSerializer fast path.
+"""
+import json
+import random
+import string
+import subprocess
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from io import BytesIO
+
+from django.conf import settings
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+
+from . import fastjson
+from .inventory import digest_hex
+from .serializers import IngestSerializer, JSONIngestSerializer
+
+# Typical process mix; earlier names are picked more often
+PROCESS_NAMES = (
+    "kworker/0:1", "systemd", "bash", "sshd", "python3", "java", "node", "nginx", "postgres", "chrome",
+    "containerd-shim", "dockerd", "kubelet", "rsyslogd", "cron", "redis-server", "gunicorn", "celery",
+    "firefox", "code", "Xorg", "pulseaudio", "snapd", "dbus-daemon", "polkitd", "NetworkManager",
+    "svchost.exe", "explorer.exe", "MsMpEng.exe", "RuntimeBroker.exe",
+)
+
+
+class SyntheticFleet:
+    def __init__(self, hosts=10, processes=300, churn=0.02, cmdline_length=120, interval=5.0, seed=0, start=None):
+        self.processes = processes
+        self.churn = churn
+        self.cmdline_length = cmdline_length
+        self.interval = interval
+        self.rng = random.Random(seed)
+        self.now = start or datetime.now(timezone.utc)
+        self.hosts = [self._new_host(i) for i in range(hosts)]
+
+    def _new_host(self, i):
+        ram_gb = self.rng.choice((8.0, 16.0, 32.0, 64.0))
+        cores = self.rng.choice((2, 4, 8, 16))
+        inventory = {
+            "os": "Linux",
+            "processor": "x86_64",
+            "cores": cores,
+            "threads": cores * 2,
+            "ram_gb": ram_gb,
+            "storage_total_gb": self.rng.choice((256.0, 512.0, 1024.0)),
+        }
+        host = {
+            "hostname": f"bench-{i:05d}",
+            "api_key": f"bench-key-{i:05d}",
+            "ram_gb": ram_gb,
+            "storage_total_gb": inventory["storage_total_gb"],
+            "inventory": inventory,
+            "inventory_hash": digest_hex(inventory),
+            "inventory_sent": False,
+            "next_pid": 2,
+            "processes": {},
+        }
+        host["processes"][1] = {"pid": 1, "ppid": 0, "name": "init", "cpu_percent": 0.0, "memory_mb": 12.0, "cmdline": "/sbin/init"}
+        for _ in range(self.processes - 1):
+            self._spawn(host)
+        return host
+
+    def _spawn(self, host):
+        pid = host["next_pid"]
+        host["next_pid"] += self.rng.randint(1, 7)
+        name = PROCESS_NAMES[min(int(self.rng.expovariate(0.15)), len(PROCESS_NAMES) - 1)]
+        args = "".join(self.rng.choices(string.ascii_lowercase + string.digits + " -=/.", k=max(0, self.cmdline_length - len(name) - 1)))
+        host["processes"][pid] = {
+            "pid": pid,
+            "ppid": self.rng.choice(list(host["processes"])[:50]),
+            "name": name,
+            "cpu_percent": 0.0,
+            "memory_mb": round(self.rng.lognormvariate(4, 1.2), 1),
+            "cmdline": f"{name} {args}"[:self.cmdline_length] if self.cmdline_length else "",
+        }
+
+    def tick(self):
+        """Advance the fleet by one interval and return one ingest payload per host."""
+        self.now += timedelta(seconds=self.interval)
+        payloads = []
+        for host in self.hosts:
+            procs = host["processes"]
+            for pid in self.rng.sample(sorted(procs)[1:], min(len(procs) - 1, round(self.churn * len(procs)))):
+                del procs[pid]
+                self._spawn(host)
+            for p in procs.values():
+                p["cpu_percent"] = round(max(0.0, self.rng.gauss(p["cpu_percent"] * 0.8 + 0.5, 2.0)), 1)
+                p["memory_mb"] = round(max(0.1, p["memory_mb"] * self.rng.uniform(0.98, 1.02)), 1)
+            used = min(host["ram_gb"], sum(p["memory_mb"] for p in procs.values()) / 1024 + 1.0)
+            payload = {
+                "hostname": host["hostname"],
+                "captured_at": self.now.isoformat(),
+                "system_info": {
+                    "used_ram_gb": round(used, 2),
+                    "available_ram_gb": round(host["ram_gb"] - used, 2),
+                    "storage_used_gb": round(host["storage_total_gb"] * 0.4, 2),
+                    "storage_free_gb": round(host["storage_total_gb"] * 0.6, 2),
+                    "cpu_freq_mhz": 2400.0,
+                },
+                "inventory_hash": host["inventory_hash"],
+                "processes": list(procs.values()),
+            }
+            if not host["inventory_sent"]:
+                # Like the agent: the full inventory once, then only its hash
+                payload["inventory"] = host["inventory"]
+                host["inventory_sent"] = True
+            payloads.append(payload)
+        return payloads
+
+
+class ClientTarget:
+    name = "client"
+    concurrency = 1
+
+    def __init__(self):
+        self.client = Client()
+
+    def request(self, method, path, body=None, api_key=None):
+        """(status, seconds, queries, parsed JSON body or None)"""
+        extra = {"HTTP_X_API_KEY": api_key} if api_key else {}
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            if method == "POST":
+                response = self.client.post(path, body, content_type="application/json", **extra)
+            else:
+                response = self.client.get(path, **extra)
+            elapsed = time.perf_counter() - started
+        return response.status_code, elapsed, len(ctx.captured_queries), _json(response.content)
+
+    def database_bytes(self):
+        return database_bytes()
+
+
+class ServerTarget:
+    name = "server"
+
+    def __init__(self, base_url, concurrency=1, timeout=30):
+        self.base_url = base_url.rstrip("/")
+        self.concurrency = concurrency
+        self.timeout = timeout
+
+    def request(self, method, path, body=None, api_key=None):
+        headers = {"Content-Type": "application/json"}
+        if api_key:
+            headers["X-API-KEY"] = api_key
+        req = urllib.request.Request(self.base_url + path, data=body, headers=headers, method=method)
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(req, timeout=self.timeout) as response:
+                status, content = response.status, response.read()
+        except urllib.error.HTTPError as e:
+            status, content = e.code, e.read()
+        return status, time.perf_counter() - started, None, _json(content)
+
+    def database_bytes(self):
+        return None  # the server's database is not visible from here
+
+
+def _json(content):
+    try:
+        return json.loads(content)
+    except ValueError:
+        return None
+
+
+def database_bytes():
+    with connection.cursor() as cursor:
+        if connection.vendor == "sqlite":
+            cursor.execute("PRAGMA page_count")
+            pages = cursor.fetchone()[0]
+            cursor.execute("PRAGMA page_size")
+            return pages * cursor.fetchone()[0]
+        if connection.vendor == "postgresql":
+            cursor.execute("SELECT pg_database_size(current_database())")
+            return cursor.fetchone()[0]
+    return None
+
+
+def _percentile(ordered, q):
+    if not ordered:
+        return None
+    return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+
+class _Stats:
+    def __init__(self):
+        self.latencies = []
+        self.queries = []
+        self.statuses = {}
+        self._lock = threading.Lock()
+
+    def add(self, status, seconds, queries):
+        with self._lock:
+            self.latencies.append(seconds)
+            if queries is not None:
+                self.queries.append(queries)
+            self.statuses[str(status)] = self.statuses.get(str(status), 0) + 1
+
+    def report(self):
+        ordered = sorted(self.latencies)
+        ms = lambda s: None if s is None else round(s * 1000, 3)
+        return {
+            "requests": len(ordered),
+            "statuses": self.statuses,
+            "latency_ms": {"p50": ms(_percentile(ordered, 0.5)), "p99": ms(_percentile(ordered, 0.99)), "max": ms(ordered[-1] if ordered else None)},
+            "queries_per_request": {
+                "mean": round(sum(self.queries) / len(self.queries), 2),
+                "max": max(self.queries),
+            } if self.queries else None,
+        }
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=settings.BASE_DIR, capture_output=True, text=True, timeout=5
+        )
+    except (OSError, subprocess.SubprocessError):
+        return None
+    return out.stdout.strip() or None
+
+
+def _read_requests(fleet, target, reads):
+    """Read requests spread across the fleet's hosts: (endpoint name, path)."""
+    hosts = [h["hostname"] for h in fleet.hosts]
+    start = (fleet.now - timedelta(hours=1)).isoformat()
+    end = (fleet.now + timedelta(seconds=1)).isoformat()
+    window = urllib.parse.urlencode({"from": start, "to": end})
+    out = []
+    for i in range(reads):
+        hostname = hosts[i % len(hosts)]
+        quoted = urllib.parse.quote(hostname)
+        status, _, _, latest = target.request("GET", f"/api/v1/snapshots/latest?hostname={quoted}")
+        snapshot_id = latest.get("snapshot_id") if status == 200 and isinstance(latest, dict) else None
+        out.append(("hosts", "/api/v1/hosts"))
+        out.append(("latest", f"/api/v1/snapshots/latest?hostname={quoted}"))
+        if snapshot_id is not None:
+            out.append(("processes_top50", f"/api/v1/snapshots/{snapshot_id}/processes?sort=mem&limit=50"))
+            out.append(("tree_root", f"/api/v1/snapshots/{snapshot_id}/tree?depth=1"))
+        out.append(("host_metrics", f"/api/v1/hosts/{quoted}/metrics?{window}"))
+        out.append(("process_series", f"/api/v1/hosts/{quoted}/processes/java/series?{window}"))
+        out.append(("fleet_top", "/api/v1/fleet/top?metric=memory_mb&n=50"))
+        out.append(("fleet_summary", "/api/v1/fleet/summary"))
+    return out
+
+
+def run(target, fleet, ticks=10, reads=20):
+    bytes_before = target.database_bytes()
+    ingest = _Stats()
+    processes = 0
+
+    def post(host, body):
+        status, seconds, queries, _ = target.request("POST", "/api/v1/ingest", body, host["api_key"])
+        ingest.add(status, seconds, queries)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=target.concurrency) as pool:
+        for _ in range(ticks):
+            payloads = fleet.tick()
+            bodies = [json.dumps(p).encode("utf-8") for p in payloads]
+            processes += sum(len(p["processes"]) for p in payloads)
+            if target.concurrency > 1:
+                # One tick's snapshots go out concurrently (up to `concurrency` agents); ticks stay ordered
+                list(pool.map(post, fleet.hosts, bodies))
+            else:
+                # Same thread, so the test client shares this thread's database connection
+                for host, body in zip(fleet.hosts, bodies):
+                    post(host, body)
+    ingest_seconds = time.perf_counter() - started
+    bytes_after = target.database_bytes()
+
+    reads_stats = {}
+    for endpoint, path in _read_requests(fleet, target, reads):
+        status, seconds, queries, _ = target.request("GET", path)
+        reads_stats.setdefault(endpoint, _Stats()).add(status, seconds, queries)
+
+    stored = ingest.statuses.get("201", 0) + ingest.statuses.get("202", 0)
+    report = {
+        "git_commit": _git_commit(),
+        "target": target.name,
+        "database": connection.vendor if target.name == "client" else None,
+        "config": {
+            "hosts": len(fleet.hosts),
+            "processes": fleet.processes,
+            "churn": fleet.churn,
+            "cmdline_length": fleet.cmdline_length,
+            "ticks": ticks,
+            "reads": reads,
+            "concurrency": target.concurrency,
+        },
+        "ingest": {
+            **ingest.report(),
+            "seconds": round(ingest_seconds, 3),
+            "snapshots_per_sec": round(stored / ingest_seconds, 1) if ingest_seconds else None,
+            "processes_per_sec": round(processes / ingest_seconds, 1) if ingest_seconds else None,
+        },
+        "reads": {name: stats.report() for name, stats in reads_stats.items()},
+        "db": {
+            "bytes_before": bytes_before,
+            "bytes_after": bytes_after,
+            "bytes_per_snapshot": round((bytes_after - bytes_before) / stored) if bytes_after is not None and stored else None,
+        },
+    }
+    return report
+
+
+def _best_ms(fn, rounds):
+    best = None
+    for _ in range(rounds):
+        started = time.perf_counter()
+        fn()
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return round(best * 1000, 3)
+
+
+def codec(fleet, rounds=20):
+    """Best-of-`rounds` ms to parse, validate and render one of the fleet's snapshots, DRF vs fast path."""
+    payload = fleet.tick()[0]
+    body = json.dumps(payload).encode("utf-8")
+    data = JSONParser().parse(BytesIO(body))
+    steps = {
+        "parse": (lambda: JSONParser().parse(BytesIO(body)), lambda: fastjson.FastJSONParser().parse(BytesIO(body))),
+        "validate": (lambda: IngestSerializer(data=data).is_valid(), lambda: JSONIngestSerializer(data=data).is_valid()),
+        "render": (lambda: JSONRenderer().render(data), lambda: fastjson.FastJSONRenderer().render(data)),
+    }
+    report = {
+        "git_commit": _git_commit(),
+        "orjson": fastjson.orjson is not None,
+        "config": {"processes": len(payload["processes"]), "cmdline_length": fleet.cmdline_length, "rounds": rounds},
+        "body_bytes": len(body),
+    }
+    for step, (drf, fast) in steps.items():
+        drf_ms, fast_ms = _best_ms(drf, rounds), _best_ms(fast, rounds)
+        report[step] = {"drf_ms": drf_ms, "fast_ms": fast_ms, "speedup": round(drf_ms / fast_ms, 1) if fast_ms else None}
+    return report
@@ -0,0 +1,117 @@
+"""
+Read cache for the polling endpoints (hosts, latest_snapshot, snapshot_processes).
+
+Entries live in the `monitor` cache alias (settings.CACHES): an in-process LRU
+by default or Redis when MONITOR_CACHE_URL is set. Each entry stores the
+response body with its ETag and Last-Modified so repeat polls are answered
+without touching the database, and unchanged ones with 304. Ingest drops
+the affected entries once its transaction commits.
+
+That invalidation only reaches other server processes through a shared
+cache, so entries that ingest changes (hosts, latest snapshot) are cached
+only when settings.MONITOR_CACHE_SHARED is set. Per-snapshot entries never
+change and are cached in any backend; without a shared cache the others are
+rebuilt per request and still answered with 304 when unchanged. Retention
+does remove snapshots and their process rows, so per-snapshot entries expire
+before their snapshot reaches the retention cutoffs (retention_timeout).
+"""
+import hashlib
+from datetime import timedelta
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT
+from django.db import transaction
+from django.utils import timezone
+from django.utils.http import http_date, parse_http_date_safe
+from rest_framework import status
+from rest_framework.response import Response
+
+from . import fastjson, retention
+
+HOSTS_KEY = "monitor:hosts"
+
+
+def get_cache():
+    return caches["monitor"]
+
+
+def latest_key(hostname):
+    return f"monitor:latest:{quote(hostname)}"
+
+
+def query_key(base, query=None):
+    """`base` extended with a digest of the request's query parameters, one entry per canonical query."""
+    if not query:
+        return base
+    canonical = "&".join(f"{k}={v}" for k, v in sorted(query.items()))
+    return f"{base}:{hashlib.md5(canonical.encode('utf-8')).hexdigest()}"
+
+
+def processes_key(snapshot_id, query=None):
+    return query_key(f"monitor:procs:{snapshot_id}", query)
+
+
+def retention_timeout(captured_at):
+    """
+    Cache timeout for an entry derived from the snapshot captured at
+    `captured_at`: the default, cut short so the entry is gone before
+    retention may prune the snapshot's processes or thin the snapshot away.
+    0 means do not cache.
+    """
+    config = retention.get_config()
+    keep = timedelta(hours=min(config["PROCESS_DETAIL_HOURS"], config["MINUTE_AFTER_HOURS"]))
+    left = max(0, int((captured_at + keep - timezone.now()).total_seconds()))
+    default = get_cache().default_timeout
+    return left if default is None else min(left, default)
+
+
+def _etag(body):
+    return '"%s"' % hashlib.md5(fastjson.dumps(body, sort_keys=True)).hexdigest()
+
+
+def _not_modified(request, entry):
+    if_none_match = request.headers.get("If-None-Match")
+    if if_none_match:
+        return entry["etag"] in [t.strip() for t in if_none_match.split(",")] or if_none_match.strip() == "*"
+    since = parse_http_date_safe(request.headers.get("If-Modified-Since") or "")
+    return since is not None and entry["last_modified"] is not None and int(entry["last_modified"]) <= since
+
+
+def cached_response(request, key, build, immutable=False):
+    """
+    Serve `key` from the cache, calling build() on a miss.
+    build() returns (body, last_modified datetime or None), or a Response
+    (errors are passed through uncached). Entries that ingest invalidates
+    (`immutable` False) bypass a cache the server processes do not share;
+    `immutable` ones expire per retention_timeout(last_modified).
+    """
+    cache = get_cache() if immutable or settings.MONITOR_CACHE_SHARED else None
+    entry = cache.get(key) if cache is not None else None
+    if entry is None:
+        result = build()
+        if isinstance(result, Response):
+            return result
+        body, last_modified = result
+        entry = {
+            "body": body,
+            "etag": _etag(body),
+            "last_modified": last_modified.timestamp() if last_modified else None,
+        }
+        if cache is not None:
+            timeout = retention_timeout(last_modified) if immutable and last_modified else DEFAULT_TIMEOUT
+            if timeout != 0:
+                cache.set(key, entry, timeout)
+
+    headers = {"ETag": entry["etag"], "Cache-Control": "no-cache"}
+    if entry["last_modified"] is not None:
+        headers["Last-Modified"] = http_date(entry["last_modified"])
+    if _not_modified(request, entry):
+        return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(entry["body"], headers=headers)
+
+
+def invalidate_host(hostname):
+    """Drop the entries a new snapshot for `hostname` makes stale, after the current transaction commits."""
+    transaction.on_commit(lambda: get_cache().delete_many([latest_key(hostname), HOSTS_KEY]))
@@ -0,0 +1,201 @@
+"""
+Columnar wire format for /api/v1/ingest.
+
+Layout (after Content-Encoding is removed):
+
+    b"MCOL" | version:u8 | header_len:u32 | header (UTF-8 JSON) | columns
+
+The header carries every non-process field of the JSON payload plus
+`count`, the `names` dictionary, an optional `cmdlines` dictionary and,
+for deltas, `added` (the first `added` rows are added processes, the rest
+changed ones). Columns are little-endian arrays of `count` items each:
+pid:i32, ppid:i32, name_idx:u32, cpu_percent:f64, memory_mb:f64, then
+cmdline_idx:u32 when `cmdlines` is present and started:i64 (epoch seconds,
+-1 when unknown) when the header has `"started": true`.
+"""
+import gzip
+import json
+import struct
+import zlib
+
+try:
+    import zstandard
+except ImportError:  # optional dependency
+    zstandard = None
+
+
+MEDIA_TYPE = "application/x-monitor-columnar"
+MAGIC = b"MCOL"
+VERSION = 1
+MAX_DECODED_BYTES = 64 * 1024 * 1024
+STARTED_UNKNOWN = -1
+
+_PREAMBLE = struct.Struct("<4sBI")
+
+
+class ProcessColumns:
+    """Parallel process columns plus the dictionaries their indexes point into."""
+
+    __slots__ = (
+        "pid", "ppid", "name_idx", "cpu_percent", "memory_mb", "cmdline_idx", "names", "cmdlines", "started",
+    )
+
+    def __init__(
+        self, pid, ppid, name_idx, cpu_percent, memory_mb, names, cmdline_idx=None, cmdlines=None, started=None,
+    ):
+        self.pid = pid
+        self.ppid = ppid
+        self.name_idx = name_idx
+        self.cpu_percent = cpu_percent
+        self.memory_mb = memory_mb
+        self.names = names
+        self.cmdline_idx = cmdline_idx
+        self.cmdlines = cmdlines
+        self.started = started
+
+    def __len__(self):
+        return len(self.pid)
+
+    def slice(self, start, stop):
+        return ProcessColumns(
+            self.pid[start:stop],
+            self.ppid[start:stop],
+            self.name_idx[start:stop],
+            self.cpu_percent[start:stop],
+            self.memory_mb[start:stop],
+            self.names,
+            self.cmdline_idx[start:stop] if self.cmdline_idx is not None else None,
+            self.cmdlines,
+            self.started[start:stop] if self.started is not None else None,
+        )
+
+    def rows(self):
+        names = self.names
+        out = [
+            {"pid": pid, "ppid": ppid, "name": names[n], "cpu_percent": cpu, "memory_mb": mem}
+            for pid, ppid, n, cpu, mem in zip(self.pid, self.ppid, self.name_idx, self.cpu_percent, self.memory_mb)
+        ]
+        if self.cmdline_idx is not None:
+            cmdlines = self.cmdlines
+            for row, c in zip(out, self.cmdline_idx):
+                row["cmdline"] = cmdlines[c]
+        if self.started is not None:
+            for row, started in zip(out, self.started):
+                row["started"] = started if started != STARTED_UNKNOWN else None
+        return out
+
+
+def decompress(body: bytes, encoding: str) -> bytes:
+    encoding = (encoding or "identity").strip().lower()
+    if encoding == "identity":
+        return body
+    if encoding in ("gzip", "x-gzip"):
+        d = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        out = d.decompress(body, MAX_DECODED_BYTES)
+        if d.unconsumed_tail:
+            raise ValueError("decoded payload too large")
+        return out
+    if encoding == "zstd":
+        if zstandard is None:
+            raise ValueError("zstd content encoding is not supported (zstandard not installed)")
+        try:
+            return zstandard.ZstdDecompressor().decompress(body, max_output_size=MAX_DECODED_BYTES)
+        except zstandard.ZstdError as e:
+            raise ValueError(str(e))
+    raise ValueError(f"unsupported content encoding: {encoding}")
+
+
+def compress(raw: bytes, encoding: str) -> bytes:
+    if encoding == "gzip":
+        return gzip.compress(raw, compresslevel=6)
+    if encoding == "zstd":
+        if zstandard is None:
+            raise ValueError("zstandard is not installed")
+        return zstandard.ZstdCompressor(level=3).compress(raw)
+    return raw
+
+
+def decode(raw: bytes) -> dict:
+    """Decode an uncompressed columnar body into an ingest payload whose process lists are ProcessColumns."""
+    if len(raw) < _PREAMBLE.size:
+        raise ValueError("truncated columnar payload")
+    magic, version, header_len = _PREAMBLE.unpack_from(raw, 0)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("not a columnar v1 payload")
+    offset = _PREAMBLE.size
+    try:
+        header = json.loads(raw[offset : offset + header_len])
+    except ValueError as e:
+        raise ValueError(f"invalid columnar header: {e}")
+    if not isinstance(header, dict):
+        raise ValueError("invalid columnar header")
+    offset += header_len
+
+    n = header.pop("count", None)
+    names = header.pop("names", None)
+    cmdlines = header.pop("cmdlines", None)
+    added = header.pop("added", None)
+    started = header.pop("started", False) is True
+    if not isinstance(n, int) or n < 0 or not isinstance(names, list):
+        raise ValueError("columnar header requires count and names")
+
+    layout = f"<{n}i{n}i{n}I{n}d{n}d" + (f"{n}I" if cmdlines is not None else "") + (f"{n}q" if started else "")
+    if len(raw) - offset != struct.calcsize(layout):
+        raise ValueError("column block length does not match count")
+    values = struct.unpack_from(layout, raw, offset)
+    end = 6 * n if cmdlines is not None else 5 * n
+    cols = ProcessColumns(
+        values[0:n],
+        values[n : 2 * n],
+        values[2 * n : 3 * n],
+        values[3 * n : 4 * n],
+        values[4 * n : 5 * n],
+        names,
+        values[5 * n : 6 * n] if cmdlines is not None else None,
+        cmdlines,
+        values[end : end + n] if started else None,
+    )
+
+    if "base_captured_at" in header:
+        if not isinstance(added, int) or not 0 <= added <= n:
+            raise ValueError("delta header requires added <= count")
+        header["delta"] = {
+            "added": cols.slice(0, added),
+            "changed": cols.slice(added, n),
+            "removed": header.pop("removed", []),
+        }
+    else:
+        header["processes"] = cols
+    return header
+
+
+def encode(payload: dict) -> bytes:
+    """Encode a JSON-shaped ingest payload (keyframe or delta) into an uncompressed columnar body."""
+    header = {k: v for k, v in payload.items() if k not in ("processes", "delta")}
+    if "delta" in payload:
+        procs = list(payload["delta"].get("added", [])) + list(payload["delta"].get("changed", []))
+        header["added"] = len(payload["delta"].get("added", []))
+        header["removed"] = list(payload["delta"].get("removed", []))
+    else:
+        procs = list(payload.get("processes", []))
+
+    name_ids = {}
+    name_idx = [name_ids.setdefault(p["name"], len(name_ids)) for p in procs]
+    names = list(name_ids)
+    n = len(procs)
+    layout = f"<{n}i{n}i{n}I{n}d{n}d"
+    columns = [p["pid"] for p in procs] + [p["ppid"] for p in procs] + name_idx
+    columns += [float(p["cpu_percent"]) for p in procs] + [float(p["memory_mb"]) for p in procs]
+    if any("cmdline" in p for p in procs):
+        cmd_ids = {}
+        columns += [cmd_ids.setdefault(p.get("cmdline") or "", len(cmd_ids)) for p in procs]
+        header["cmdlines"] = list(cmd_ids)
+        layout += f"{n}I"
+    if any(p.get("started") is not None for p in procs):
+        columns += [p["started"] if p.get("started") is not None else STARTED_UNKNOWN for p in procs]
+        header["started"] = True
+        layout += f"{n}q"
+    header.update(count=n, names=names)
+
+    head = json.dumps(header, separators=(",", ":"), default=str).encode("utf-8")
+    return _PREAMBLE.pack(MAGIC, VERSION, len(head)) + head + struct.pack(layout, *columns)
@@ -0,0 +1,67 @@
+"""
+orjson-backed JSON parser and renderer for DRF.
+
+They are selected in settings.REST_FRAMEWORK (DEFAULT_PARSER_CLASSES and
+DEFAULT_RENDERER_CLASSES); listing DRF's JSONParser / JSONRenderer there
+instead switches the fast path off. Output matches JSONRenderer: UTF-8,
+compact, UTC datetimes with "Z", and U+2028/U+2029 escaped. Types orjson does
+not know go through DRF's encoder. Both classes fall back to their DRF base
+when orjson is not installed, so the setting is safe either way.
+"""
+import json
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import JSONRenderer
+from rest_framework.utils.encoders import JSONEncoder
+
+try:
+    import orjson
+except ImportError:  # optional dependency
+    orjson = None
+
+_encoder = JSONEncoder()
+
+
+def _default(obj):
+    return _encoder.default(obj)
+
+
+def dumps(obj, sort_keys=False):
+    """Compact UTF-8 JSON bytes for `obj` (orjson when available)."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=_default, option=orjson.OPT_SORT_KEYS if sort_keys else 0)
+        except TypeError:
+            pass  # e.g. integers beyond 64 bits
+    return json.dumps(obj, cls=JSONEncoder, sort_keys=sort_keys, separators=(",", ":")).encode("utf-8")
+
+
+class FastJSONParser(JSONParser):
+    def parse(self, stream, media_type=None, parser_context=None):
+        encoding = (parser_context or {}).get("encoding", "utf-8")
+        if orjson is None or encoding.lower().replace("-", "") != "utf8":
+            return super().parse(stream, media_type, parser_context)
+        try:
+            # orjson rejects NaN and Infinity, like JSONParser under STRICT_JSON
+            return orjson.loads(stream.read())
+        except orjson.JSONDecodeError as e:
+            raise ParseError(f"JSON parse error - {e}")
+
+
+class FastJSONRenderer(JSONRenderer):
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if (
+            orjson is None
+            or data is None
+            or not self.compact
+            or self.ensure_ascii
+            or self.get_indent(accepted_media_type, renderer_context or {})
+        ):
+            return super().render(data, accepted_media_type, renderer_context)
+        try:
+            body = orjson.dumps(data, default=_default, option=orjson.OPT_UTC_Z | orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            return super().render(data, accepted_media_type, renderer_context)
+        # Same escaping as JSONRenderer: these two are valid JSON but not valid JavaScript
+        return body.replace(b"\xe2\x80\xa8", b"\\u2028").replace(b"\xe2\x80\xa9", b"\\u2029")
@@ -0,0 +1,120 @@
+"""
+Time series of one process (by name or by pid) on one host, computed in the
+database from Process detail.
+
+Two levels of aggregation run in a single query. First, matching rows are
+summed per snapshot, so "java" means every java process on the host at that
+moment. Then those per-snapshot totals are folded into `step`-second buckets
+(min / max / avg). Only the buckets cross the wire.
+
+A pid can be reused after the original process exits. pid series are
+therefore split per process: one series for each distinct (name, command
+line, start time) that ran under the pid in the range. Rows from agents that
+do not report start times have none, so under those agents a pid reused by
+the same program continues the same series.
+
+Coverage is bounded by retention: process rows are kept for
+MONITOR_RETENTION["PROCESS_DETAIL_HOURS"].
+"""
+from datetime import datetime, timezone
+
+from django.db import connection
+from django.db.models import Count, Func, IntegerField, Sum
+
+from . import interning
+from .models import CommandLine, Process, ProcessName
+
+
+class EpochBucket(Func):
+    """Start of the `step`-second bucket holding a datetime column, as epoch seconds."""
+
+    output_field = IntegerField()
+
+    def __init__(self, expression, step):
+        self.step = int(step)
+        super().__init__(expression)
+
+    def as_sqlite(self, compiler, connection, **extra_context):
+        # Datetimes are stored as UTC text; strftime('%s') drops the fraction
+        return self.as_sql(
+            compiler, connection,
+            template=f"((CAST(strftime('%%%%s', %(expressions)s) AS INTEGER) / {self.step}) * {self.step})",
+            **extra_context,
+        )
+
+    def as_postgresql(self, compiler, connection, **extra_context):
+        return self.as_sql(
+            compiler, connection,
+            template=f"(CAST(FLOOR(EXTRACT(EPOCH FROM %(expressions)s) / {self.step}) AS BIGINT) * {self.step})",
+            **extra_context,
+        )
+
+
+def _stats(lo, hi, avg):
+    return {"min": round(lo, 2), "max": round(hi, 2), "avg": round(avg, 2)}
+
+
+def series(host, start, end, step, name=None, pid=None):
+    """
+    [{name, cmdline?, pid?, started?, points[{t, samples, processes,
+    cpu_percent{min,max,avg}, memory_mb{min,max,avg}}]}] for `name` (one series,
+    summed over same-named processes) or `pid` (one series per process seen under it).
+    """
+    rows = Process.objects.filter(snapshot__host=host, captured_at__gte=start, captured_at__lt=end)
+    if pid is not None:
+        rows = rows.filter(pid=pid)
+        key = ["name_ref_id", "cmdline_ref_id", "started"]
+    else:
+        name_id = (
+            ProcessName.objects.filter(digest=interning.digest(name), value=name).values_list("id", flat=True).first()
+        )
+        if name_id is None:
+            return []
+        rows = rows.filter(name_ref_id=name_id)
+        key = []
+
+    # Level 1 (ORM): one row per snapshot (and process), with its bucket
+    per_snapshot = (
+        rows.annotate(bucket=EpochBucket("captured_at", step))
+        .values("snapshot_id", "bucket", *key)
+        .annotate(cpu=Sum("cpu_percent"), mem=Sum("memory_mb"), n=Count("id"))
+        .order_by()
+    )
+    inner, params = per_snapshot.query.sql_with_params()
+    # Level 2: fold the per-snapshot totals into buckets
+    group = ", ".join(["bucket", *key])
+    sql = (
+        f"SELECT {group}, COUNT(*), MAX(n), MIN(cpu), MAX(cpu), AVG(cpu), MIN(mem), MAX(mem), AVG(mem) "
+        f"FROM ({inner}) per_snapshot GROUP BY {group} ORDER BY {', '.join([*key, 'bucket'])}"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        buckets = cursor.fetchall()
+
+    by_program = {}
+    for bucket, *rest in buckets:
+        program, stats = tuple(rest[:len(key)]), rest[len(key):]
+        samples, processes, cpu_min, cpu_max, cpu_avg, mem_min, mem_max, mem_avg = stats
+        by_program.setdefault(program, []).append({
+            "t": datetime.fromtimestamp(bucket, tz=timezone.utc),
+            "samples": samples,
+            "processes": processes,
+            "cpu_percent": _stats(cpu_min, cpu_max, cpu_avg),
+            "memory_mb": _stats(mem_min, mem_max, mem_avg),
+        })
+
+    if pid is None:
+        return [{"name": name, "points": points} for points in by_program.values()]
+
+    names = dict(ProcessName.objects.filter(id__in={p[0] for p in by_program}).values_list("id", "value"))
+    cmdlines = dict(CommandLine.objects.filter(id__in={p[1] for p in by_program}).values_list("id", "value"))
+    out = [
+        {
+            "pid": pid, "name": names[name_id], "cmdline": cmdlines.get(cmdline_id, ""), "started": started,
+            "points": points,
+        }
+        for (name_id, cmdline_id, started), points in by_program.items()
+    ]
+    # Earliest process first: the order the pid was reused in
+    out.sort(key=lambda s: s["points"][0]["t"])
+    return out
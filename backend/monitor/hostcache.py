@@ -0,0 +1,78 @@
+"""
+In-process cache of Host rows by API key and by hostname.
+
+Every agent request authenticates by API key and ingest then needs the host
+for the payload's hostname; both usually hit the same row, many times a
+second. Entries expire after MONITOR_HOST_CACHE_TTL seconds, and a Host save
+or delete in this process drops them at once (and again once the transaction
+commits). Other server processes see such a change within the TTL.
+Only found hosts are cached, so a first-time host is visible immediately.
+"""
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .models import Host
+
+
+class HostCache:
+    def __init__(self, ttl, maxsize):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self._entries = OrderedDict()   # ("key" | "name", value) -> (expires, Host)
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def by_api_key(self, api_key):
+        return self._get("key", api_key, api_key=api_key)
+
+    def by_hostname(self, hostname):
+        return self._get("name", hostname, hostname=hostname)
+
+    def _get(self, kind, value, **lookup):
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get((kind, value))
+            if entry is not None:
+                if entry[0] > now:
+                    return entry[1]
+                del self._entries[(kind, value)]
+        host = Host.objects.filter(**lookup).first()
+        if host is not None and self.ttl > 0:
+            self._remember(host, now + self.ttl)
+        return host
+
+    def _remember(self, host, expires):
+        with self._lock:
+            for key in (("key", host.api_key), ("name", host.hostname)):
+                self._entries[key] = (expires, host)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, host_id):
+        """Drop every entry for `host_id`, including ones under a key or hostname it no longer has."""
+        with self._lock:
+            stale = [key for key, (_, host) in self._entries.items() if host.pk == host_id]
+            for key in stale:
+                del self._entries[key]
+
+
+hosts = HostCache(settings.MONITOR_HOST_CACHE_TTL, settings.MONITOR_HOST_CACHE_SIZE)
+
+
+@receiver(post_save, sender=Host, dispatch_uid="monitor.hostcache.saved")
+@receiver(post_delete, sender=Host, dispatch_uid="monitor.hostcache.deleted")
+def _host_changed(sender, instance, **kwargs):
+    host_id = instance.pk
+    hosts.invalidate(host_id)
+    # A lookup between now and commit could re-cache the old row from another connection
+    transaction.on_commit(lambda: hosts.invalidate(host_id))
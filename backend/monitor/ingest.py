@@ -0,0 +1,186 @@
+import heapq
+from operator import itemgetter
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+
+from . import alerts, cache, interning, inventory, metrics, partitions, rollups, stream
+from .models import Host, LatestProcess, Snapshot, Process
+
+
+PROCESS_FIELDS = ("pid", "ppid", "name", "cpu_percent", "memory_mb", "cmdline", "started")
+
+
+class KeyframeRequired(Exception):
+    """The delta's base snapshot is unknown; the agent must send a full keyframe."""
+
+
+def resolve_processes(host, data, pending=None):
+    """
+    Return the full process list for a validated ingest payload.
+    Keyframes carry it directly; deltas are applied to the base snapshot's rows.
+    `pending` maps (host id, captured_at) to process lists not yet stored, so a
+    delta can build on an earlier item of the same batch.
+    """
+    if "processes" in data:
+        return list(data["processes"])
+
+    rows = (pending or {}).get((host.id, data["base_captured_at"]))
+    if rows is None:
+        base = (
+            Snapshot.objects.filter(host=host, captured_at=data["base_captured_at"])
+            .order_by("-id")
+            .values_list("id", "process_count")
+            .first()
+        )
+        if base is None:
+            raise KeyframeRequired("base snapshot not found")
+
+        rows = list(Process.objects.filter(snapshot_id=base[0]).with_text().values(*PROCESS_FIELDS))
+        if len(rows) != base[1]:
+            # Process detail already pruned by retention
+            raise KeyframeRequired("base snapshot has no process detail")
+
+    by_pid = {p["pid"]: p for p in rows}
+    delta = data["delta"]
+    for pid in delta["removed"]:
+        by_pid.pop(pid, None)
+    for p in delta["added"]:
+        by_pid[p["pid"]] = p
+    for p in delta["changed"]:
+        by_pid[p["pid"]] = p
+    return list(by_pid.values())
+
+
+def store_snapshot(host, data, processes):
+    return store_snapshots([(host, data, processes)])[0]
+
+
+def store_snapshots(items):
+    """
+    Store (host, validated payload, full process list) triples with one
+    Snapshot bulk insert and one Process bulk insert (COPY on PostgreSQL). Returns the snapshots in
+    input order. Call inside a transaction so a failed insert never leaves a
+    partial row set.
+    """
+    snapshots, versions = [], {}
+    for host, data, processes in items:
+        sysinfo = data["system_info"]
+        snapshots.append(Snapshot(
+            host=host,
+            captured_at=data["captured_at"],
+            # Callers resolve the version up front (409 inventory_required), so it exists by now
+            inventory=inventory.resolve(data, versions),
+            used_ram_gb=sysinfo["used_ram_gb"],
+            available_ram_gb=sysinfo["available_ram_gb"],
+            storage_used_gb=sysinfo["storage_used_gb"],
+            storage_free_gb=sysinfo["storage_free_gb"],
+            cpu_freq_mhz=sysinfo.get("cpu_freq_mhz"),
+            # Persist process count on the snapshot for quick summaries
+            process_count=len(processes),
+        ))
+    # SQLite and PostgreSQL both return the new primary keys here
+    Snapshot.objects.bulk_create(snapshots)
+
+    # Deltas are stored as full row sets too: reads rely on a snapshot's rows being complete
+    all_processes = [(snapshot, p) for snapshot, (_, _, processes) in zip(snapshots, items) for p in processes]
+    name_ids = interning.names.resolve({p["name"] for _, p in all_processes})
+    cmdline_ids = interning.cmdlines.resolve({p["cmdline"] for _, p in all_processes if p.get("cmdline")})
+    captured_at = Process._meta.get_field("captured_at")
+    db_times = {s.id: captured_at.get_db_prep_value(s.captured_at, connection) for s in snapshots}
+    rows = [
+        (
+            snapshot.id, db_times[snapshot.id], p["pid"], p["ppid"], name_ids[p["name"]], p["cpu_percent"],
+            p["memory_mb"], cmdline_ids.get(p.get("cmdline")), p.get("started"),
+        )
+        for snapshot, p in all_processes
+    ]
+    # A list, not a generator: partitions.write may run the insert twice
+    partitions.write({s.captured_at for s in snapshots}, lambda: _insert_processes(rows))
+    rollups.record(snapshots)
+
+    newest = {}
+    for snapshot, (host, data, _) in zip(snapshots, items):
+        if host.id not in newest or snapshot.captured_at >= newest[host.id][1].captured_at:
+            newest[host.id] = (host, snapshot, data)
+    advanced = []
+    for host, snapshot, data in newest.values():
+        fields = {"last_seen": snapshot.captured_at, "latest_snapshot": snapshot}
+        if "agent" in data:
+            fields["agent"] = data["agent"]
+        # Advance the host's latest pointer unless a newer snapshot already landed
+        if Host.objects.filter(pk=host.pk).filter(
+            Q(last_seen__isnull=True) | Q(last_seen__lte=snapshot.captured_at)
+        ).update(**fields):
+            advanced.append((host, snapshot))
+        cache.invalidate_host(host.hostname)
+    processes_of = {snapshot.id: processes for snapshot, (_, _, processes) in zip(snapshots, items)}
+    _refresh_latest_processes(advanced, processes_of, name_ids)
+
+    for snapshot, (host, data, processes) in zip(snapshots, items):
+        stream.publish_snapshot(host, snapshot, data, processes)
+    alerts.evaluate_on_commit([(host, snapshot, processes) for snapshot, (host, _, processes) in zip(snapshots, items)])
+    transaction.on_commit(lambda: metrics.record_ingest(len(snapshots), len(all_processes)))
+    return snapshots
+
+
+def _refresh_latest_processes(advanced, processes_of, name_ids):
+    """
+    Point the LatestProcess rows of hosts whose latest snapshot just changed
+    at its top-K processes: upsert on (host, pid), then delete the rows of
+    processes that exited or fell out of the top K. Most of a host's top K
+    survive from one tick to the next, so they are updated in place.
+    """
+    if not advanced:
+        return
+    k = settings.MONITOR_FLEET_TOP_K
+    rows = []
+    for host, snapshot in sorted(advanced, key=lambda item: item[0].id):
+        processes = processes_of[snapshot.id]
+        keep = {}
+        for metric in ("memory_mb", "cpu_percent"):
+            keep.update((p["pid"], p) for p in heapq.nlargest(k, processes, key=itemgetter(metric)))
+        rows.extend(
+            LatestProcess(
+                host_id=host.id, snapshot_id=snapshot.id, captured_at=snapshot.captured_at, pid=pid,
+                ppid=p["ppid"], name_ref_id=name_ids[p["name"]], cpu_percent=p["cpu_percent"],
+                memory_mb=p["memory_mb"],
+            )
+            # Same row order in every transaction, so concurrent upserts lock rows in the same order
+            for pid, p in sorted(keep.items())
+        )
+    LatestProcess.objects.bulk_create(
+        rows, update_conflicts=True, unique_fields=["host", "pid"],
+        update_fields=["snapshot", "captured_at", "ppid", "name_ref", "cpu_percent", "memory_mb"],
+    )
+    # Every row kept above now points at its host's new snapshot
+    LatestProcess.objects.filter(host_id__in=[host.id for host, _ in advanced]).exclude(
+        snapshot_id__in=[snapshot.id for _, snapshot in advanced]
+    ).delete()
+
+
+_PROCESS_COLUMNS = (
+    "snapshot", "captured_at", "pid", "ppid", "name_ref", "cpu_percent", "memory_mb", "cmdline_ref", "started",
+)
+
+
+def _insert_processes(rows):
+    """
+    Insert Process rows given as tuples of database values in _PROCESS_COLUMNS
+    order, skipping the model instance and per-row SQL compilation that
+    dominate bulk_create at tens of thousands of rows per batch. PostgreSQL
+    (psycopg 3) streams them with COPY; other backends use one executemany.
+    """
+    qn = connection.ops.quote_name
+    table = qn(Process._meta.db_table)
+    columns = ", ".join(qn(Process._meta.get_field(c).column) for c in _PROCESS_COLUMNS)
+    with connection.cursor() as cursor:
+        if connection.vendor == "postgresql" and hasattr(cursor.cursor, "copy"):
+            with cursor.cursor.copy(f"COPY {table} ({columns}) FROM STDIN") as copy:
+                for row in rows:
+                    copy.write_row(row)
+            return
+        if rows:
+            placeholders = ", ".join(["%s"] * len(_PROCESS_COLUMNS))
+            cursor.executemany(f"INSERT INTO {table} ({columns}) VALUES ({placeholders})", rows)
@@ -0,0 +1,108 @@
+"""
+String interning for Process.name_ref and Process.cmdline_ref.
+
+Each distinct string is stored once in ProcessName / CommandLine under a
+64-bit blake2b digest. Ingest resolves the strings of a whole batch through
+an in-process LRU of string hash -> id, so steady-state ingest (the same few
+hundred names every tick) does not touch the dictionary tables at all.
+Misses cost one SELECT plus, for strings never seen before, one INSERT.
+Ids enter the LRU only once the transaction that found or created them has
+committed, so a rolled-back insert can never be served from memory.
+
+Rows are matched on the digest but the stored value is always compared, so a
+digest collision fails the ingest with DigestCollision instead of attaching
+the wrong string. The LRU is keyed by a separate 128-bit hash for the same
+reason.
+
+Retention deletes rows no Process references any more (sweep_unreferenced in
+monitor.retention). A cached id is trusted for MONITOR_INTERN_CACHE_TTL
+seconds after the database confirmed it. The ingest that cached it also
+stored Process rows that reference it, and those outlive the TTL, so the
+sweep cannot delete a row that is still cached.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+from django.db import transaction
+
+from .models import CommandLine, ProcessName
+
+
+class DigestCollision(Exception):
+    """Two different strings share a dictionary digest."""
+
+
+def digest(value):
+    """Signed 64-bit blake2b of `value` (fits a BigIntegerField)."""
+    raw = hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(raw, "big", signed=True)
+
+
+def _cache_key(value):
+    return hashlib.blake2b(value.encode("utf-8"), digest_size=16).digest()
+
+
+class Interner:
+    def __init__(self, model, maxsize, ttl):
+        self.model = model
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._ids = OrderedDict()  # cache key -> (id, monotonic time the row was confirmed)
+        self._lock = threading.Lock()
+
+    def clear(self):
+        with self._lock:
+            self._ids.clear()
+
+    def resolve(self, values):
+        """Map each string in `values` to its dictionary row id, creating missing rows."""
+        keys = {v: _cache_key(v) for v in values}
+        ids = {}
+        missing = {}
+        oldest = time.monotonic() - self.ttl
+        with self._lock:
+            for value, key in keys.items():
+                entry = self._ids.get(key)
+                if entry is None or entry[1] < oldest:
+                    other = missing.setdefault(digest(value), value)
+                    if other != value:
+                        raise DigestCollision(f"{self.model.__name__}: {value!r} and {other!r} share a digest")
+                else:
+                    self._ids.move_to_end(key)
+                    ids[value] = entry[0]
+        if not missing:
+            return ids
+
+        found = self._lookup(missing)
+        new = [self.model(digest=key, value=value) for key, value in missing.items() if key not in found]
+        if new:
+            # A concurrent ingest may insert the same strings; keep whichever row won
+            self.model.objects.bulk_create(new, ignore_conflicts=True)
+            found.update(self._lookup({n.digest: n.value for n in new}))
+        for key, value in missing.items():
+            ids[value] = found[key]
+        confirmed = {keys[value]: (found[key], time.monotonic()) for key, value in missing.items()}
+        transaction.on_commit(lambda: self._remember(confirmed))
+        return ids
+
+    def _lookup(self, wanted):
+        """digest -> id for the rows of `wanted` (digest -> value) that exist, checking their values."""
+        found = {}
+        for key, id_, value in self.model.objects.filter(digest__in=wanted).values_list("digest", "id", "value"):
+            if value != wanted[key]:
+                raise DigestCollision(f"{self.model.__name__} {id_} has the digest of {wanted[key]!r} but holds {value!r}")
+            found[key] = id_
+        return found
+
+    def _remember(self, confirmed):
+        with self._lock:
+            self._ids.update(confirmed)
+            while len(self._ids) > self.maxsize:
+                self._ids.popitem(last=False)
+
+
+names = Interner(ProcessName, settings.MONITOR_INTERN_CACHE_SIZE, settings.MONITOR_INTERN_CACHE_TTL)
+cmdlines = Interner(CommandLine, settings.MONITOR_INTERN_CACHE_SIZE, settings.MONITOR_INTERN_CACHE_TTL)
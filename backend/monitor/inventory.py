@@ -0,0 +1,101 @@
+"""
+Versioned static host inventory (OS, processor, cores, threads, RAM and disk size).
+
+These facts change maybe once a year, so they are stored once per distinct
+combination in HostInventory, keyed by a 64-bit blake2b digest of a
+canonical JSON form. Snapshots reference the version that was current. The
+agent computes the same digest and sends `inventory` only when it changes;
+otherwise it sends just `inventory_hash`. An unknown hash is answered with
+409 `inventory_required`, and the agent resends the full inventory.
+
+Versions are cached in-process by digest once the transaction that found
+or created them has committed.
+"""
+import hashlib
+import json
+import threading
+
+from django.db import IntegrityError, transaction
+
+from .models import HostInventory
+
+FIELDS = ("os", "processor", "cores", "threads", "ram_gb", "storage_total_gb")
+_CACHE_SIZE = 10000
+
+
+class InventoryRequired(Exception):
+    """The payload's inventory_hash is unknown; the agent must send the full inventory."""
+
+
+def canonical(inventory):
+    """Normalized, sorted-key JSON of the static fields (what the digest covers)."""
+    doc = {
+        "os": str(inventory["os"]),
+        "processor": str(inventory.get("processor") or ""),
+        "cores": int(inventory["cores"]),
+        "threads": int(inventory["threads"]),
+        "ram_gb": float(inventory["ram_gb"]),
+        "storage_total_gb": float(inventory["storage_total_gb"]),
+    }
+    return json.dumps(doc, sort_keys=True, separators=(",", ":"))
+
+
+def digest_hex(inventory):
+    """The agent-visible version id: 16 hex characters."""
+    return hashlib.blake2b(canonical(inventory).encode("utf-8"), digest_size=8).hexdigest()
+
+
+def _key(hex_digest):
+    # Signed so it fits a BigIntegerField
+    return int.from_bytes(bytes.fromhex(hex_digest), "big", signed=True)
+
+
+_versions = {}
+_lock = threading.Lock()
+
+
+def clear():
+    with _lock:
+        _versions.clear()
+
+
+def resolve(data, pending=None):
+    """
+    HostInventory for a validated ingest payload: from its `inventory`
+    (created on first sight) or its `inventory_hash`. Raises InventoryRequired
+    for a hash the backend has never stored.
+
+    `pending` maps digests to versions already resolved in the current
+    transaction, which the process-wide cache only learns about on commit.
+    """
+    sent = data.get("inventory")
+    key = _key(digest_hex(sent) if sent is not None else data["inventory_hash"])
+    with _lock:
+        found = _versions.get(key)
+    if found is None and pending is not None:
+        found = pending.get(key)
+    if found is not None:
+        return found
+
+    found = HostInventory.objects.filter(digest=key).first()
+    if found is None:
+        if sent is None:
+            raise InventoryRequired("unknown inventory_hash")
+        fields = json.loads(canonical(sent))
+        try:
+            with transaction.atomic():
+                found = HostInventory.objects.create(digest=key, **fields)
+        except IntegrityError:
+            # A concurrent ingest stored the same version first
+            found = HostInventory.objects.get(digest=key)
+    if pending is not None:
+        pending[key] = found
+    transaction.on_commit(lambda: _remember(key, found))
+    return found
+
+
+def _remember(key, version):
+    with _lock:
+        if len(_versions) >= _CACHE_SIZE:
+            _versions.clear()
+        _versions[key] = version
@@ -0,0 +1,26 @@
+import json
+
+from django.core.management.base import BaseCommand
+
+from monitor import retention
+
+
+class Command(BaseCommand):
+    help = "Prune old Process rows and thin old Snapshots per settings.MONITOR_RETENTION."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--dry-run", action="store_true", help="Only count what would be deleted.")
+        parser.add_argument("--process-detail-hours", type=float, help="Keep Process rows this many hours.")
+        parser.add_argument("--minute-after-hours", type=float, help="Thin to one snapshot per minute after this many hours.")
+        parser.add_argument("--hour-after-days", type=float, help="Thin to one snapshot per hour after this many days.")
+        parser.add_argument("--batch-size", type=int, help="Rows deleted per transaction.")
+
+    def handle(self, *args, **options):
+        report = retention.run(
+            dry_run=options["dry_run"],
+            PROCESS_DETAIL_HOURS=options["process_detail_hours"],
+            MINUTE_AFTER_HOURS=options["minute_after_hours"],
+            HOUR_AFTER_DAYS=options["hour_after_days"],
+            BATCH_SIZE=options["batch_size"],
+        )
+        self.stdout.write(json.dumps(report))
@@ -0,0 +1,57 @@
+import json
+
+from django.core.management.base import BaseCommand
+from django.test.utils import setup_test_environment, teardown_test_environment
+from django.test.runner import DiscoverRunner
+
+from monitor import bench
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark ingest and read endpoints with a synthetic fleet; prints a JSON report. "
+        "Without --url it uses the test client on a throwaway test database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--hosts", type=int, default=10, help="Agents in the synthetic fleet.")
+        parser.add_argument("--processes", type=int, default=300, help="Processes per host.")
+        parser.add_argument("--churn", type=float, default=0.02, help="Fraction of processes replaced per tick.")
+        parser.add_argument("--cmdline-length", type=int, default=120, help="Characters per command line (0 = none).")
+        parser.add_argument("--ticks", type=int, default=10, help="Snapshots sent per host.")
+        parser.add_argument("--reads", type=int, default=20, help="Rounds of read requests after ingest.")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--url", help="Benchmark a running server (e.g. http://127.0.0.1:8000) instead.")
+        parser.add_argument("--concurrency", type=int, default=1, help="Concurrent agents (--url only).")
+        parser.add_argument("--codec", action="store_true", help="Only time JSON parse/validate/render, DRF vs fast path.")
+        parser.add_argument("--output", help="Also write the report to this file.")
+
+    def handle(self, *args, **options):
+        fleet = bench.SyntheticFleet(
+            hosts=options["hosts"],
+            processes=options["processes"],
+            churn=options["churn"],
+            cmdline_length=options["cmdline_length"],
+            seed=options["seed"],
+        )
+        if options["codec"]:
+            report = bench.codec(fleet)
+        elif options["url"]:
+            report = bench.run(
+                bench.ServerTarget(options["url"], options["concurrency"]), fleet, options["ticks"], options["reads"]
+            )
+        else:
+            setup_test_environment()
+            runner = DiscoverRunner(verbosity=0, interactive=False)
+            databases = runner.setup_databases()
+            try:
+                report = bench.run(bench.ClientTarget(), fleet, options["ticks"], options["reads"])
+            finally:
+                runner.teardown_databases(databases)
+                teardown_test_environment()
+
+        text = json.dumps(report, indent=2)
+        if options["output"]:
+            with open(options["output"], "w", encoding="utf-8") as f:
+                f.write(text + "\n")
+        self.stdout.write(text)
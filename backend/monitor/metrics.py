@@ -0,0 +1,226 @@
+"""
+Request, database and ingest metrics in the Prometheus text format (/metrics).
+
+MetricsMiddleware times every request per view. It counts the request's SQL
+queries and their time through connection.execute_wrapper. store_snapshots
+counts stored snapshots and processes, so throughput is
+rate(monitor_ingest_snapshots_total). The ingest views time serializer
+validation. Queue depths are read when /metrics is scraped.
+
+Values live in memory per server process. Recording costs a bisect and a
+few additions under the metric's lock, so it can stay on under full ingest
+load (MONITOR_METRICS = False removes the middleware). With several worker
+processes, each one exports its own numbers.
+"""
+import bisect
+import threading
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500)
+
+_registry = []
+
+
+def _escape(value):
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class _Metric:
+    kind = None
+
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+        _registry.append(self)
+
+    def _labels(self, values, *extra):
+        """Label set text for `values` (in self.labels order) plus extra (name, value) pairs."""
+        pairs = [f'{name}="{_escape(value)}"' for name, value in (*zip(self.labels, values), *extra)]
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def clear(self):
+        with self._lock:
+            self._values.clear()
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, labels=()):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+
+    def value(self, labels=()):
+        with self._lock:
+            return self._values.get(labels, 0)
+
+    def samples(self):
+        with self._lock:
+            items = sorted(self._values.items())
+        for values, total in items:
+            yield f"{self.name}{self._labels(values)} {total}"
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets = tuple(buckets)
+
+    def observe(self, value, labels=()):
+        i = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            state[0][i] += 1
+            state[1] += value
+            state[2] += 1
+
+    def count(self, labels=()):
+        with self._lock:
+            state = self._values.get(labels)
+            return state[2] if state else 0
+
+    def samples(self):
+        with self._lock:
+            items = sorted((values, [list(state[0]), state[1], state[2]]) for values, state in self._values.items())
+        for values, (counts, total, n) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(float(bound))
+                yield f"{self.name}_bucket{self._labels(values, ('le', le))} {cumulative}"
+            yield f"{self.name}_sum{self._labels(values)} {total}"
+            yield f"{self.name}_count{self._labels(values)} {n}"
+
+
+class Gauge(_Metric):
+    """Read from `read()` at scrape time; nothing to record on the hot path."""
+
+    kind = "gauge"
+
+    def __init__(self, name, help, read):
+        super().__init__(name, help)
+        self.read = read
+
+    def samples(self):
+        value = self.read()
+        if value is not None:
+            yield f"{self.name} {value}"
+
+
+REQUEST_SECONDS = Histogram(
+    "monitor_http_request_duration_seconds", "Request latency by view, method and status.", ("view", "method", "status")
+)
+DB_QUERIES = Counter("monitor_db_queries_total", "SQL queries run by requests, by view.", ("view",))
+DB_SECONDS = Counter("monitor_db_query_duration_seconds_total", "Time spent in SQL queries by requests, by view.", ("view",))
+DB_QUERIES_PER_REQUEST = Histogram(
+    "monitor_db_queries_per_request", "SQL queries per request, by view.", ("view",), buckets=QUERY_COUNT_BUCKETS
+)
+VALIDATION_SECONDS = Histogram(
+    "monitor_serializer_validation_seconds", "Ingest payload validation time, by serializer.", ("serializer",)
+)
+INGEST_SNAPSHOTS = Counter("monitor_ingest_snapshots_total", "Snapshots stored (sync, batch and async writer).")
+INGEST_PROCESSES = Counter("monitor_ingest_processes_total", "Process rows stored.")
+
+
+def _queue_depth():
+    from .writer import current_writer
+
+    writer = current_writer()
+    return writer.depth() if writer is not None else 0
+
+
+def _webhook_depth():
+    from .alerts import webhook
+
+    return webhook.queue.qsize()
+
+
+def _subscribers():
+    from .stream import broker
+
+    return broker.subscriber_count()
+
+
+Gauge("monitor_ingest_queue_depth", "Snapshots waiting for the async ingest writer.", _queue_depth)
+Gauge("monitor_alert_webhook_queue_depth", "Alert events waiting for webhook delivery.", _webhook_depth)
+Gauge("monitor_stream_subscribers", "Open /api/v1/stream connections.", _subscribers)
+
+
+def record_ingest(snapshots, processes):
+    INGEST_SNAPSHOTS.inc(snapshots)
+    INGEST_PROCESSES.inc(processes)
+
+
+def validate(serializer):
+    """serializer.is_valid(), timed."""
+    started = time.perf_counter()
+    try:
+        return serializer.is_valid()
+    finally:
+        VALIDATION_SECONDS.observe(time.perf_counter() - started, (type(serializer).__name__,))
+
+
+def render():
+    lines = []
+    for metric in _registry:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        lines.extend(metric.samples())
+    return "\n".join(lines) + "\n"
+
+
+def reset():
+    for metric in _registry:
+        metric.clear()
+
+
+def _view_label(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unmatched"
+    # Unnamed routes: view_name is the view's dotted path (monitor.views.ingest)
+    return match.url_name or match.view_name.rpartition(".")[2]
+
+
+class MetricsMiddleware:
+    """Per-view latency histogram plus SQL query count and time of every request."""
+
+    def __init__(self, get_response):
+        if not settings.MONITOR_METRICS:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+
+    def __call__(self, request):
+        queries = [0, 0.0]
+
+        def count(execute, sql, params, many, context):
+            started = time.perf_counter()
+            try:
+                return execute(sql, params, many, context)
+            finally:
+                queries[0] += 1
+                queries[1] += time.perf_counter() - started
+
+        started = time.perf_counter()
+        with connection.execute_wrapper(count):
+            response = self.get_response(request)
+        elapsed = time.perf_counter() - started
+
+        view = (_view_label(request),)
+        REQUEST_SECONDS.observe(elapsed, (view[0], request.method, str(response.status_code)))
+        DB_QUERIES.inc(queries[0], view)
+        DB_SECONDS.inc(queries[1], view)
+        DB_QUERIES_PER_REQUEST.observe(queries[0], view)
+        return response
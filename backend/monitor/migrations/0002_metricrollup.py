@@ -0,0 +1,43 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:01
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='MetricRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('resolution', models.IntegerField()),
+                ('bucket_start', models.DateTimeField()),
+                ('samples', models.IntegerField(default=0)),
+                ('used_ram_gb_min', models.FloatField()),
+                ('used_ram_gb_max', models.FloatField()),
+                ('used_ram_gb_sum', models.FloatField()),
+                ('available_ram_gb_min', models.FloatField()),
+                ('available_ram_gb_max', models.FloatField()),
+                ('available_ram_gb_sum', models.FloatField()),
+                ('storage_used_gb_min', models.FloatField()),
+                ('storage_used_gb_max', models.FloatField()),
+                ('storage_used_gb_sum', models.FloatField()),
+                ('storage_free_gb_min', models.FloatField()),
+                ('storage_free_gb_max', models.FloatField()),
+                ('storage_free_gb_sum', models.FloatField()),
+                ('cpu_freq_mhz_min', models.FloatField(blank=True, null=True)),
+                ('cpu_freq_mhz_max', models.FloatField(blank=True, null=True)),
+                ('cpu_freq_mhz_sum', models.FloatField(default=0)),
+                ('cpu_freq_mhz_samples', models.IntegerField(default=0)),
+                ('host', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='rollups', to='monitor.host')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('host', 'resolution', 'bucket_start'), name='uniq_rollup_bucket')],
+            },
+        ),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_latest(apps, schema_editor):
+    Host = apps.get_model('monitor', 'Host')
+    Snapshot = apps.get_model('monitor', 'Snapshot')
+    for host in Host.objects.all():
+        snap = Snapshot.objects.filter(host=host).order_by('-captured_at').first()
+        if snap is not None:
+            host.last_seen = snap.captured_at
+            host.latest_snapshot = snap
+            host.save(update_fields=['last_seen', 'latest_snapshot'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0002_metricrollup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='host',
+            name='last_seen',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='host',
+            name='latest_snapshot',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='monitor.snapshot'),
+        ),
+        migrations.AddIndex(
+            model_name='snapshot',
+            index=models.Index(fields=['host', 'captured_at'], name='snapshot_host_captured_idx'),
+        ),
+        migrations.RunPython(backfill_latest, migrations.RunPython.noop),
+    ]
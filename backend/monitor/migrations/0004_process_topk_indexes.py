@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:07
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0003_host_latest_snapshot'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='process',
+            index=models.Index(fields=['snapshot', 'memory_mb'], name='process_snapshot_mem_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='process',
+            index=models.Index(fields=['snapshot', 'cpu_percent'], name='process_snapshot_cpu_idx'),
+        ),
+    ]
@@ -0,0 +1,95 @@
+import hashlib
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def _digest(value):
+    # Same as monitor.interning.digest, frozen here for the migration
+    raw = hashlib.blake2b(value.encode("utf-8"), digest_size=8).digest()
+    return int.from_bytes(raw, "big", signed=True)
+
+
+def intern_existing(apps, schema_editor):
+    Process = apps.get_model("monitor", "Process")
+    ProcessName = apps.get_model("monitor", "ProcessName")
+    CommandLine = apps.get_model("monitor", "CommandLine")
+
+    for value in Process.objects.values_list("name", flat=True).distinct().iterator():
+        ref = ProcessName.objects.get_or_create(digest=_digest(value), defaults={"value": value})[0]
+        Process.objects.filter(name=value).update(name_ref=ref)
+    for value in Process.objects.exclude(cmdline="").values_list("cmdline", flat=True).distinct().iterator():
+        ref = CommandLine.objects.get_or_create(digest=_digest(value), defaults={"value": value})[0]
+        Process.objects.filter(cmdline=value).update(cmdline_ref=ref)
+
+
+def restore_text(apps, schema_editor):
+    Process = apps.get_model("monitor", "Process")
+    ProcessName = apps.get_model("monitor", "ProcessName")
+    CommandLine = apps.get_model("monitor", "CommandLine")
+
+    for ref in ProcessName.objects.iterator():
+        Process.objects.filter(name_ref=ref).update(name=ref.value)
+    for ref in CommandLine.objects.iterator():
+        Process.objects.filter(cmdline_ref=ref).update(cmdline=ref.value)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0004_process_topk_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ProcessName',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.BigIntegerField(unique=True)),
+                ('value', models.CharField(max_length=255)),
+            ],
+        ),
+        migrations.CreateModel(
+            name='CommandLine',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.BigIntegerField(unique=True)),
+                ('value', models.TextField()),
+            ],
+        ),
+        migrations.AddField(
+            model_name='process',
+            name='name_ref',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='monitor.processname'),
+        ),
+        migrations.AddField(
+            model_name='process',
+            name='cmdline_ref',
+            field=models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='monitor.commandline'),
+        ),
+        migrations.RunPython(intern_existing, restore_text),
+        # Defaults only matter when unapplying: the re-added columns are filled by restore_text
+        migrations.AlterField(
+            model_name='process',
+            name='name',
+            field=models.CharField(default='', max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='process',
+            name='cmdline',
+            field=models.TextField(blank=True, default=''),
+        ),
+        migrations.RemoveField(
+            model_name='process',
+            name='name',
+        ),
+        migrations.RemoveField(
+            model_name='process',
+            name='cmdline',
+        ),
+        migrations.AlterField(
+            model_name='process',
+            name='name_ref',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='monitor.processname'),
+        ),
+    ]
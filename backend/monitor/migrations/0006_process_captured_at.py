@@ -0,0 +1,34 @@
+from django.db import migrations, models
+
+
+def copy_captured_at(apps, schema_editor):
+    Process = apps.get_model("monitor", "Process")
+    Snapshot = apps.get_model("monitor", "Snapshot")
+    Process.objects.update(
+        captured_at=models.Subquery(Snapshot.objects.filter(id=models.OuterRef("snapshot_id")).values("captured_at")[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0005_intern_process_strings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='process',
+            name='captured_at',
+            field=models.DateTimeField(null=True),
+        ),
+        migrations.RunPython(copy_captured_at, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='process',
+            name='captured_at',
+            field=models.DateTimeField(),
+        ),
+        migrations.AddIndex(
+            model_name='process',
+            index=models.Index(fields=['captured_at'], name='process_captured_idx'),
+        ),
+    ]
@@ -0,0 +1,72 @@
+from datetime import datetime, time, timedelta, timezone
+
+from django.db import migrations
+
+OLD = "monitor_process_unpartitioned"
+
+
+def _create_partition_sql(day):
+    # Same as monitor.partitions.create_sql, frozen here for the migration
+    start = datetime.combine(day, time.min, tzinfo=timezone.utc)
+    end = start + timedelta(days=1)
+    return (
+        f'CREATE TABLE IF NOT EXISTS "monitor_process_p{day:%Y%m%d}" PARTITION OF "monitor_process" '
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    )
+
+
+def partition_process(apps, schema_editor):
+    """
+    PostgreSQL only: rebuild monitor_process as a table range-partitioned by
+    captured_at, with one partition per day of existing data. The primary key
+    becomes (id, captured_at), since a partitioned table's unique constraints
+    must include the partition key; ids still come from one sequence.
+    """
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute(f'ALTER TABLE monitor_process RENAME TO "{OLD}"')
+        cursor.execute(
+            "SELECT indexdef FROM pg_indexes WHERE tablename = %s AND indexname NOT LIKE %s", [OLD, "%_pkey"]
+        )
+        indexes = [row[0] for row in cursor.fetchall()]
+        cursor.execute(
+            "SELECT conname, pg_get_constraintdef(oid) FROM pg_constraint WHERE conrelid = %s::regclass AND contype = 'f'",
+            [OLD],
+        )
+        foreign_keys = cursor.fetchall()
+
+        cursor.execute(
+            f'CREATE TABLE monitor_process (LIKE "{OLD}" INCLUDING DEFAULTS) PARTITION BY RANGE (captured_at)'
+        )
+        cursor.execute(f'SELECT min(captured_at), max(captured_at) FROM "{OLD}"')
+        first, last = cursor.fetchone()
+        if first is not None:
+            day, last_day = first.astimezone(timezone.utc).date(), last.astimezone(timezone.utc).date()
+            while day <= last_day:
+                cursor.execute(_create_partition_sql(day))
+                day += timedelta(days=1)
+        cursor.execute(f'INSERT INTO monitor_process SELECT * FROM "{OLD}"')
+        cursor.execute(f'DROP TABLE "{OLD}"')
+
+        cursor.execute("CREATE SEQUENCE monitor_process_id_seq OWNED BY monitor_process.id")
+        cursor.execute("SELECT setval('monitor_process_id_seq', COALESCE(max(id), 0) + 1, false) FROM monitor_process")
+        cursor.execute("ALTER TABLE monitor_process ALTER COLUMN id SET DEFAULT nextval('monitor_process_id_seq')")
+        cursor.execute("ALTER TABLE monitor_process ADD PRIMARY KEY (id, captured_at)")
+        for definition in indexes:
+            cursor.execute(definition.replace(f"public.{OLD}", "monitor_process").replace(f"ON {OLD}", "ON monitor_process"))
+        for name, definition in foreign_keys:
+            cursor.execute(f'ALTER TABLE monitor_process ADD CONSTRAINT "{name}" {definition}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0006_process_captured_at'),
+    ]
+
+    operations = [
+        # Not reversible in place: the ORM schema is identical either way, so going
+        # back only leaves the table partitioned.
+        migrations.RunPython(partition_process, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:25
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0007_partition_process'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='process',
+            index=models.Index(fields=['snapshot', 'name_ref'], name='process_snapshot_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='process',
+            index=models.Index(fields=['snapshot', 'pid'], name='process_snapshot_pid_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:26
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def fill_latest_processes(apps, schema_editor):
+    Host = apps.get_model("monitor", "Host")
+    Process = apps.get_model("monitor", "Process")
+    LatestProcess = apps.get_model("monitor", "LatestProcess")
+    k = settings.MONITOR_FLEET_TOP_K
+    for host_id, snapshot_id in Host.objects.filter(latest_snapshot__isnull=False).values_list("id", "latest_snapshot_id"):
+        rows = Process.objects.filter(snapshot_id=snapshot_id)
+        keep = {}
+        for order in ("-memory_mb", "-cpu_percent"):
+            # By pid, as ingest does: a keyframe may list a pid twice
+            keep.update((p.pid, p) for p in rows.order_by(order, "id")[:k])
+        LatestProcess.objects.bulk_create(
+            LatestProcess(
+                host_id=host_id, snapshot_id=snapshot_id, captured_at=p.captured_at, pid=p.pid, ppid=p.ppid,
+                name_ref_id=p.name_ref_id, cpu_percent=p.cpu_percent, memory_mb=p.memory_mb,
+            )
+            for p in keep.values()
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0008_process_history_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='LatestProcess',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('captured_at', models.DateTimeField()),
+                ('pid', models.IntegerField()),
+                ('ppid', models.IntegerField()),
+                ('cpu_percent', models.FloatField()),
+                ('memory_mb', models.FloatField()),
+                ('host', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='monitor.host')),
+                ('name_ref', models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='monitor.processname')),
+                ('snapshot', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='monitor.snapshot')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['memory_mb'], name='latest_process_mem_idx'), models.Index(fields=['cpu_percent'], name='latest_process_cpu_idx')],
+            },
+        ),
+        migrations.RunPython(fill_latest_processes, migrations.RunPython.noop),
+    ]
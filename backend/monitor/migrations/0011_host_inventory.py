@@ -0,0 +1,131 @@
+import hashlib
+import json
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+FIELDS = ("os", "processor", "cores", "threads", "ram_gb", "storage_total_gb")
+
+
+def _canonical(values):
+    # Same as monitor.inventory.canonical, frozen here for the migration
+    doc = {
+        "os": str(values["os"]),
+        "processor": str(values["processor"] or ""),
+        "cores": int(values["cores"]),
+        "threads": int(values["threads"]),
+        "ram_gb": float(values["ram_gb"]),
+        "storage_total_gb": float(values["storage_total_gb"]),
+    }
+    return doc, json.dumps(doc, sort_keys=True, separators=(",", ":"))
+
+
+def version_existing(apps, schema_editor):
+    Snapshot = apps.get_model("monitor", "Snapshot")
+    HostInventory = apps.get_model("monitor", "HostInventory")
+
+    for values in Snapshot.objects.values(*FIELDS).distinct().iterator():
+        doc, text = _canonical(values)
+        raw = hashlib.blake2b(text.encode("utf-8"), digest_size=8).digest()
+        version = HostInventory.objects.get_or_create(digest=int.from_bytes(raw, "big", signed=True), defaults=doc)[0]
+        match = {f: v for f, v in values.items() if f != "processor"}
+        if values["processor"] is None:
+            match["processor__isnull"] = True
+        else:
+            match["processor"] = values["processor"]
+        Snapshot.objects.filter(**match).update(inventory=version)
+
+
+def restore_fields(apps, schema_editor):
+    Snapshot = apps.get_model("monitor", "Snapshot")
+    HostInventory = apps.get_model("monitor", "HostInventory")
+
+    for version in HostInventory.objects.iterator():
+        Snapshot.objects.filter(inventory=version).update(**{f: getattr(version, f) for f in FIELDS})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0010_alerts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='HostInventory',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('digest', models.BigIntegerField(unique=True)),
+                ('os', models.CharField(max_length=255)),
+                ('processor', models.CharField(blank=True, default='', max_length=255)),
+                ('cores', models.IntegerField()),
+                ('threads', models.IntegerField()),
+                ('ram_gb', models.FloatField()),
+                ('storage_total_gb', models.FloatField()),
+            ],
+            options={
+                'verbose_name_plural': 'host inventories',
+            },
+        ),
+        migrations.AddField(
+            model_name='snapshot',
+            name='inventory',
+            field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.PROTECT, related_name='+', to='monitor.hostinventory'),
+        ),
+        migrations.RunPython(version_existing, restore_fields),
+        # Defaults only matter when unapplying: the re-added columns are filled by restore_fields
+        migrations.AlterField(
+            model_name='snapshot',
+            name='os',
+            field=models.CharField(default='', max_length=255),
+        ),
+        migrations.AlterField(
+            model_name='snapshot',
+            name='cores',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='snapshot',
+            name='threads',
+            field=models.IntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='snapshot',
+            name='ram_gb',
+            field=models.FloatField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='snapshot',
+            name='storage_total_gb',
+            field=models.FloatField(default=0),
+        ),
+        migrations.RemoveField(
+            model_name='snapshot',
+            name='os',
+        ),
+        migrations.RemoveField(
+            model_name='snapshot',
+            name='processor',
+        ),
+        migrations.RemoveField(
+            model_name='snapshot',
+            name='cores',
+        ),
+        migrations.RemoveField(
+            model_name='snapshot',
+            name='threads',
+        ),
+        migrations.RemoveField(
+            model_name='snapshot',
+            name='ram_gb',
+        ),
+        migrations.RemoveField(
+            model_name='snapshot',
+            name='storage_total_gb',
+        ),
+        migrations.AlterField(
+            model_name='snapshot',
+            name='inventory',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.PROTECT, related_name='+', to='monitor.hostinventory'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 11:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0011_host_inventory'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='host',
+            name='agent',
+            field=models.JSONField(blank=True, null=True),
+        ),
+    ]
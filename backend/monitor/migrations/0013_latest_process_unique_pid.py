@@ -0,0 +1,30 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:09
+
+from django.db import migrations, models
+
+
+def drop_duplicate_pids(apps, schema_editor):
+    # 0009's backfill keyed rows by Process id, so a snapshot that listed a pid twice left two rows
+    LatestProcess = apps.get_model("monitor", "LatestProcess")
+    dupes = (
+        LatestProcess.objects.values("host_id", "pid")
+        .annotate(keep=models.Min("id"), n=models.Count("id"))
+        .filter(n__gt=1)
+    )
+    for row in dupes:
+        LatestProcess.objects.filter(host_id=row["host_id"], pid=row["pid"]).exclude(id=row["keep"]).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0012_host_agent'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_duplicate_pids, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='latestprocess',
+            constraint=models.UniqueConstraint(fields=('host', 'pid'), name='uniq_latest_process_pid'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.5 on 2026-10-18 12:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('monitor', '0013_latest_process_unique_pid'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='process',
+            name='started',
+            field=models.BigIntegerField(blank=True, null=True),
+        ),
+    ]
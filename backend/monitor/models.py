@@ -1,10 +1,20 @@
+from django.core.exceptions import ValidationError
 from django.db import models
+from django.db.models.functions import Coalesce
 
 
 class Host(models.Model):
     hostname = models.CharField(max_length=255, unique=True)
     api_key = models.CharField(max_length=255, unique=True)  # one API key per host
 
+    # Maintained by ingest so host listings never scan Snapshot history
+    last_seen = models.DateTimeField(blank=True, null=True)
+    latest_snapshot = models.ForeignKey(
+        "Snapshot", on_delete=models.SET_NULL, blank=True, null=True, related_name="+"
+    )
+    # The agent's self-telemetry as of latest_snapshot (timings, CPU use, governor state)
+    agent = models.JSONField(blank=True, null=True)
+
     def __str__(self):
         return self.hostname
     
@@ -12,19 +22,35 @@ class Host(models.Model):
     def is_authenticated(self):
         return True
 
-class Snapshot(models.Model):
-    host = models.ForeignKey(Host, on_delete=models.CASCADE, related_name="snapshots")
-    captured_at = models.DateTimeField()
-
-    # --- System Info ---
+class HostInventory(models.Model):
+    """
+    Static host facts, stored once per distinct combination under a digest of
+    their canonical form (monitor.inventory). Snapshots point at the version
+    that was current when they were taken.
+    """
+    digest = models.BigIntegerField(unique=True)
     os = models.CharField(max_length=255)
-    processor = models.CharField(max_length=255, blank=True, null=True)
+    processor = models.CharField(max_length=255, blank=True, default="")
     cores = models.IntegerField()
     threads = models.IntegerField()
     ram_gb = models.FloatField()
+    storage_total_gb = models.FloatField()
+
+    class Meta:
+        verbose_name_plural = "host inventories"
+
+    def __str__(self):
+        return f"{self.os} / {self.cores}c {self.threads}t / {self.ram_gb} GB"
+
+
+class Snapshot(models.Model):
+    host = models.ForeignKey(Host, on_delete=models.CASCADE, related_name="snapshots")
+    captured_at = models.DateTimeField()
+
+    # --- System Info (static facts live in the inventory version) ---
+    inventory = models.ForeignKey(HostInventory, on_delete=models.PROTECT, related_name="+")
     used_ram_gb = models.FloatField()
     available_ram_gb = models.FloatField()
-    storage_total_gb = models.FloatField()
     storage_used_gb = models.FloatField()
     storage_free_gb = models.FloatField()
     cpu_freq_mhz = models.FloatField(blank=True, null=True)
@@ -32,18 +58,186 @@ class Snapshot(models.Model):
     # --- Meta ---
     process_count = models.IntegerField(default=0)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=["host", "captured_at"], name="snapshot_host_captured_idx"),
+        ]
+
     def __str__(self):
         return f"Snapshot {self.id} of {self.host.hostname} at {self.captured_at}"
 
 
+class ProcessName(models.Model):
+    """Interned process name: Process rows point here instead of repeating the string."""
+    digest = models.BigIntegerField(unique=True)  # monitor.interning.digest(value)
+    value = models.CharField(max_length=255)
+
+    def __str__(self):
+        return self.value
+
+
+class CommandLine(models.Model):
+    """Interned command line (unique index on a digest: the text itself can be up to 8 KB)."""
+    digest = models.BigIntegerField(unique=True)
+    value = models.TextField()
+
+    def __str__(self):
+        return self.value
+
+
+class ProcessQuerySet(models.QuerySet):
+    def with_text(self):
+        """Annotate `name` and `cmdline` strings from the dictionary tables."""
+        return self.annotate(
+            name=models.F("name_ref__value"),
+            cmdline=Coalesce(models.F("cmdline_ref__value"), models.Value(""), output_field=models.TextField()),
+        )
+
+
 class Process(models.Model):
     snapshot = models.ForeignKey(Snapshot, on_delete=models.CASCADE, related_name="processes")
+    # Copy of snapshot.captured_at: retention filters on it without a join, and on
+    # PostgreSQL it is the range partition key (see monitor/partitions.py)
+    captured_at = models.DateTimeField()
     pid = models.IntegerField()
     ppid = models.IntegerField()
-    name = models.CharField(max_length=255)
+    name_ref = models.ForeignKey(ProcessName, on_delete=models.PROTECT, related_name="+")
     cpu_percent = models.FloatField()
     memory_mb = models.FloatField()
-    cmdline = models.TextField(blank=True)
+    # Null when the agent sent no (or an empty) command line
+    cmdline_ref = models.ForeignKey(CommandLine, on_delete=models.PROTECT, blank=True, null=True, related_name="+")
+    # Process start time (epoch seconds) as reported by the agent; null from older agents
+    started = models.BigIntegerField(blank=True, null=True)
+
+    objects = ProcessQuerySet.as_manager()
+
+    class Meta:
+        indexes = [
+            # Top-K reads: WHERE snapshot_id = ? ORDER BY memory_mb/cpu_percent DESC LIMIT k
+            models.Index(fields=["snapshot", "memory_mb"], name="process_snapshot_mem_idx"),
+            models.Index(fields=["snapshot", "cpu_percent"], name="process_snapshot_cpu_idx"),
+            models.Index(fields=["captured_at"], name="process_captured_idx"),
+            # Process history (monitor.history): one host's snapshots probed for a name or a pid
+            models.Index(fields=["snapshot", "name_ref"], name="process_snapshot_name_idx"),
+            models.Index(fields=["snapshot", "pid"], name="process_snapshot_pid_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.name_ref} (PID {self.pid})"
+
+
+class LatestProcess(models.Model):
+    """
+    Each host's heaviest processes (top MONITOR_FLEET_TOP_K by memory and by
+    CPU) from its latest snapshot, upserted by ingest on (host, pid) whenever
+    that snapshot changes. Fleet-wide top-N reads one small indexed table
+    instead of every host's process list.
+    """
+    host = models.ForeignKey(Host, on_delete=models.CASCADE, related_name="+")
+    snapshot = models.ForeignKey(Snapshot, on_delete=models.CASCADE, related_name="+")
+    captured_at = models.DateTimeField()
+    pid = models.IntegerField()
+    ppid = models.IntegerField()
+    name_ref = models.ForeignKey(ProcessName, on_delete=models.PROTECT, related_name="+")
+    cpu_percent = models.FloatField()
+    memory_mb = models.FloatField()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["memory_mb"], name="latest_process_mem_idx"),
+            models.Index(fields=["cpu_percent"], name="latest_process_cpu_idx"),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=["host", "pid"], name="uniq_latest_process_pid"),
+        ]
+
+    def __str__(self):
+        return f"{self.name_ref} (PID {self.pid}) on {self.host}"
+
+
+class MetricRollup(models.Model):
+    """
+    Per-host min/max/sum of the Snapshot gauges over one time bucket.
+    Maintained incrementally by monitor.rollups at ingest; avg = sum / samples.
+    """
+    host = models.ForeignKey(Host, on_delete=models.CASCADE, related_name="rollups")
+    resolution = models.IntegerField()  # bucket width in seconds (60, 3600, 86400)
+    bucket_start = models.DateTimeField()
+    samples = models.IntegerField(default=0)
+
+    used_ram_gb_min = models.FloatField()
+    used_ram_gb_max = models.FloatField()
+    used_ram_gb_sum = models.FloatField()
+    available_ram_gb_min = models.FloatField()
+    available_ram_gb_max = models.FloatField()
+    available_ram_gb_sum = models.FloatField()
+    storage_used_gb_min = models.FloatField()
+    storage_used_gb_max = models.FloatField()
+    storage_used_gb_sum = models.FloatField()
+    storage_free_gb_min = models.FloatField()
+    storage_free_gb_max = models.FloatField()
+    storage_free_gb_sum = models.FloatField()
+    # cpu_freq_mhz is optional on snapshots, so it keeps its own sample count
+    cpu_freq_mhz_min = models.FloatField(blank=True, null=True)
+    cpu_freq_mhz_max = models.FloatField(blank=True, null=True)
+    cpu_freq_mhz_sum = models.FloatField(default=0)
+    cpu_freq_mhz_samples = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["host", "resolution", "bucket_start"], name="uniq_rollup_bucket"),
+        ]
+
+    def __str__(self):
+        return f"Rollup {self.resolution}s of {self.host.hostname} at {self.bucket_start}"
+
+
+class AlertRule(models.Model):
+    """
+    A threshold condition evaluated by monitor.alerts against every snapshot
+    of the hosts it applies to. It fires once `expression` has held for
+    `for_seconds` of snapshot time.
+    """
+    name = models.CharField(max_length=255, unique=True)
+    # Exact hostname, or a shell-style pattern (web-*); blank applies to every host
+    hostname = models.CharField(max_length=255, blank=True, default="")
+    # When set, `count`, `cpu_percent` and `memory_mb` in the expression are totals
+    # over the host's processes with exactly this name (count == 0: absent)
+    process_name = models.CharField(max_length=255, blank=True, default="")
+    expression = models.CharField(max_length=1000)  # e.g. used_ram_gb / ram_gb > 0.9
+    for_seconds = models.PositiveIntegerField(default=0)
+    enabled = models.BooleanField(default=True)
+
+    def clean(self):
+        from .alerts import RuleError, compile_expression
+
+        try:
+            compile_expression(self.expression, process=bool(self.process_name))
+        except RuleError as e:
+            raise ValidationError({"expression": str(e)})
+
+    def __str__(self):
+        return self.name
+
+
+class Alert(models.Model):
+    """One firing of a rule on a host; open until `resolved_at` is set."""
+    rule = models.ForeignKey(AlertRule, on_delete=models.CASCADE, related_name="alerts")
+    host = models.ForeignKey(Host, on_delete=models.CASCADE, related_name="alerts")
+    fired_at = models.DateTimeField()  # snapshot time the condition had held for for_seconds
+    resolved_at = models.DateTimeField(blank=True, null=True)
+    value = models.FloatField(blank=True, null=True)  # left-hand side of the first comparison when it fired
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["resolved_at", "fired_at"], name="alert_state_idx"),
+        ]
+        constraints = [
+            # At most one open alert per rule and host
+            models.UniqueConstraint(
+                fields=["rule", "host"], condition=models.Q(resolved_at__isnull=True), name="uniq_open_alert"
+            ),
+        ]
 
     def __str__(self):
-        return f"{self.name} (PID {self.pid})"
+        return f"{self.rule} on {self.host.hostname} at {self.fired_at}"
@@ -0,0 +1,24 @@
+import struct
+import zlib
+
+from rest_framework.exceptions import ParseError
+from rest_framework.parsers import BaseParser
+
+from . import columnar
+
+
+class ColumnarParser(BaseParser):
+    """
+    Parses the compressed columnar ingest format (see monitor.columnar).
+    Compression is taken from the Content-Encoding header (gzip, zstd or identity).
+    """
+    media_type = columnar.MEDIA_TYPE
+
+    def parse(self, stream, media_type=None, parser_context=None):
+        request = (parser_context or {}).get("request")
+        encoding = request.META.get("HTTP_CONTENT_ENCODING") if request is not None else None
+        body = stream.read() if stream is not None else b""
+        try:
+            return columnar.decode(columnar.decompress(body, encoding))
+        except (ValueError, zlib.error, struct.error) as e:
+            raise ParseError(f"Columnar parse error - {e}")
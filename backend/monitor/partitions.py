@@ -0,0 +1,147 @@
+"""
+Daily range partitions of the Process table on PostgreSQL.
+
+Migration 0007 turns monitor_process into a table partitioned by captured_at
+with one partition per UTC day (monitor_process_pYYYYMMDD). There is no
+default partition: ingest creates the partition for a day before writing
+rows into it, and retention pre-creates the next few days so that normally
+happens off the ingest path. Expired days are removed with DROP TABLE instead
+of row-by-row deletes.
+
+Each process remembers which days it has created. Retention running in
+another process (apply_retention from cron) can drop one of them; the next
+write into that day then fails with "no partition", and write() recreates
+the partition and retries once.
+
+Snapshot is not partitioned: unique keys on a partitioned table must include
+the partition key, which would make Process.snapshot and
+Host.latest_snapshot composite. Snapshot rows are small and few (one per
+host per interval, thinned to one per minute and then per hour by
+monitor.retention in batched deletes), so Process is where partitioning pays.
+
+On SQLite (and any other backend) every function here is a no-op.
+"""
+import re
+import threading
+from datetime import datetime, time, timedelta, timezone
+
+from django.db import DatabaseError, connection, transaction
+
+from .models import Process
+
+TABLE = Process._meta.db_table
+AHEAD_DAYS = 3
+
+_NAME = re.compile(rf"^{TABLE}_p(\d{{8}})$")
+_known_days = set()
+_lock = threading.Lock()
+
+
+def enabled():
+    return connection.vendor == "postgresql"
+
+
+def partition_name(day):
+    return f"{TABLE}_p{day:%Y%m%d}"
+
+
+def _bounds(day):
+    start = datetime.combine(day, time.min, tzinfo=timezone.utc)
+    return start, start + timedelta(days=1)
+
+
+def create_sql(day):
+    start, end = _bounds(day)
+    return (
+        f'CREATE TABLE IF NOT EXISTS "{partition_name(day)}" PARTITION OF "{TABLE}" '
+        f"FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')"
+    )
+
+
+def ensure_days(days):
+    """Create the partitions for `days` (dates, UTC) that this process has not seen yet."""
+    if not enabled():
+        return
+    with _lock:
+        missing = sorted(set(days) - _known_days)
+    if not missing:
+        return
+    with connection.cursor() as cursor:
+        for day in missing:
+            cursor.execute(create_sql(day))
+    with _lock:
+        _known_days.update(missing)
+
+
+def _days(timestamps):
+    return {ts.astimezone(timezone.utc).date() for ts in timestamps}
+
+
+def ensure_for(timestamps):
+    ensure_days(_days(timestamps))
+
+
+def _missing_partition(error):
+    # psycopg's CheckViolation (SQLSTATE 23514), raised by Django as IntegrityError
+    cause = error.__cause__
+    return getattr(cause, "sqlstate", None) == "23514" and "no partition" in str(cause)
+
+
+def write(timestamps, insert):
+    """
+    Call insert() once the partitions for `timestamps` exist. If another
+    process dropped one of them since this process created it, the insert
+    fails; the partitions are then recreated and insert() is retried once,
+    so it must be safe to call twice.
+    """
+    days = _days(timestamps)
+    ensure_days(days)
+    if not enabled():
+        return insert()
+    try:
+        # Savepoint: a failed statement aborts the enclosing transaction otherwise
+        with transaction.atomic():
+            return insert()
+    except DatabaseError as e:
+        if not _missing_partition(e):
+            raise
+    with _lock:
+        _known_days.difference_update(days)
+    ensure_days(days)
+    return insert()
+
+
+def ensure_ahead(now):
+    today = now.astimezone(timezone.utc).date()
+    ensure_days(today + timedelta(days=i) for i in range(AHEAD_DAYS + 1))
+
+
+def existing_days():
+    with connection.cursor() as cursor:
+        cursor.execute(
+            "SELECT c.relname FROM pg_inherits i "
+            "JOIN pg_class c ON c.oid = i.inhrelid JOIN pg_class p ON p.oid = i.inhparent "
+            "WHERE p.relname = %s",
+            [TABLE],
+        )
+        names = [row[0] for row in cursor.fetchall()]
+    return sorted(datetime.strptime(m.group(1), "%Y%m%d").date() for m in map(_NAME.match, names) if m)
+
+
+def drop_before(cutoff, dry_run=False):
+    """Drop every partition that lies entirely before `cutoff`. Returns the number of rows removed."""
+    if not enabled():
+        return 0
+    removed = 0
+    with connection.cursor() as cursor:
+        for day in existing_days():
+            if _bounds(day)[1] > cutoff:
+                break
+            name = partition_name(day)
+            cursor.execute(f'SELECT count(*) FROM "{name}"')
+            removed += cursor.fetchone()[0]
+            if not dry_run:
+                cursor.execute(f'DROP TABLE "{name}"')
+                with _lock:
+                    _known_days.discard(day)
+    return removed
@@ -0,0 +1,204 @@
+"""
+Retention and compaction for Snapshot and Process rows.
+
+Policy (settings.MONITOR_RETENTION):
+- Process rows are kept for PROCESS_DETAIL_HOURS; older snapshots keep only
+  their system gauges and process_count.
+- Snapshots older than MINUTE_AFTER_HOURS are thinned to the last one per
+  host per minute, and older than HOUR_AFTER_DAYS to the last one per hour.
+  Keeping the last snapshot of each bucket means a host's latest snapshot is
+  never removed.
+- MetricRollup rows are never touched.
+- Interned process names and command lines that no process row references
+  any more are deleted.
+
+Deletes run in BATCH_SIZE chunks, each in its own short transaction with a
+pause in between, so ingest is never blocked behind a long delete. On
+PostgreSQL, Process detail older than a whole day is dropped by partition
+(monitor.partitions), and each run pre-creates the coming days' partitions.
+"""
+import logging
+import threading
+import time
+from datetime import timedelta
+from itertools import islice
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.db.models import Exists, OuterRef, Q
+from django.utils import timezone
+
+from . import interning, partitions
+from .models import CommandLine, Host, LatestProcess, Process, ProcessName, Snapshot
+from .rollups import bucket_start
+
+logger = logging.getLogger(__name__)
+
+DEFAULTS = {
+    "PROCESS_DETAIL_HOURS": 24,
+    "MINUTE_AFTER_HOURS": 24,
+    "HOUR_AFTER_DAYS": 7,
+    "BATCH_SIZE": 1000,
+    "BATCH_PAUSE_SEC": 0.05,
+    "INTERVAL_SEC": None,
+}
+
+SCAN_CHUNK = 5000
+
+
+def get_config(**overrides):
+    config = {**DEFAULTS, **getattr(settings, "MONITOR_RETENTION", {})}
+    config.update({k: v for k, v in overrides.items() if v is not None})
+    return config
+
+
+def _free_bytes():
+    """Bytes on the database's free list (SQLite only; None elsewhere)."""
+    if connection.vendor != "sqlite":
+        return None
+    with connection.cursor() as cursor:
+        cursor.execute("PRAGMA freelist_count")
+        free = cursor.fetchone()[0]
+        cursor.execute("PRAGMA page_size")
+        return free * cursor.fetchone()[0]
+
+
+def _pause(config):
+    if config["BATCH_PAUSE_SEC"]:
+        time.sleep(config["BATCH_PAUSE_SEC"])
+
+
+def _delete_matching(qs, config):
+    """Delete everything `qs` matches, BATCH_SIZE rows per transaction."""
+    deleted = 0
+    while True:
+        ids = list(qs.values_list("id", flat=True)[: config["BATCH_SIZE"]])
+        if not ids:
+            return deleted
+        with transaction.atomic():
+            deleted += qs.model.objects.filter(id__in=ids).delete()[0]
+        _pause(config)
+
+
+def prune_processes(now, config, dry_run=False):
+    cutoff = now - timedelta(hours=config["PROCESS_DETAIL_HOURS"])
+    # PostgreSQL: whole expired days go with DROP TABLE; only the boundary day is deleted row by row
+    dropped = partitions.drop_before(cutoff, dry_run)
+    old = Process.objects.filter(captured_at__lt=cutoff)
+    if dry_run:
+        return dropped + old.count()
+    return dropped + _delete_matching(old, config)
+
+
+def _thinned_ids(host_id, minute_cutoff, hour_cutoff):
+    """Yield ids of snapshots that are not the last of their minute/hour bucket."""
+    last_key = last_id = None
+    after = None
+    while True:
+        qs = Snapshot.objects.filter(host_id=host_id, captured_at__lt=minute_cutoff)
+        if after is not None:
+            qs = qs.filter(Q(captured_at__gt=after[1]) | Q(captured_at=after[1], id__gt=after[0]))
+        rows = list(qs.order_by("captured_at", "id").values_list("id", "captured_at")[:SCAN_CHUNK])
+        if not rows:
+            return
+        for sid, ts in rows:
+            res = 3600 if ts < hour_cutoff else 60
+            key = (res, bucket_start(ts, res))
+            if key == last_key:
+                yield last_id
+            last_key, last_id = key, sid
+        after = rows[-1]
+
+
+def thin_snapshots(now, config, dry_run=False):
+    minute_cutoff = now - timedelta(hours=config["MINUTE_AFTER_HOURS"])
+    hour_cutoff = now - timedelta(days=config["HOUR_AFTER_DAYS"])
+    deleted = 0
+    for host_id in Host.objects.values_list("id", flat=True).iterator():
+        # The scan pages through the host's snapshots in captured_at order and never
+        # revisits a page, so its ids can be deleted as they come, BATCH_SIZE at a time
+        doomed = _thinned_ids(host_id, minute_cutoff, hour_cutoff)
+        while True:
+            chunk = list(islice(doomed, config["BATCH_SIZE"]))
+            if not chunk:
+                break
+            if dry_run:
+                deleted += len(chunk)
+                continue
+            # Process rows first, in bounded batches, so the snapshot delete cascades nothing large
+            _delete_matching(Process.objects.filter(snapshot_id__in=chunk), config)
+            with transaction.atomic():
+                deleted += Snapshot.objects.filter(id__in=chunk).delete()[1].get(Snapshot._meta.label, 0)
+            _pause(config)
+    return deleted
+
+
+def sweep_strings(config, dry_run=False):
+    """
+    Delete ProcessName / CommandLine rows no process row references. Ids that
+    other server processes still cache are safe: see monitor.interning. A dry
+    run counts only rows that are unreferenced already.
+    """
+    unused = [
+        ProcessName.objects.filter(
+            ~Exists(Process.objects.filter(name_ref=OuterRef("pk"))),
+            ~Exists(LatestProcess.objects.filter(name_ref=OuterRef("pk"))),
+        ),
+        CommandLine.objects.filter(~Exists(Process.objects.filter(cmdline_ref=OuterRef("pk")))),
+    ]
+    if dry_run:
+        return sum(qs.count() for qs in unused)
+    deleted = sum(_delete_matching(qs, config) for qs in unused)
+    if deleted:
+        interning.names.clear()
+        interning.cmdlines.clear()
+    return deleted
+
+
+def run(now=None, dry_run=False, **overrides):
+    """Apply the retention policy once. Returns a report of rows (and bytes, on SQLite) reclaimed."""
+    config = get_config(**overrides)
+    now = now or timezone.now()
+    started = time.monotonic()
+    free_before = _free_bytes()
+
+    if not dry_run:
+        partitions.ensure_ahead(now)
+    report = {
+        "dry_run": dry_run,
+        "processes_deleted": prune_processes(now, config, dry_run),
+        "snapshots_deleted": thin_snapshots(now, config, dry_run),
+    }
+    report["strings_deleted"] = sweep_strings(config, dry_run)
+    free_after = _free_bytes()
+    report["bytes_reclaimed"] = None if free_before is None or dry_run else max(0, free_after - free_before)
+    report["seconds"] = round(time.monotonic() - started, 3)
+    return report
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def ensure_scheduled():
+    """Start the periodic in-process retention task if MONITOR_RETENTION['INTERVAL_SEC'] is set."""
+    global _scheduler
+    if _scheduler is not None:
+        return
+    interval = get_config()["INTERVAL_SEC"]
+    if not interval:
+        return
+    with _scheduler_lock:
+        if _scheduler is None:
+            _scheduler = threading.Thread(target=_periodic, args=(interval,), name="monitor-retention", daemon=True)
+            _scheduler.start()
+
+
+def _periodic(interval):
+    while True:
+        time.sleep(interval)
+        close_old_connections()
+        try:
+            logger.info("Retention run: %s", run())
+        except Exception:
+            logger.exception("Retention run failed")
@@ -0,0 +1,134 @@
+from datetime import datetime, timezone
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, FloatField, Value
+from django.db.models.functions import Coalesce, Greatest, Least
+
+from .models import MetricRollup, Snapshot
+
+
+RESOLUTIONS = (60, 3600, 86400)
+METRICS = ("used_ram_gb", "available_ram_gb", "storage_used_gb", "storage_free_gb", "cpu_freq_mhz")
+
+
+def bucket_start(ts, resolution):
+    epoch = int(ts.timestamp())
+    return datetime.fromtimestamp(epoch - epoch % resolution, tz=timezone.utc)
+
+
+class _Bucket:
+    """In-memory aggregate of one (host, resolution, bucket) before it is merged into the table."""
+
+    __slots__ = ("samples", "min", "max", "sum", "count")
+
+    def __init__(self):
+        self.samples = 0
+        self.min = {}
+        self.max = {}
+        self.sum = {}
+        self.count = {}
+
+    def add(self, values):
+        self.samples += 1
+        for m, v in values.items():
+            if v is None:
+                continue
+            if m in self.count:
+                self.min[m] = min(self.min[m], v)
+                self.max[m] = max(self.max[m], v)
+                self.sum[m] += v
+                self.count[m] += 1
+            else:
+                self.min[m] = self.max[m] = self.sum[m] = v
+                self.count[m] = 1
+
+    def merge(self, other):
+        self.samples += other.samples
+        for m, n in other.count.items():
+            if m in self.count:
+                self.min[m] = min(self.min[m], other.min[m])
+                self.max[m] = max(self.max[m], other.max[m])
+                self.sum[m] += other.sum[m]
+                self.count[m] += n
+            else:
+                self.min[m], self.max[m] = other.min[m], other.max[m]
+                self.sum[m], self.count[m] = other.sum[m], n
+
+    def point(self, start):
+        point = {"t": start, "samples": self.samples}
+        for m in METRICS:
+            n = self.count.get(m)
+            point[m] = {"min": self.min[m], "max": self.max[m], "avg": self.sum[m] / n} if n else None
+        return point
+
+
+def record(snapshots):
+    """Fold freshly stored snapshots into every rollup resolution."""
+    buckets = {}
+    for s in snapshots:
+        values = {m: getattr(s, m) for m in METRICS}
+        for res in RESOLUTIONS:
+            key = (s.host_id, res, bucket_start(s.captured_at, res))
+            buckets.setdefault(key, _Bucket()).add(values)
+    for key, b in buckets.items():
+        _apply(key, b)
+
+
+def _apply(key, b):
+    host_id, res, start = key
+    rows = MetricRollup.objects.filter(host_id=host_id, resolution=res, bucket_start=start)
+    updates = {"samples": F("samples") + b.samples}
+    for m in b.count:
+        lo, hi = Value(b.min[m], FloatField()), Value(b.max[m], FloatField())
+        updates[f"{m}_min"] = Coalesce(Least(F(f"{m}_min"), lo), lo)
+        updates[f"{m}_max"] = Coalesce(Greatest(F(f"{m}_max"), hi), hi)
+        updates[f"{m}_sum"] = F(f"{m}_sum") + b.sum[m]
+    if "cpu_freq_mhz" in b.count:
+        updates["cpu_freq_mhz_samples"] = F("cpu_freq_mhz_samples") + b.count["cpu_freq_mhz"]
+    if rows.update(**updates):
+        return
+
+    fields = {"samples": b.samples, "cpu_freq_mhz_samples": b.count.get("cpu_freq_mhz", 0)}
+    for m in METRICS:
+        fields[f"{m}_min"] = b.min.get(m)
+        fields[f"{m}_max"] = b.max.get(m)
+        fields[f"{m}_sum"] = b.sum.get(m, 0)
+    try:
+        with transaction.atomic():
+            MetricRollup.objects.create(host_id=host_id, resolution=res, bucket_start=start, **fields)
+    except IntegrityError:
+        # Another writer created the bucket first
+        rows.update(**updates)
+
+
+def series(host, start, end, step):
+    """
+    Min/max/avg points for [start, end) at `step` seconds, read from the coarsest
+    rollup resolution that is no wider than the step (raw snapshots below a minute).
+    The step is rounded up to a multiple of that resolution, so every step
+    bucket takes in whole rollup buckets (90s at 1-minute resolution becomes
+    120s). Returns (resolution, step, points).
+    """
+    resolution = max((r for r in RESOLUTIONS if r <= step), default=0)
+    if resolution:
+        step = -(-step // resolution) * resolution
+    buckets = {}
+    if resolution:
+        rows = MetricRollup.objects.filter(
+            host=host, resolution=resolution, bucket_start__gte=start, bucket_start__lt=end
+        ).order_by("bucket_start")
+        for row in rows.iterator():
+            b = _Bucket()
+            b.samples = row.samples
+            for m in METRICS:
+                n = row.cpu_freq_mhz_samples if m == "cpu_freq_mhz" else row.samples
+                if n:
+                    b.min[m], b.max[m] = getattr(row, f"{m}_min"), getattr(row, f"{m}_max")
+                    b.sum[m], b.count[m] = getattr(row, f"{m}_sum"), n
+            buckets.setdefault(bucket_start(row.bucket_start, step), _Bucket()).merge(b)
+    else:
+        rows = Snapshot.objects.filter(host=host, captured_at__gte=start, captured_at__lt=end).order_by("captured_at")
+        for row in rows.values("captured_at", *METRICS).iterator():
+            ts = row.pop("captured_at")
+            buckets.setdefault(bucket_start(ts, step), _Bucket()).add(row)
+    return resolution, step, [b.point(t) for t, b in sorted(buckets.items())]
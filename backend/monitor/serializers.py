@@ -1,31 +1,339 @@
+import json
+import math
+import re
+
 from rest_framework import serializers
+from rest_framework.settings import api_settings
+
+from . import columnar, inventory
+from .columnar import ProcessColumns
+
+AGENT_TELEMETRY_MAX_BYTES = 4096
+STARTED_MAX = 2**63 - 1  # Process.started is a BigIntegerField
+
+
+class FiniteFloatField(serializers.FloatField):
+    """FloatField without NaN and infinities, which strict JSON responses cannot render."""
+
+    def to_internal_value(self, data):
+        value = super().to_internal_value(data)
+        if not math.isfinite(value):
+            self.fail("invalid")
+        return value
 
 
 class ProcessIngestSerializer(serializers.Serializer):
     pid = serializers.IntegerField()
     ppid = serializers.IntegerField()
     name = serializers.CharField(max_length=255, allow_blank=False)
-    cpu_percent = serializers.FloatField()
-    memory_mb = serializers.FloatField()
+    cpu_percent = FiniteFloatField()
+    memory_mb = FiniteFloatField()
     cmdline = serializers.CharField(allow_blank=True, required=False, max_length=8192)
+    # Start time in epoch seconds; with pid it tells a reused pid apart (monitor/history.py)
+    started = serializers.IntegerField(required=False, allow_null=True, min_value=0, max_value=STARTED_MAX)
 
 
-class SystemInfoSerializer(serializers.Serializer):
+class InventorySerializer(serializers.Serializer):
+    """Static host facts (monitor.inventory), sent only when they change."""
     os = serializers.CharField(max_length=255)
     processor = serializers.CharField(max_length=255, allow_blank=True, required=False)
     cores = serializers.IntegerField()
     threads = serializers.IntegerField()
     ram_gb = serializers.FloatField()
+    storage_total_gb = serializers.FloatField()
+
+
+class SystemInfoSerializer(InventorySerializer):
+    # Volatile gauges, every tick. The static fields are optional: older agents
+    # still send them here instead of a separate inventory.
+    os = serializers.CharField(max_length=255, required=False)
+    cores = serializers.IntegerField(required=False)
+    threads = serializers.IntegerField(required=False)
+    ram_gb = serializers.FloatField(required=False)
+    storage_total_gb = serializers.FloatField(required=False)
     used_ram_gb = serializers.FloatField()
     available_ram_gb = serializers.FloatField()
-    storage_total_gb = serializers.FloatField()
     storage_used_gb = serializers.FloatField()
     storage_free_gb = serializers.FloatField()
     cpu_freq_mhz = serializers.FloatField(required=False, allow_null=True)
 
 
+class ProcessDeltaSerializer(serializers.Serializer):
+    added = ProcessIngestSerializer(many=True, required=False, default=list)
+    changed = ProcessIngestSerializer(many=True, required=False, default=list)
+    removed = serializers.ListField(child=serializers.IntegerField(), required=False, default=list)
+
+
 class IngestSerializer(serializers.Serializer):
     hostname = serializers.CharField(max_length=255)
     captured_at = serializers.DateTimeField()
     system_info = SystemInfoSerializer()
-    processes = ProcessIngestSerializer(many=True)
+    # Static facts when they changed, else just their version (see monitor/inventory.py)
+    inventory = InventorySerializer(required=False)
+    inventory_hash = serializers.RegexField(r"^[0-9a-f]{16}$", required=False)
+    # The agent's own timings and resource use, kept on the Host (latest only)
+    agent = serializers.DictField(required=False)
+    # Keyframe: the full process list
+    processes = ProcessIngestSerializer(many=True, required=False)
+    # Delta: changes against a snapshot the backend already acknowledged
+    base_captured_at = serializers.DateTimeField(required=False)
+    delta = ProcessDeltaSerializer(required=False)
+
+    def validate_agent(self, value):
+        if len(json.dumps(value, default=str)) > AGENT_TELEMETRY_MAX_BYTES:
+            raise serializers.ValidationError(f"At most {AGENT_TELEMETRY_MAX_BYTES} bytes of telemetry.")
+        return value
+
+    def validate(self, attrs):
+        has_full = "processes" in attrs
+        has_delta = "delta" in attrs or "base_captured_at" in attrs
+        if has_full and has_delta:
+            raise serializers.ValidationError("Send either processes or base_captured_at + delta, not both.")
+        if not has_full and not has_delta:
+            raise serializers.ValidationError("processes is required unless a delta is sent.")
+        if has_delta and ("delta" not in attrs or "base_captured_at" not in attrs):
+            raise serializers.ValidationError("A delta requires both base_captured_at and delta.")
+
+        if "inventory" not in attrs and "inventory_hash" not in attrs:
+            sysinfo = attrs["system_info"]
+            missing = [f for f in inventory.FIELDS if f not in sysinfo and f != "processor"]
+            if missing:
+                raise serializers.ValidationError(
+                    f"Send inventory or inventory_hash (system_info lacks {', '.join(missing)})."
+                )
+            attrs["inventory"] = {f: sysinfo[f] for f in inventory.FIELDS if f in sysinfo}
+        elif "inventory" in attrs and "inventory_hash" in attrs:
+            if inventory.digest_hex(attrs["inventory"]) != attrs["inventory_hash"]:
+                raise serializers.ValidationError({"inventory_hash": "Does not match inventory."})
+        return attrs
+
+
+def snapshot_summary(host, snap):
+    """
+    Response body of /api/v1/snapshots/latest for one snapshot (also used for
+    stream events): the snapshot's gauges merged with its inventory version.
+    """
+    inv = snap.inventory
+    return {
+        "snapshot_id": snap.id,
+        "captured_at": snap.captured_at,
+        "process_count": snap.process_count,
+        "system": {
+            "hostname": host.hostname,
+            "os": inv.os,
+            "processor": inv.processor,
+            "cores": inv.cores,
+            "threads": inv.threads,
+            "ram_gb": inv.ram_gb,
+            "used_ram_gb": snap.used_ram_gb,
+            "available_ram_gb": snap.available_ram_gb,
+            "storage_total_gb": inv.storage_total_gb,
+            "storage_used_gb": snap.storage_used_gb,
+            "storage_free_gb": snap.storage_free_gb,
+            "cpu_freq_mhz": snap.cpu_freq_mhz,
+        },
+    }
+
+
+class ProcessColumnsField(serializers.Field):
+    """
+    Validates a whole ProcessColumns block at once (columnar wire format) with the
+    same limits as ProcessIngestSerializer, then expands it into process dicts.
+    Strings are checked once per dictionary entry instead of once per row.
+    """
+    default_error_messages = {
+        "invalid": "Expected columnar process data.",
+        "name": "Process names must be non-blank and at most 255 characters.",
+        "cmdline": "Command lines must be at most 8192 characters.",
+        "text": "Process names and command lines may not contain null or surrogate characters.",
+        "index": "Dictionary index out of range.",
+        "number": "cpu_percent and memory_mb must be finite numbers.",
+        "started": "Start times must be non-negative.",
+    }
+
+    def to_internal_value(self, data):
+        if not isinstance(data, ProcessColumns):
+            self.fail("invalid")
+        if not len(data):
+            return []
+
+        if not all(isinstance(n, str) for n in data.names):
+            self.fail("name")
+        data.names = [n.strip() for n in data.names]
+        if not all(0 < len(n) <= 255 for n in data.names):
+            self.fail("name")
+        if max(data.name_idx) >= len(data.names):
+            self.fail("index")
+
+        if data.cmdlines is not None:
+            if not all(isinstance(c, str) and len(c) <= 8192 for c in data.cmdlines):
+                self.fail("cmdline")
+            data.cmdlines = [c.strip() for c in data.cmdlines]
+            if max(data.cmdline_idx) >= len(data.cmdlines):
+                self.fail("index")
+        if _UNSTORABLE.search("".join(data.names)) or (data.cmdlines and _UNSTORABLE.search("".join(data.cmdlines))):
+            self.fail("text")
+
+        if not (all(map(math.isfinite, data.cpu_percent)) and all(map(math.isfinite, data.memory_mb))):
+            self.fail("number")
+        if data.started is not None and min(data.started) < columnar.STARTED_UNKNOWN:
+            self.fail("started")
+        return data.rows()
+
+
+class ColumnarDeltaSerializer(ProcessDeltaSerializer):
+    added = ProcessColumnsField(required=False, default=list)
+    changed = ProcessColumnsField(required=False, default=list)
+
+
+class ColumnarIngestSerializer(IngestSerializer):
+    """IngestSerializer for payloads decoded by ColumnarParser."""
+    processes = ProcessColumnsField(required=False)
+    delta = ColumnarDeltaSerializer(required=False)
+
+
+class ProcessRowsField(serializers.Field):
+    """
+    Validates a JSON process list with the same rules as ProcessIngestSerializer
+    in one tight loop, without building a nested serializer per process. Used by
+    the batch endpoint, where replays carry tens of thousands of process rows,
+    and by single JSON ingest.
+
+    With nested_errors, a bad list is reported exactly like
+    ProcessIngestSerializer(many=True): one dict of field errors per row.
+    Otherwise the first bad row is reported as "Process <index>: ...".
+    """
+    default_error_messages = {
+        "invalid": "Expected a list of process objects.",
+        "row": "Process {index}: {message}",
+    }
+
+    def __init__(self, nested_errors=False, **kwargs):
+        self.nested_errors = nested_errors
+        super().__init__(**kwargs)
+
+    def to_internal_value(self, data):
+        if not isinstance(data, list):
+            if self.nested_errors:
+                raise serializers.ValidationError(
+                    {api_settings.NON_FIELD_ERRORS_KEY: [f'Expected a list of items but got type "{type(data).__name__}".']},
+                    code="not_a_list",
+                )
+            self.fail("invalid")
+        rows = []
+        for index, p in enumerate(data):
+            if not isinstance(p, dict):
+                if self.nested_errors:
+                    raise serializers.ValidationError(_row_errors(data))
+                self.fail("invalid")
+            try:
+                row = {
+                    "pid": _int(p["pid"]),
+                    "ppid": _int(p["ppid"]),
+                    "name": _text(p["name"], 255, blank=False),
+                    "cpu_percent": _number(p["cpu_percent"]),
+                    "memory_mb": _number(p["memory_mb"]),
+                }
+                if "cmdline" in p:
+                    row["cmdline"] = _text(p["cmdline"], 8192, blank=True)
+                if "started" in p:
+                    row["started"] = _started(p["started"])
+            except (KeyError, ValueError) as e:
+                if self.nested_errors:
+                    raise serializers.ValidationError(_row_errors(data))
+                message = f"{e.args[0]} is required." if isinstance(e, KeyError) else str(e)
+                self.fail("row", index=index, message=message)
+            rows.append(row)
+        return rows
+
+
+# The one-pass checks below accept and reject exactly what ProcessIngestSerializer's
+# fields do (FastJSONTests compares them); only the error text may be shorter.
+_UNSTORABLE = re.compile("[\x00\ud800-\udfff]")  # ProhibitNull/SurrogateCharactersValidator
+
+
+def _int(value):
+    if type(value) is int:
+        return value
+    # Like IntegerField: 3, "3", 3.0 and "3.00" are accepted; 3.5 and true are not
+    if isinstance(value, str) and len(value) > serializers.IntegerField.MAX_STRING_LENGTH:
+        raise ValueError("String value too large.")
+    try:
+        return int(serializers.IntegerField.re_decimal.sub("", str(value)))
+    except (TypeError, ValueError):
+        raise ValueError("A valid integer is required.")
+
+
+def _started(value):
+    if value is None:
+        return None
+    value = _int(value)
+    if not 0 <= value <= STARTED_MAX:
+        raise ValueError(f"Ensure this value is between 0 and {STARTED_MAX}.")
+    return value
+
+
+def _number(value):
+    if type(value) is not float:
+        # Like FloatField: numbers, bools and numeric strings
+        if isinstance(value, str) and len(value) > serializers.FloatField.MAX_STRING_LENGTH:
+            raise ValueError("String value too large.")
+        try:
+            value = float(value)
+        except (TypeError, ValueError):
+            raise ValueError("A valid number is required.")
+        except OverflowError:
+            raise ValueError("Integer value too large to convert to float")
+    if not math.isfinite(value):
+        raise ValueError("A valid number is required.")
+    return value
+
+
+def _text(value, max_length, blank):
+    if value is None:
+        raise ValueError("This field may not be null.")
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        raise ValueError("Not a valid string.")
+    value = str(value).strip()
+    if not value:
+        if not blank:
+            raise ValueError("This field may not be blank.")
+        return value
+    if len(value) > max_length:
+        raise ValueError(f"Ensure this field has no more than {max_length} characters.")
+    if _UNSTORABLE.search(value):
+        raise ValueError("Null and surrogate characters are not allowed.")
+    return value
+
+
+def _row_errors(data):
+    """Errors for every row of `data`, shaped like ProcessIngestSerializer(many=True).errors. Only on failure."""
+    out = []
+    for p in data:
+        row = ProcessIngestSerializer(data=p)
+        row.is_valid()
+        out.append(row.errors)
+    return out
+
+
+class JSONDeltaSerializer(ProcessDeltaSerializer):
+    added = ProcessRowsField(required=False, default=list, nested_errors=True)
+    changed = ProcessRowsField(required=False, default=list, nested_errors=True)
+
+
+class JSONIngestSerializer(IngestSerializer):
+    """IngestSerializer for JSON bodies: the same rules and error shape, with process lists checked in one pass."""
+    processes = ProcessRowsField(required=False, nested_errors=True)
+    delta = JSONDeltaSerializer(required=False)
+
+
+class BatchDeltaSerializer(ProcessDeltaSerializer):
+    added = ProcessRowsField(required=False, default=list)
+    changed = ProcessRowsField(required=False, default=list)
+
+
+class BatchIngestItemSerializer(IngestSerializer):
+    """One snapshot of /api/v1/ingest/batch. api_key overrides the request's X-API-KEY (relays)."""
+    api_key = serializers.CharField(max_length=255, required=False)
+    processes = ProcessRowsField(required=False)
+    delta = BatchDeltaSerializer(required=False)
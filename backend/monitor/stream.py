@@ -0,0 +1,103 @@
+"""
+In-process fan-out of ingest events to Server-Sent Events subscribers.
+
+Ingest publishes one event per committed snapshot; the event is encoded once
+and handed to every matching subscriber's asyncio queue on its own event
+loop. Subscribers whose queue fills up (clients not reading) are dropped
+rather than slowing ingest down. Events only reach subscribers connected to
+the same server process that handled the ingest.
+"""
+import asyncio
+import threading
+
+from django.db import transaction
+
+from .fastjson import FastJSONRenderer
+from .serializers import snapshot_summary
+
+_renderer = FastJSONRenderer()
+
+
+class Subscriber:
+    def __init__(self, hostname, loop, maxsize):
+        self.hostname = hostname
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+
+    def offer(self, data):
+        # Runs on the subscriber's loop; None tells the stream to close
+        if self.queue.full():
+            self.queue.get_nowait()
+            data = None
+        self.queue.put_nowait(data)
+
+
+class Broker:
+    def __init__(self, queue_size=100):
+        self.queue_size = queue_size
+        self._subscribers = set()
+        self._lock = threading.Lock()
+
+    def subscribe(self, hostname=None, loop=None):
+        sub = Subscriber(hostname, loop or asyncio.get_running_loop(), self.queue_size)
+        with self._lock:
+            self._subscribers.add(sub)
+        return sub
+
+    def unsubscribe(self, sub):
+        with self._lock:
+            self._subscribers.discard(sub)
+
+    def subscriber_count(self):
+        with self._lock:
+            return len(self._subscribers)
+
+    def has_subscribers(self, hostname):
+        with self._lock:
+            return any(s.hostname in (None, hostname) for s in self._subscribers)
+
+    def publish(self, hostname, event, name="snapshot"):
+        # Same encoding as the REST responses (ISO 8601 datetimes), so the UI parses both alike
+        data = b"event: %s\ndata: %s\n\n" % (name.encode("utf-8"), _renderer.render(event))
+        with self._lock:
+            targets = [s for s in self._subscribers if s.hostname in (None, hostname)]
+        for sub in targets:
+            try:
+                sub.loop.call_soon_threadsafe(sub.offer, data)
+            except RuntimeError:
+                # Subscriber's loop is gone
+                self.unsubscribe(sub)
+
+
+broker = Broker()
+
+
+def publish_snapshot(host, snapshot, data, processes):
+    """Queue a snapshot event for subscribers once the ingest transaction commits."""
+    if not broker.has_subscribers(host.hostname):
+        return
+    event = snapshot_summary(host, snapshot)
+    if "delta" in data:
+        event["base_captured_at"] = data["base_captured_at"]
+        event["delta"] = data["delta"]
+    else:
+        event["processes"] = processes
+    transaction.on_commit(lambda: broker.publish(host.hostname, event))
+
+
+async def events(sub, keepalive=15):
+    """SSE byte stream for one subscriber, with keepalive comments while idle."""
+    try:
+        yield b"retry: 2000\n\n"
+        while True:
+            try:
+                data = await asyncio.wait_for(sub.queue.get(), timeout=keepalive)
+            except asyncio.TimeoutError:
+                yield b": keepalive\n\n"
+                continue
+            if data is None:
+                yield b"event: dropped\ndata: {}\n\n"
+                return
+            yield data
+    finally:
+        broker.unsubscribe(sub)
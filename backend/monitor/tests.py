@@ -1,35 +1,67 @@
-from django.test import TestCase
+import asyncio
+import json
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
+
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.db import IntegrityError, connection, transaction
+
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from rest_framework.test import APIClient
-from .models import Host, Snapshot, Process
+from . import alerts, bench, cache as cache_module, fastjson, hostcache, interning, inventory, metrics, partitions, retention, writer as writer_module
+from .cache import get_cache
+from .serializers import BatchIngestItemSerializer, IngestSerializer, JSONIngestSerializer
+from .models import Alert, AlertRule, CommandLine, Host, HostInventory, LatestProcess, MetricRollup, Process, ProcessName, Snapshot
+from .stream import Broker, broker
+from .writer import IngestWriter
 from datetime import datetime, timezone
 
 
-class MonitorApiTests(TestCase):
+def base_payload(hostname='DESKTOP-TEST'):
+    return {
+        'hostname': hostname,
+        'captured_at': datetime.now(timezone.utc).isoformat(),
+        'system_info': {
+            'os': 'Windows',
+            'processor': 'x86_64',
+            'cores': 4,
+            'threads': 8,
+            'ram_gb': 16.0,
+            'used_ram_gb': 6.0,
+            'available_ram_gb': 10.0,
+            'storage_total_gb': 256.0,
+            'storage_used_gb': 120.0,
+            'storage_free_gb': 136.0,
+            'cpu_freq_mhz': 2400.0,
+        },
+        'processes': [
+            {'pid': 1, 'ppid': 0, 'name': 'System', 'cpu_percent': 0.0, 'memory_mb': 5.2, 'cmdline': ''},
+            {'pid': 2, 'ppid': 1, 'name': 'Child', 'cpu_percent': 1.0, 'memory_mb': 10.0, 'cmdline': ''},
+        ],
+    }
+
+
+class MonitorTestCase(TestCase):
     def setUp(self):
+        # Read cache entries, cached hosts, alert state, interned string ids and inventory versions outlive each test's rolled-back transaction
+        get_cache().clear()
+        hostcache.hosts.clear()
+        alerts.engine.reset()
+        interning.names.clear()
+        interning.cmdlines.clear()
+        inventory.clear()
+
+
+class MonitorApiTests(MonitorTestCase):
+    def setUp(self):
+        super().setUp()
         self.client = APIClient()
 
     def _base_payload(self, hostname='DESKTOP-TEST'):
-        return {
-            'hostname': hostname,
-            'captured_at': datetime.now(timezone.utc).isoformat(),
-            'system_info': {
-                'os': 'Windows',
-                'processor': 'x86_64',
-                'cores': 4,
-                'threads': 8,
-                'ram_gb': 16.0,
-                'used_ram_gb': 6.0,
-                'available_ram_gb': 10.0,
-                'storage_total_gb': 256.0,
-                'storage_used_gb': 120.0,
-                'storage_free_gb': 136.0,
-                'cpu_freq_mhz': 2400.0,
-            },
-            'processes': [
-                {'pid': 1, 'ppid': 0, 'name': 'System', 'cpu_percent': 0.0, 'memory_mb': 5.2, 'cmdline': ''},
-                {'pid': 2, 'ppid': 1, 'name': 'Child', 'cpu_percent': 1.0, 'memory_mb': 10.0, 'cmdline': ''},
-            ],
-        }
+        return base_payload(hostname)
 
     def test_ingest_auto_creates_host_and_stores_snapshot(self):
         # No host exists yet; provide API key header → auto-create host
@@ -81,4 +113,1295 @@ class MonitorApiTests(TestCase):
         res4 = self.client.get('/api/v1/hosts')
         self.assertEqual(res4.status_code, 200)
         hostnames = [h['hostname'] for h in res4.data]
-        self.assertIn('H1', hostnames)
\ No newline at end of file
+        self.assertIn('H1', hostnames)
+
+    def test_agent_telemetry_is_kept_for_the_latest_snapshot(self):
+        self.client.credentials(HTTP_X_API_KEY='K1')
+        payload = self._base_payload('H1')
+        payload['captured_at'] = '2025-01-01T10:00:01+00:00'
+        payload['agent'] = {'collect_ms': 12.5, 'cpu_percent': 3.1, 'governor_level': 0}
+        self.assertEqual(self.client.post('/api/v1/ingest', payload, format='json').status_code, 201)
+        # A replayed older snapshot does not overwrite it
+        older = {**payload, 'captured_at': '2025-01-01T10:00:00+00:00', 'agent': {'collect_ms': 99.0}}
+        self.assertEqual(self.client.post('/api/v1/ingest', older, format='json').status_code, 201)
+
+        self.client.credentials()
+        res = self.client.get('/api/v1/snapshots/latest', {'hostname': 'H1'})
+        self.assertEqual(res.data['agent'], {'collect_ms': 12.5, 'cpu_percent': 3.1, 'governor_level': 0})
+
+        self.client.credentials(HTTP_X_API_KEY='K1')
+        payload['agent'] = {'padding': 'x' * 5000}
+        self.assertEqual(self.client.post('/api/v1/ingest', payload, format='json').status_code, 400)
+
+    def test_ingest_delta_rebuilds_full_snapshot(self):
+        self.client.credentials(HTTP_X_API_KEY='K1')
+        keyframe = self._base_payload('H1')
+        res = self.client.post('/api/v1/ingest', keyframe, format='json')
+        self.assertEqual(res.status_code, 201)
+
+        delta = self._base_payload('H1')
+        del delta['processes']
+        delta['base_captured_at'] = keyframe['captured_at']
+        delta['delta'] = {
+            'added': [{'pid': 3, 'ppid': 1, 'name': 'New', 'cpu_percent': 0.5, 'memory_mb': 1.0}],
+            'changed': [{'pid': 2, 'ppid': 1, 'name': 'Child', 'cpu_percent': 9.0, 'memory_mb': 12.0}],
+            'removed': [1],
+        }
+        res2 = self.client.post('/api/v1/ingest', delta, format='json')
+        self.assertEqual(res2.status_code, 201)
+        self.assertEqual(res2.data['processes'], 2)
+
+        procs = {p['pid']: p for p in Process.objects.filter(snapshot_id=res2.data['snapshot_id']).values()}
+        self.assertEqual(set(procs), {2, 3})
+        self.assertEqual(procs[2]['cpu_percent'], 9.0)
+
+    def test_ingest_delta_with_unknown_base_requests_keyframe(self):
+        self.client.credentials(HTTP_X_API_KEY='K1')
+        payload = self._base_payload('H1')
+        del payload['processes']
+        payload['base_captured_at'] = '2020-01-01T00:00:00+00:00'
+        payload['delta'] = {'added': [], 'changed': [], 'removed': []}
+        res = self.client.post('/api/v1/ingest', payload, format='json')
+        self.assertEqual(res.status_code, 409)
+        self.assertTrue(res.data['keyframe_required'])
+        self.assertFalse(Snapshot.objects.exists())
+
+    def test_ingest_columnar_gzip_keyframe_and_delta(self):
+        from . import columnar
+
+        self.client.credentials(HTTP_X_API_KEY='K1')
+        keyframe = self._base_payload('H1')
+        keyframe['processes'][1]['cmdline'] = 'child --flag'
+        keyframe['processes'][1]['started'] = 1700000000
+        body = columnar.compress(columnar.encode(keyframe), 'gzip')
+        res = self.client.post('/api/v1/ingest', body, content_type=columnar.MEDIA_TYPE, HTTP_CONTENT_ENCODING='gzip')
+        self.assertEqual(res.status_code, 201)
+        procs = {p.pid: p for p in Process.objects.filter(snapshot_id=res.data['snapshot_id']).with_text()}
+        self.assertEqual(procs[2].name, 'Child')
+        self.assertEqual(procs[2].cmdline, 'child --flag')
+        self.assertEqual(procs[1].memory_mb, 5.2)
+        self.assertEqual((procs[1].started, procs[2].started), (None, 1700000000))
+
+        delta = self._base_payload('H1')
+        del delta['processes']
+        delta['base_captured_at'] = keyframe['captured_at']
+        delta['delta'] = {
+            'added': [{'pid': 3, 'ppid': 1, 'name': 'New', 'cpu_percent': 0.5, 'memory_mb': 1.0}],
+            'changed': [],
+            'removed': [2],
+        }
+        res2 = self.client.post('/api/v1/ingest', columnar.encode(delta), content_type=columnar.MEDIA_TYPE)
+        self.assertEqual(res2.status_code, 201)
+        self.assertEqual(
+            set(Process.objects.filter(snapshot_id=res2.data['snapshot_id']).values_list('pid', flat=True)), {1, 3}
+        )
+
+    def test_ingest_columnar_rejects_bad_payloads(self):
+        from . import columnar
+
+        self.client.credentials(HTTP_X_API_KEY='K1')
+        res = self.client.post('/api/v1/ingest', b'garbage', content_type=columnar.MEDIA_TYPE)
+        self.assertEqual(res.status_code, 400)
+
+        payload = self._base_payload('H1')
+        payload['processes'][0]['name'] = '   '
+        res2 = self.client.post('/api/v1/ingest', columnar.encode(payload), content_type=columnar.MEDIA_TYPE)
+        self.assertEqual(res2.status_code, 400)
+        self.assertIn('processes', res2.data)
+
+        payload['processes'][0]['name'] = 'bad\x00name'
+        res3 = self.client.post('/api/v1/ingest', columnar.encode(payload), content_type=columnar.MEDIA_TYPE)
+        self.assertEqual(res3.status_code, 400)
+
+
+class HostCacheTests(MonitorTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.credentials(HTTP_X_API_KEY='K1')
+
+    def _host_selects(self, queries):
+        return [q['sql'] for q in queries if q['sql'].startswith('SELECT') and 'FROM "monitor_host"' in q['sql']]
+
+    def test_steady_state_ingest_does_not_look_up_host(self):
+        # The first ingest creates the host; the second caches it by key
+        for _ in range(2):
+            self.assertEqual(self.client.post('/api/v1/ingest', base_payload('H1'), format='json').status_code, 201)
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.post('/api/v1/ingest', base_payload('H1'), format='json')
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(self._host_selects(ctx.captured_queries), [])
+
+    def test_saving_host_invalidates_cached_key(self):
+        self.client.post('/api/v1/ingest', base_payload('H1'), format='json')
+        host = Host.objects.get(hostname='H1')
+        host.api_key = 'K2'
+        host.save()
+
+        self.assertEqual(self.client.post('/api/v1/ingest', base_payload('H1'), format='json').status_code, 403)
+        self.client.credentials(HTTP_X_API_KEY='K2')
+        self.assertEqual(self.client.post('/api/v1/ingest', base_payload('H1'), format='json').status_code, 201)
+
+    def test_deleted_host_is_not_served_from_cache(self):
+        self.client.post('/api/v1/ingest', base_payload('H1'), format='json')
+        Host.objects.get(hostname='H1').delete()
+        self.assertIsNone(hostcache.hosts.by_api_key('K1'))
+        self.assertIsNone(hostcache.hosts.by_hostname('H1'))
+
+    def test_key_of_another_host_is_rejected(self):
+        self.client.post('/api/v1/ingest', base_payload('H1'), format='json')
+        res = self.client.post('/api/v1/ingest', base_payload('H2'), format='json')
+        self.assertEqual(res.status_code, 403)
+        self.assertFalse(Host.objects.filter(hostname='H2').exists())
+
+
+class BatchIngestTests(MonitorTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.credentials(HTTP_X_API_KEY='TESTKEY123')
+
+    def _payload(self, hostname, second):
+        payload = base_payload(hostname)
+        payload['captured_at'] = f'2025-01-01T10:00:{second:02d}+00:00'
+        return payload
+
+    def test_batch_reports_per_item_results(self):
+        Host.objects.create(hostname='OTHER', api_key='ELSEWHERE')
+        bad = self._payload('A', 3)
+        del bad['system_info']
+        items = [self._payload('A', 1), self._payload('A', 2), bad, self._payload('OTHER', 1), self._payload('A', 1)]
+        res = self.client.post('/api/v1/ingest/batch', {'snapshots': items}, format='json')
+        self.assertEqual(res.status_code, 200)
+        statuses = [r['status'] for r in res.data['results']]
+        self.assertEqual(statuses, [201, 201, 400, 403, 200])
+        self.assertTrue(res.data['results'][4]['duplicate'])
+        self.assertEqual(res.data['results'][4]['snapshot_id'], res.data['results'][0]['snapshot_id'])
+
+        host = Host.objects.get(hostname='A')
+        self.assertEqual(Snapshot.objects.filter(host=host).count(), 2)
+        self.assertEqual(host.latest_snapshot_id, res.data['results'][1]['snapshot_id'])
+
+    def test_batch_replay_is_idempotent(self):
+        items = [self._payload('A', i) for i in range(3)]
+        self.client.post('/api/v1/ingest/batch', {'snapshots': items}, format='json')
+        res = self.client.post('/api/v1/ingest/batch', {'snapshots': items}, format='json')
+        self.assertTrue(all(r.get('duplicate') for r in res.data['results']))
+        self.assertEqual(Snapshot.objects.count(), 3)
+
+    def test_batch_rejects_bad_envelope(self):
+        res = self.client.post('/api/v1/ingest/batch', {'snapshots': 'nope'}, format='json')
+        self.assertEqual(res.status_code, 400)
+        bad = self._payload('A', 1)
+        bad['processes'][0]['memory_mb'] = 'lots'
+        self.client.credentials()
+        res = self.client.post('/api/v1/ingest/batch', {'snapshots': [self._payload('A', 0), bad]}, format='json')
+        self.assertEqual([r['status'] for r in res.data['results']], [403, 400])
+        self.assertIn('Process 0', str(res.data['results'][1]['errors']))
+
+    def _relay_batch(self, seconds):
+        items = []
+        for n in range(4):
+            for second in seconds:
+                payload = self._payload(f'H{n}', second)
+                payload['api_key'] = f'KEY-H{n}'
+                items.append(payload)
+        with CaptureQueriesContext(connection) as ctx:
+            res = self.client.post('/api/v1/ingest/batch', {'snapshots': items}, format='json')
+        self.assertEqual({r['status'] for r in res.data['results']}, {201})
+        return len(ctx.captured_queries)
+
+    def test_relay_batch_cost_is_independent_of_batch_size(self):
+        self.client.credentials()
+        Host.objects.create(hostname='H0', api_key='KEY-H0')
+        self._relay_batch(range(0, 5))
+        # Same hosts and rollup buckets: only the row counts of the bulk inserts differ
+        self.assertEqual(self._relay_batch([10]), self._relay_batch(range(20, 30)))
+        self.assertEqual(Snapshot.objects.count(), 4 * 16)
+        self.assertEqual(Process.objects.count(), 2 * 4 * 16)
+        self.assertEqual(Host.objects.get(hostname='H3').latest_snapshot.captured_at.second, 29)
+
+    def test_delta_can_build_on_earlier_item(self):
+        first = self._payload('A', 0)
+        delta = self._payload('A', 1)
+        del delta['processes']
+        delta['base_captured_at'] = first['captured_at']
+        delta['delta'] = {'removed': [2], 'added': [{'pid': 3, 'ppid': 1, 'name': 'New', 'cpu_percent': 0, 'memory_mb': 1}]}
+        res = self.client.post('/api/v1/ingest/batch', {'snapshots': [first, delta]}, format='json')
+        self.assertEqual([r['status'] for r in res.data['results']], [201, 201])
+        pids = Process.objects.filter(snapshot_id=res.data['results'][1]['snapshot_id']).values_list('pid', flat=True)
+        self.assertEqual(sorted(pids), [1, 3])
+
+
+@override_settings(MONITOR_INGEST_MODE='async')
+class AsyncIngestTests(MonitorTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.credentials(HTTP_X_API_KEY='K1')
+        self.writer = IngestWriter(maxsize=2, batch_size=10)
+        patcher = mock.patch.object(writer_module, '_writer', self.writer)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _payload(self, captured_at):
+        payload = base_payload('ASYNC')
+        payload['captured_at'] = captured_at
+        return payload
+
+    def test_ingest_enqueues_and_writer_commits_in_batches(self):
+        first = self._payload('2025-01-01T00:00:00+00:00')
+        res = self.client.post('/api/v1/ingest', first, format='json')
+        self.assertEqual(res.status_code, 202)
+        self.assertFalse(Snapshot.objects.exists())
+
+        # Delta against a snapshot that is still queued: applied in order within the batch
+        second = self._payload('2025-01-01T00:00:02+00:00')
+        del second['processes']
+        second['base_captured_at'] = first['captured_at']
+        second['delta'] = {'removed': [2]}
+        self.assertEqual(self.client.post('/api/v1/ingest', second, format='json').status_code, 202)
+
+        self.assertEqual(self.writer.drain(), 2)
+        self.assertEqual(list(Snapshot.objects.order_by('captured_at').values_list('process_count', flat=True)), [2, 1])
+
+    def test_full_queue_applies_backpressure(self):
+        for i in range(2):
+            res = self.client.post('/api/v1/ingest', self._payload(f'2025-01-01T00:00:0{i}+00:00'), format='json')
+            self.assertEqual(res.status_code, 202)
+        with override_settings(MONITOR_INGEST_ENQUEUE_TIMEOUT=0):
+            res = self.client.post('/api/v1/ingest', self._payload('2025-01-01T00:00:05+00:00'), format='json')
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res['Retry-After'], '1')
+
+    def test_one_failing_snapshot_does_not_drop_the_batch(self):
+        store = writer_module.store_snapshots
+
+        def store_unless_second_one(items):
+            if any(data['captured_at'].second == 1 for _, data, _ in items):
+                raise ValueError('cannot store')
+            return store(items)
+
+        self.writer.queue.maxsize = 3
+        for i in range(3):
+            res = self.client.post('/api/v1/ingest', self._payload(f'2025-01-01T00:00:0{i}+00:00'), format='json')
+            self.assertEqual(res.status_code, 202)
+        with mock.patch.object(writer_module, 'store_snapshots', store_unless_second_one), self.assertLogs('monitor.writer'):
+            self.assertEqual(self.writer.drain(), 2)
+        seconds = [t.second for t in Snapshot.objects.order_by('captured_at').values_list('captured_at', flat=True)]
+        self.assertEqual(seconds, [0, 2])
+
+    def test_failed_delta_asks_host_for_keyframe(self):
+        payload = self._payload('2025-01-01T00:00:00+00:00')
+        del payload['processes']
+        payload['base_captured_at'] = '2020-01-01T00:00:00+00:00'
+        payload['delta'] = {}
+        self.client.post('/api/v1/ingest', payload, format='json')
+        self.assertEqual(self.writer.drain(), 0)
+
+        res = self.client.post('/api/v1/ingest', self._payload('2025-01-01T00:00:02+00:00'), format='json')
+        self.assertTrue(res.data['keyframe_required'])
+
+
+class MetricRollupTests(MonitorTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.credentials(HTTP_X_API_KEY='K1')
+        for captured_at, used in [
+            ('2025-01-01T10:00:05+00:00', 4.0),
+            ('2025-01-01T10:00:35+00:00', 8.0),
+            ('2025-01-01T10:01:10+00:00', 6.0),
+        ]:
+            payload = base_payload('R1')
+            payload['captured_at'] = captured_at
+            payload['system_info']['used_ram_gb'] = used
+            self.assertEqual(self.client.post('/api/v1/ingest', payload, format='json').status_code, 201)
+
+    def _metrics(self, **params):
+        params = {'from': '2025-01-01T10:00:00Z', 'to': '2025-01-01T11:00:00Z', **params}
+        return self.client.get('/api/v1/hosts/R1/metrics', params)
+
+    def test_ingest_maintains_rollups_incrementally(self):
+        minute = MetricRollup.objects.get(resolution=60, bucket_start='2025-01-01T10:00:00Z')
+        self.assertEqual(minute.samples, 2)
+        self.assertEqual((minute.used_ram_gb_min, minute.used_ram_gb_max, minute.used_ram_gb_sum), (4.0, 8.0, 12.0))
+        self.assertEqual(MetricRollup.objects.get(resolution=3600).samples, 3)
+        self.assertEqual(MetricRollup.objects.filter(resolution=86400).count(), 1)
+
+    def test_metrics_picks_coarsest_resolution_for_step(self):
+        res = self._metrics(step='1h')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data['resolution'], 3600)
+        self.assertEqual(len(res.data['points']), 1)
+        self.assertEqual(res.data['points'][0]['used_ram_gb'], {'min': 4.0, 'max': 8.0, 'avg': 6.0})
+
+        res = self._metrics(step='5m')
+        self.assertEqual(res.data['resolution'], 60)
+        self.assertEqual(res.data['points'][0]['samples'], 3)
+
+        res = self._metrics(step='30')
+        self.assertEqual(res.data['resolution'], 0)
+        self.assertEqual([p['samples'] for p in res.data['points']], [1, 1, 1])
+
+    def test_step_is_rounded_up_to_whole_rollup_buckets(self):
+        payload = base_payload('R1')
+        payload['captured_at'] = '2025-01-01T10:02:10+00:00'
+        self.assertEqual(self.client.post('/api/v1/ingest', payload, format='json').status_code, 201)
+        res = self._metrics(step='90')
+        self.assertEqual((res.data['resolution'], res.data['step']), (60, 120))
+        self.assertEqual(
+            [(p['t'].isoformat(), p['samples']) for p in res.data['points']],
+            [('2025-01-01T10:00:00+00:00', 3), ('2025-01-01T10:02:00+00:00', 1)],
+        )
+
+    def test_metrics_rejects_bad_params(self):
+        self.assertEqual(self._metrics(step='soon').status_code, 400)
+        self.assertEqual(self._metrics(**{'from': '2025-01-02T00:00:00Z'}).status_code, 400)
+        for to in ('abc', 'nan', 'inf'):
+            self.assertEqual(self._metrics(to=to).status_code, 400, to)
+        self.assertEqual(self._metrics(**{'from': '1e30'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/hosts/R1/metrics', {'to': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/hosts/R1/metrics', {'to': '0001-01-01T00:00:00Z'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/hosts/NOPE/metrics').status_code, 404)
+
+
+class ProcessSeriesTests(MonitorTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.credentials(HTTP_X_API_KEY='K1')
+        # Two java processes at 10:00, one at 10:00:30; pid 50 is reused by a different program at 10:01
+        for captured_at, processes in [
+            ('2025-01-01T10:00:05+00:00', [(50, 'java', 100.0), (51, 'java', 300.0)]),
+            ('2025-01-01T10:00:35+00:00', [(50, 'java', 200.0)]),
+            ('2025-01-01T10:01:10+00:00', [(50, 'sshd', 4.0), (52, 'java', 500.0)]),
+        ]:
+            payload = base_payload('P1')
+            payload['captured_at'] = captured_at
+            payload['processes'] = [
+                {'pid': pid, 'ppid': 1, 'name': name, 'cpu_percent': mem / 10, 'memory_mb': mem, 'cmdline': ''}
+                for pid, name, mem in processes
+            ]
+            self.assertEqual(self.client.post('/api/v1/ingest', payload, format='json').status_code, 201)
+
+    def _series(self, selector, **params):
+        params = {'from': '2025-01-01T10:00:00Z', 'to': '2025-01-01T11:00:00Z', 'step': '1m', **params}
+        return self.client.get(f'/api/v1/hosts/P1/processes/{selector}/series', params)
+
+    def test_name_series_sums_processes_per_snapshot(self):
+        res = self._series('java')
+        self.assertEqual(res.status_code, 200)
+        [series] = res.data['series']
+        first, second = series['points']
+        self.assertEqual(first['t'], datetime(2025, 1, 1, 10, 0, tzinfo=timezone.utc))
+        self.assertEqual((first['samples'], first['processes']), (2, 2))
+        self.assertEqual(first['memory_mb'], {'min': 200.0, 'max': 400.0, 'avg': 300.0})
+        self.assertEqual(second['memory_mb'], {'min': 500.0, 'max': 500.0, 'avg': 500.0})
+
+        res = self._series('java', step='1h')
+        self.assertEqual(res.data['series'][0]['points'][0]['samples'], 3)
+
+    def test_pid_series_splits_reused_pid_by_program(self):
+        res = self._series('50')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data['pid'], 50)
+        self.assertEqual([(s['name'], len(s['points'])) for s in res.data['series']], [('java', 1), ('sshd', 1)])
+        self.assertEqual(res.data['series'][0]['points'][0]['memory_mb']['max'], 200.0)
+        self.assertIsNone(res.data['series'][0]['started'])
+
+    def test_pid_series_splits_reused_pid_by_start_time(self):
+        # The same program restarted under the same pid
+        for captured_at, started in [('2025-01-01T10:02:05+00:00', 1000), ('2025-01-01T10:03:05+00:00', 2000)]:
+            payload = base_payload('P1')
+            payload['captured_at'] = captured_at
+            payload['processes'] = [
+                {'pid': 60, 'ppid': 1, 'name': 'worker', 'cpu_percent': 1.0, 'memory_mb': 10.0, 'started': started}
+            ]
+            self.assertEqual(self.client.post('/api/v1/ingest', payload, format='json').status_code, 201)
+        res = self._series('60')
+        self.assertEqual([(s['name'], s['started']) for s in res.data['series']], [('worker', 1000), ('worker', 2000)])
+
+    def test_unknown_process_and_bad_params(self):
+        self.assertEqual(self._series('nope').data['series'], [])
+        self.assertEqual(self._series('java', by='pid').status_code, 400)
+        self.assertEqual(self._series('java', step='soon').status_code, 400)
+        self.assertEqual(self._series('java', to='abc').status_code, 400)
+        self.assertEqual(self._series('java', **{'from': '1e30'}).status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/hosts/NOPE/processes/java/series').status_code, 404)
+
+
+@override_settings(MONITOR_FLEET_TOP_K=2)
+class FleetTests(MonitorTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+
+    def _ingest(self, hostname, captured_at, mems, used_ram_gb=6.0):
+        payload = base_payload(hostname)
+        payload['captured_at'] = captured_at
+        payload['system_info']['used_ram_gb'] = used_ram_gb
+        payload['processes'] = [
+            {'pid': pid, 'ppid': 1, 'name': f'p{pid}', 'cpu_percent': 100.0 - mem, 'memory_mb': mem, 'cmdline': ''}
+            for pid, mem in enumerate(mems, start=10)
+        ]
+        self.client.credentials(HTTP_X_API_KEY=f'key-{hostname}')
+        self.assertEqual(self.client.post('/api/v1/ingest', payload, format='json').status_code, 201)
+
+    def test_top_reads_latest_snapshot_of_every_host(self):
+        self._ingest('A', '2025-01-01T10:00:00+00:00', [900.0, 1.0])
+        self._ingest('A', '2025-01-01T10:01:00+00:00', [50.0, 40.0, 30.0, 2.0])
+        self._ingest('B', '2025-01-01T10:00:30+00:00', [70.0, 3.0])
+        # A late, older snapshot does not replace A's latest rows
+        self._ingest('A', '2025-01-01T09:59:00+00:00', [5000.0])
+
+        # Top 2 by memory plus top 2 by CPU per host
+        self.assertEqual(LatestProcess.objects.filter(host__hostname='A').count(), 4)
+        self.client.credentials()
+        res = self.client.get('/api/v1/fleet/top', {'metric': 'memory_mb', 'n': 2})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([(r['hostname'], r['memory_mb']) for r in res.data['results']], [('B', 70.0), ('A', 50.0)])
+        res = self.client.get('/api/v1/fleet/top', {'metric': 'cpu_percent', 'n': 1})
+        self.assertEqual((res.data['results'][0]['hostname'], res.data['results'][0]['name']), ('A', 'p13'))
+        self.assertEqual(self.client.get('/api/v1/fleet/top', {'n': 3}).status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/fleet/top', {'metric': 'pid'}).status_code, 400)
+
+    @override_settings(MONITOR_FLEET_TOP_K=2)
+    def test_latest_rows_are_updated_in_place(self):
+        self._ingest('A', '2025-01-01T10:00:00+00:00', [50.0, 40.0, 30.0])
+        self._ingest('B', '2025-01-01T10:00:00+00:00', [10.0])
+        before = dict(LatestProcess.objects.filter(host__hostname='A').values_list('pid', 'id'))
+        # Top 2 by memory and by CPU: pids 10 and 11, then 12 and 11
+        self.assertEqual(set(before), {10, 11, 12})
+
+        # pid 12 exits; 10 and 11 stay with new values
+        self._ingest('A', '2025-01-01T10:01:00+00:00', [60.0, 45.0])
+        rows = LatestProcess.objects.filter(host__hostname='A').select_related('snapshot')
+        self.assertEqual({r.pid: r.id for r in rows}, {10: before[10], 11: before[11]})
+        self.assertEqual({r.pid: r.memory_mb for r in rows}, {10: 60.0, 11: 45.0})
+        self.assertEqual({r.snapshot.captured_at.minute for r in rows}, {1})
+        self.assertEqual(LatestProcess.objects.filter(host__hostname='B').count(), 1)
+
+    def test_summary_totals_latest_snapshots(self):
+        self._ingest('A', '2025-01-01T10:00:00+00:00', [1.0], used_ram_gb=2.0)
+        self._ingest('A', '2025-01-01T10:01:00+00:00', [1.0, 2.0], used_ram_gb=4.0)
+        self._ingest('B', '2025-01-01T10:00:30+00:00', [1.0], used_ram_gb=5.5)
+        self.client.credentials()
+        with self.assertNumQueries(1):
+            res = self.client.get('/api/v1/fleet/summary')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual((res.data['hosts'], res.data['processes'], res.data['used_ram_gb']), (2, 3, 9.5))
+        self.assertEqual(res.data['ram_gb'], 32.0)
+
+
+class RetentionTests(MonitorTestCase):
+    NOW = datetime(2025, 1, 20, 12, 0, tzinfo=timezone.utc)
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.credentials(HTTP_X_API_KEY='K1')
+        ages = [
+            timedelta(minutes=5),                       # recent: untouched
+            timedelta(days=2, seconds=10),              # same minute x3: one survives
+            timedelta(days=2, seconds=20),
+            timedelta(days=2, seconds=30),
+            timedelta(days=10, minutes=10),             # same hour, different minutes: one survives
+            timedelta(days=10, minutes=20),
+        ]
+        for age in ages:
+            payload = base_payload('OLD')
+            payload['captured_at'] = (self.NOW - age).isoformat()
+            self.assertEqual(self.client.post('/api/v1/ingest', payload, format='json').status_code, 201)
+
+    def test_retention_prunes_detail_and_thins_snapshots(self):
+        rollups_before = MetricRollup.objects.count()
+        report = retention.run(now=self.NOW, BATCH_SIZE=2, BATCH_PAUSE_SEC=0)
+
+        self.assertEqual(report['snapshots_deleted'], 3)
+        self.assertEqual(report['processes_deleted'], 10)
+        self.assertIsNotNone(report['bytes_reclaimed'])
+        kept = list(Snapshot.objects.order_by('captured_at').values_list('captured_at', flat=True))
+        self.assertEqual(kept, [
+            self.NOW - timedelta(days=10, minutes=10),
+            self.NOW - timedelta(days=2, seconds=10),
+            self.NOW - timedelta(minutes=5),
+        ])
+        # Only the recent snapshot keeps its process rows; rollups are untouched
+        self.assertEqual(Process.objects.count(), 2)
+        self.assertEqual(MetricRollup.objects.count(), rollups_before)
+
+    def test_thinning_deletes_while_scanning_in_small_pages(self):
+        with mock.patch.object(retention, 'SCAN_CHUNK', 2), \
+                mock.patch.object(retention, '_thinned_ids', wraps=retention._thinned_ids) as scan:
+            report = retention.run(now=self.NOW, BATCH_SIZE=1, BATCH_PAUSE_SEC=0)
+        self.assertEqual(report['snapshots_deleted'], 3)
+        self.assertEqual(Snapshot.objects.count(), 3)
+        self.assertEqual(scan.call_count, 1)
+
+    def test_retention_sweeps_unreferenced_strings(self):
+        payload = base_payload('OLD')
+        payload['captured_at'] = (self.NOW - timedelta(days=3)).isoformat()
+        payload['processes'][0].update(name='gone.exe', cmdline='gone.exe --once')
+        self.assertEqual(self.client.post('/api/v1/ingest', payload, format='json').status_code, 201)
+        # A dry run prunes nothing, so it only counts strings that are unreferenced already
+        self.assertEqual(retention.run(now=self.NOW, dry_run=True)['strings_deleted'], 0)
+
+        report = retention.run(now=self.NOW, BATCH_PAUSE_SEC=0)
+        self.assertEqual(report['strings_deleted'], 2)
+        self.assertFalse(ProcessName.objects.filter(value='gone.exe').exists())
+        self.assertFalse(CommandLine.objects.filter(value='gone.exe --once').exists())
+        # Names still in use stay, and a swept string is interned again on its next use
+        self.assertTrue(ProcessName.objects.filter(value=base_payload('OLD')['processes'][0]['name']).exists())
+        payload['captured_at'] = (self.NOW - timedelta(minutes=1)).isoformat()
+        self.assertEqual(self.client.post('/api/v1/ingest', payload, format='json').status_code, 201)
+        self.assertTrue(ProcessName.objects.filter(value='gone.exe').exists())
+
+    def test_apply_retention_command_dry_run(self):
+        out = StringIO()
+        call_command('apply_retention', '--dry-run', stdout=out)
+        report = json.loads(out.getvalue())
+        self.assertTrue(report['dry_run'])
+        self.assertEqual(Snapshot.objects.count(), 6)
+
+    def test_delta_against_pruned_base_requests_keyframe(self):
+        retention.run(now=self.NOW, BATCH_PAUSE_SEC=0)
+        base = Snapshot.objects.order_by('captured_at').first()
+        payload = base_payload('OLD')
+        del payload['processes']
+        payload['base_captured_at'] = base.captured_at.isoformat()
+        payload['delta'] = {}
+        res = self.client.post('/api/v1/ingest', payload, format='json')
+        self.assertEqual(res.status_code, 409)
+
+
+class HostIndexTests(MonitorTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+
+    def _ingest(self, hostname, captured_at):
+        self.client.credentials(HTTP_X_API_KEY=f'KEY-{hostname}')
+        payload = base_payload(hostname)
+        payload['captured_at'] = captured_at
+        res = self.client.post('/api/v1/ingest', payload, format='json')
+        self.assertEqual(res.status_code, 201)
+        return res.data['snapshot_id']
+
+    def test_latest_pointer_ignores_late_arrivals(self):
+        newest = self._ingest('A', '2025-01-01T10:00:10+00:00')
+        self._ingest('A', '2025-01-01T10:00:00+00:00')
+        host = Host.objects.get(hostname='A')
+        self.assertEqual(host.latest_snapshot_id, newest)
+        self.assertEqual(host.last_seen.isoformat(), '2025-01-01T10:00:10+00:00')
+
+    def test_hosts_and_latest_cost_is_independent_of_history(self):
+        for i in range(5):
+            self._ingest('A', f'2025-01-01T10:00:0{i}+00:00')
+        self._ingest('B', '2025-01-01T09:00:00+00:00')
+        Host.objects.create(hostname='NEVER-REPORTED', api_key='X')
+        self.client.credentials()
+
+        with self.assertNumQueries(1):
+            res = self.client.get('/api/v1/hosts')
+        self.assertEqual([h['hostname'] for h in res.data], ['A', 'B'])
+
+        with self.assertNumQueries(1):
+            res = self.client.get('/api/v1/snapshots/latest', {'hostname': 'A'})
+        self.assertEqual(res.data['captured_at'].isoformat(), '2025-01-01T10:00:04+00:00')
+
+
+class InterningTests(MonitorTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.credentials(HTTP_X_API_KEY='K1')
+
+    def _ingest(self, second):
+        payload = base_payload('H1')
+        payload['captured_at'] = f'2025-01-01T10:00:{second:02d}+00:00'
+        payload['processes'].append(
+            {'pid': 3, 'ppid': 1, 'name': 'java', 'cpu_percent': 1.0, 'memory_mb': 900.0, 'cmdline': 'java -jar app.jar'}
+        )
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post('/api/v1/ingest', payload, format='json')
+        self.assertEqual(res.status_code, 201)
+        return res.data['snapshot_id']
+
+    def test_strings_are_stored_once_and_read_back(self):
+        self._ingest(0)
+        sid = self._ingest(1)
+        self.assertEqual(ProcessName.objects.count(), 3)
+        self.assertEqual(CommandLine.objects.count(), 1)  # empty command lines are not interned
+
+        self.client.credentials()
+        res = self.client.get(f'/api/v1/snapshots/{sid}/processes', {'name': 'JAV'})
+        self.assertEqual(res.data, [
+            {
+                'pid': 3, 'ppid': 1, 'name': 'java', 'cpu_percent': 1.0, 'memory_mb': 900.0,
+                'cmdline': 'java -jar app.jar', 'started': None,
+            }
+        ])
+        res = self.client.get(f'/api/v1/snapshots/{sid}/processes', {'sort': 'name', 'fields': 'name'})
+        self.assertEqual([p['name'] for p in res.data], ['Child', 'System', 'java'])
+
+    def test_known_strings_skip_dictionary_tables(self):
+        self._ingest(0)
+        with CaptureQueriesContext(connection) as ctx:
+            self._ingest(1)
+        tables = ' '.join(q['sql'] for q in ctx.captured_queries)
+        self.assertNotIn('monitor_processname', tables)
+        self.assertNotIn('monitor_commandline', tables)
+
+    def test_digest_collision_fails_loudly(self):
+        ProcessName.objects.create(digest=interning.digest('real'), value='impostor')
+        with self.assertRaises(interning.DigestCollision):
+            interning.names.resolve({'real'})
+        with mock.patch.object(interning, 'digest', return_value=7):
+            with self.assertRaises(interning.DigestCollision):
+                interning.names.resolve({'a', 'b'})
+
+    def test_cached_ids_expire(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            first = interning.names.resolve({'svc'})
+        with mock.patch.object(interning.names, 'ttl', -1), self.assertNumQueries(1):
+            self.assertEqual(interning.names.resolve({'svc'}), first)
+        with self.assertNumQueries(0):
+            interning.names.resolve({'svc'})
+
+    def test_ids_are_cached_only_after_commit(self):
+        try:
+            with transaction.atomic():
+                interning.names.resolve({'ghost'})
+                raise RuntimeError
+        except RuntimeError:
+            pass
+        self.assertFalse(ProcessName.objects.filter(value='ghost').exists())
+        self.assertEqual(interning.names.resolve({'ghost'}).keys(), {'ghost'})
+        self.assertTrue(ProcessName.objects.filter(value='ghost').exists())
+
+
+class InventoryTests(MonitorTestCase):
+    STATIC = ('os', 'processor', 'cores', 'threads', 'ram_gb', 'storage_total_gb')
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.credentials(HTTP_X_API_KEY='K1')
+
+    def _payload(self, second, **static):
+        payload = base_payload('H1')
+        payload['captured_at'] = f'2025-01-01T10:00:{second:02d}+00:00'
+        for field in self.STATIC:
+            payload['system_info'].pop(field)
+        payload.update(static)
+        return payload
+
+    def _legacy_inventory(self):
+        return {f: base_payload()['system_info'][f] for f in self.STATIC}
+
+    def test_legacy_payloads_share_one_version(self):
+        for second in (0, 1):
+            payload = base_payload('H1')
+            payload['captured_at'] = f'2025-01-01T10:00:{second:02d}+00:00'
+            with self.captureOnCommitCallbacks(execute=True):
+                self.assertEqual(self.client.post('/api/v1/ingest', payload, format='json').status_code, 201)
+        self.assertEqual(HostInventory.objects.count(), 1)
+        self.assertEqual(len({s.inventory_id for s in Snapshot.objects.all()}), 1)
+
+        self.client.credentials()
+        res = self.client.get('/api/v1/snapshots/latest', {'hostname': 'H1'})
+        self.assertEqual({f: res.data['system'][f] for f in self.STATIC}, self._legacy_inventory())
+        self.assertEqual(res.data['system']['used_ram_gb'], 6.0)
+
+    def test_hash_only_after_inventory_is_known(self):
+        inv = self._legacy_inventory()
+        digest = inventory.digest_hex(inv)
+        res = self.client.post('/api/v1/ingest', self._payload(0, inventory_hash=digest), format='json')
+        self.assertEqual(res.status_code, 409)
+        self.assertTrue(res.data['inventory_required'])
+
+        res = self.client.post('/api/v1/ingest', self._payload(0, inventory=inv, inventory_hash=digest), format='json')
+        self.assertEqual(res.status_code, 201)
+        res = self.client.post('/api/v1/ingest', self._payload(1, inventory_hash=digest), format='json')
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(Snapshot.objects.get(id=res.data['snapshot_id']).inventory.ram_gb, 16.0)
+
+        # An upgrade is a new version; the old snapshots keep theirs
+        upgraded = {**inv, 'ram_gb': 32.0}
+        res = self.client.post('/api/v1/ingest', self._payload(2, inventory=upgraded), format='json')
+        self.assertEqual(res.status_code, 201)
+        self.assertEqual(HostInventory.objects.count(), 2)
+        self.assertEqual(
+            list(Snapshot.objects.order_by('captured_at').values_list('inventory__ram_gb', flat=True)), [16.0, 16.0, 32.0]
+        )
+
+    def test_mismatched_hash_is_rejected(self):
+        res = self.client.post(
+            '/api/v1/ingest', self._payload(0, inventory=self._legacy_inventory(), inventory_hash='0' * 16), format='json'
+        )
+        self.assertEqual(res.status_code, 400)
+        res = self.client.post('/api/v1/ingest', self._payload(0), format='json')
+        self.assertEqual(res.status_code, 400)
+
+    def test_batch_reports_unknown_hash_per_item(self):
+        inv = self._legacy_inventory()
+        digest = inventory.digest_hex(inv)
+        items = [self._payload(0, inventory_hash=digest), self._payload(1, inventory=inv), self._payload(2, inventory_hash=digest)]
+        res = self.client.post('/api/v1/ingest/batch', {'snapshots': items}, format='json')
+        self.assertEqual([r['status'] for r in res.data['results']], [409, 201, 201])
+        self.assertTrue(res.data['results'][0]['inventory_required'])
+
+
+class StorageTests(MonitorTestCase):
+    def test_process_rows_carry_snapshot_time(self):
+        client = APIClient()
+        client.credentials(HTTP_X_API_KEY='K1')
+        payload = base_payload('H1')
+        payload['captured_at'] = '2025-01-01T12:30:00+02:00'
+        sid = client.post('/api/v1/ingest', payload, format='json').data['snapshot_id']
+        snap = Snapshot.objects.get(id=sid)
+        self.assertEqual(set(Process.objects.filter(snapshot=snap).values_list('captured_at', flat=True)), {snap.captured_at})
+        # Raw inserts use the ORM's storage format, so lookups on the column work
+        self.assertEqual(Process.objects.filter(captured_at=snap.captured_at).count(), 2)
+        self.assertEqual(partitions.drop_before(snap.captured_at + timedelta(days=2)), 0)  # no-op off PostgreSQL
+
+    def test_partition_dropped_elsewhere_is_recreated(self):
+        class NoPartition(Exception):
+            sqlstate = '23514'
+
+            def __str__(self):
+                return 'no partition of relation "monitor_process" found for row'
+
+        def insert():
+            calls.append(set(partitions._known_days))
+            if len(calls) == 1:
+                raise IntegrityError('no partition') from NoPartition()
+            return 'ok'
+
+        ts = datetime(2025, 1, 1, 23, 30, tzinfo=timezone.utc)
+        created = []
+        calls = []
+        # Another process dropped this day after this one had created it
+        partitions._known_days.add(ts.date())
+        try:
+            with mock.patch.object(partitions, 'enabled', return_value=True), \
+                    mock.patch.object(partitions, 'ensure_days', side_effect=lambda days: created.append(days - partitions._known_days)):
+                self.assertEqual(partitions.write({ts}, insert), 'ok')
+        finally:
+            partitions._known_days.discard(ts.date())
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(created, [set(), {ts.date()}])
+
+        def broken():
+            raise IntegrityError('duplicate key')
+        with mock.patch.object(partitions, 'enabled', return_value=True), \
+                mock.patch.object(partitions, 'ensure_days'):
+            with self.assertRaises(IntegrityError):
+                partitions.write({ts}, broken)
+
+    def test_sqlite_connection_is_tuned(self):
+        if connection.vendor != 'sqlite':
+            self.skipTest('SQLite only')
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone()[0], 1)  # NORMAL
+            cursor.execute('PRAGMA temp_store')
+            self.assertEqual(cursor.fetchone()[0], 2)  # MEMORY
+
+
+@override_settings(MONITOR_CACHE_SHARED=True)
+class ReadCacheTests(MonitorTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        # Recent enough that per-snapshot entries are inside the retention window
+        self.t0 = datetime.now(timezone.utc).replace(microsecond=0) - timedelta(minutes=5)
+
+    def _at(self, seconds):
+        return (self.t0 + timedelta(seconds=seconds)).isoformat()
+
+    def _ingest(self, captured_at):
+        self.client.credentials(HTTP_X_API_KEY='K1')
+        payload = base_payload('C1')
+        payload['captured_at'] = captured_at
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post('/api/v1/ingest', payload, format='json')
+        self.client.credentials()
+        return res.data['snapshot_id']
+
+    def test_cached_reads_skip_database_and_honor_etag(self):
+        sid = self._ingest(self._at(0))
+        first = self.client.get('/api/v1/snapshots/latest', {'hostname': 'C1'})
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('Last-Modified', first)
+        procs = self.client.get(f'/api/v1/snapshots/{sid}/processes')
+
+        with self.assertNumQueries(0):
+            again = self.client.get('/api/v1/snapshots/latest', {'hostname': 'C1'})
+            procs = self.client.get(f'/api/v1/snapshots/{sid}/processes', HTTP_IF_NONE_MATCH=procs['ETag'])
+        self.assertEqual(again.data, first.data)
+        self.assertEqual(procs.status_code, 304)
+
+        res = self.client.get('/api/v1/snapshots/latest', {'hostname': 'C1'}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(self.client.get('/api/v1/hosts', HTTP_IF_MODIFIED_SINCE=first['Last-Modified']).status_code, 304)
+
+    def test_ingest_invalidates_latest_and_hosts(self):
+        self._ingest(self._at(0))
+        old = self.client.get('/api/v1/snapshots/latest', {'hostname': 'C1'})
+        self.client.get('/api/v1/hosts')
+
+        newer = self._ingest(self._at(2))
+        res = self.client.get('/api/v1/snapshots/latest', {'hostname': 'C1'}, HTTP_IF_NONE_MATCH=old['ETag'])
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data['snapshot_id'], newer)
+        hosts = self.client.get('/api/v1/hosts')
+        self.assertEqual(hosts.data[0]['last_seen'].isoformat(), self._at(2))
+
+    def test_errors_are_not_cached(self):
+        self.assertEqual(self.client.get('/api/v1/snapshots/latest', {'hostname': 'C1'}).status_code, 404)
+        self._ingest(self._at(0))
+        self.assertEqual(self.client.get('/api/v1/snapshots/latest', {'hostname': 'C1'}).status_code, 200)
+
+    @override_settings(MONITOR_CACHE_SHARED=False)
+    def test_unshared_cache_keeps_only_immutable_entries(self):
+        sid = self._ingest(self._at(0))
+        first = self.client.get('/api/v1/snapshots/latest', {'hostname': 'C1'})
+        self.client.get(f'/api/v1/snapshots/{sid}/processes')
+        # Another server process ingests: this process's cache is not told
+        with mock.patch('monitor.cache.transaction.on_commit'):
+            newer = self._ingest(self._at(2))
+        res = self.client.get('/api/v1/snapshots/latest', {'hostname': 'C1'}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(res.data['snapshot_id'], newer)
+        again = self.client.get('/api/v1/snapshots/latest', {'hostname': 'C1'}, HTTP_IF_NONE_MATCH=res['ETag'])
+        self.assertEqual(again.status_code, 304)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(f'/api/v1/snapshots/{sid}/processes').status_code, 200)
+
+    @override_settings(ALLOWED_HOSTS=['testserver', 'a.example', 'b.example'])
+    def test_cached_pages_link_relatively(self):
+        sid = self._ingest(self._at(0))
+        url = f'/api/v1/snapshots/{sid}/processes'
+        page = self.client.get(url, {'limit': 1, 'sort': 'pid'}, HTTP_HOST='a.example')
+        self.assertEqual(page.data['next'], f'{url}?limit=1&offset=1&sort=pid')
+        self.assertIsNone(page.data['previous'])
+        # Served from the cache to a client that used another host name
+        again = self.client.get(url, {'limit': 1, 'offset': 1, 'sort': 'pid'}, HTTP_HOST='b.example')
+        self.assertEqual(again.data['previous'], f'{url}?limit=1&sort=pid')
+
+
+    def test_snapshots_near_retention_are_not_cached(self):
+        old = datetime.now(timezone.utc) - timedelta(hours=25)
+        sid = self._ingest(old.isoformat())
+        url = f'/api/v1/snapshots/{sid}/processes'
+        self.client.get(url)
+        self.client.get(f'/api/v1/snapshots/{sid}/tree')
+        with self.assertNumQueries(2):
+            self.client.get(url)
+        with mock.patch('monitor.cache.timezone.now', return_value=old + timedelta(hours=24, seconds=-10)):
+            self.assertEqual(cache_module.retention_timeout(old), 10)
+
+class StreamTests(MonitorTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.credentials(HTTP_X_API_KEY='K1')
+        self.loop = asyncio.new_event_loop()
+        self.addCleanup(self.loop.close)
+        self.addCleanup(lambda: self.loop.run_until_complete(self.loop.shutdown_asyncgens()))
+
+    def _next(self, sub):
+        return self.loop.run_until_complete(asyncio.wait_for(sub.queue.get(), 1))
+
+    def test_ingest_publishes_to_matching_subscribers_after_commit(self):
+        mine = broker.subscribe('S1', loop=self.loop)
+        other = broker.subscribe('S2', loop=self.loop)
+        everyone = broker.subscribe(None, loop=self.loop)
+        self.addCleanup(lambda: [broker.unsubscribe(s) for s in (mine, other, everyone)])
+
+        keyframe = base_payload('S1')
+        with self.captureOnCommitCallbacks(execute=True):
+            res = self.client.post('/api/v1/ingest', keyframe, format='json')
+
+        data = self._next(mine)
+        self.assertEqual(data, self._next(everyone))  # encoded once, shared by all subscribers
+        event = json.loads(data.decode().split('data: ', 1)[1])
+        self.assertEqual(event['snapshot_id'], res.data['snapshot_id'])
+        self.assertEqual(len(event['processes']), 2)
+        latest = self.client.get('/api/v1/snapshots/latest', {'hostname': 'S1'})
+        self.assertEqual(event['captured_at'], json.loads(latest.content)['captured_at'])
+        self.assertIn('T', event['captured_at'])
+        self.assertTrue(other.queue.empty())
+
+        delta = base_payload('S1')
+        del delta['processes']
+        delta['base_captured_at'] = keyframe['captured_at']
+        delta['delta'] = {'removed': [2]}
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post('/api/v1/ingest', delta, format='json')
+        event = json.loads(self._next(mine).decode().split('data: ', 1)[1])
+        self.assertEqual(event['delta']['removed'], [2])
+        self.assertEqual(event['base_captured_at'], json.loads(latest.content)['captured_at'])
+        self.assertEqual(event['process_count'], 1)
+
+    def test_slow_subscriber_is_dropped(self):
+        sub = Broker(queue_size=1).subscribe(None, loop=self.loop)
+        sub.offer(b'one')
+        sub.offer(b'two')
+        self.assertIsNone(self._next(sub))
+
+    def test_stream_endpoint_serves_event_stream(self):
+        async def first_chunk():
+            res = await AsyncClient().get('/api/v1/stream', {'hostname': 'S1'})
+            chunk = await res.streaming_content.__anext__()
+            return res, chunk
+
+        res, chunk = self.loop.run_until_complete(first_chunk())
+        self.assertEqual(res['Content-Type'], 'text/event-stream')
+        self.assertTrue(chunk.startswith(b'retry:'))
+
+    def test_stream_endpoint_refuses_wsgi(self):
+        self.assertEqual(self.client.get('/api/v1/stream').status_code, 501)
+
+
+class ProcessListQueryTests(MonitorTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.credentials(HTTP_X_API_KEY='K1')
+        payload = base_payload('Q1')
+        payload['processes'] = [
+            {'pid': pid, 'ppid': 1, 'name': f'worker-{pid}' if pid % 2 else f'svc-{pid}',
+             'cpu_percent': float(pid % 7), 'memory_mb': float(pid * 10), 'cmdline': f'/bin/p{pid} --long-args'}
+            for pid in range(1, 21)
+        ]
+        self.sid = self.client.post('/api/v1/ingest', payload, format='json').data['snapshot_id']
+        self.url = f'/api/v1/snapshots/{self.sid}/processes'
+
+    def test_top_k_by_memory_with_field_selection(self):
+        res = self.client.get(self.url, {'sort': 'mem', 'limit': 3, 'fields': 'pid,name,memory_mb'})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.data['count'], 20)
+        self.assertEqual([p['pid'] for p in res.data['results']], [20, 19, 18])
+        self.assertEqual(set(res.data['results'][0]), {'pid', 'name', 'memory_mb'})
+        self.assertIsNotNone(res.data['next'])
+
+    def test_filters_sort_and_offset(self):
+        res = self.client.get(self.url, {'name': 'WORKER', 'sort': 'cpu', 'limit': 2, 'offset': 1})
+        self.assertEqual(res.data['count'], 10)
+        cpus = [p['cpu_percent'] for p in res.data['results']]
+        self.assertEqual(cpus, sorted(cpus, reverse=True))
+        self.assertTrue(all(p['name'].startswith('worker-') for p in res.data['results']))
+
+        res = self.client.get(self.url, {'pid': 7})
+        self.assertEqual([p['pid'] for p in res.data], [7])
+        # No paging parameters: the full list, as before
+        self.assertEqual(len(self.client.get(self.url).data), 20)
+
+    def test_search_matches_name_pid_and_ppid(self):
+        def search(q):
+            return sorted(p['pid'] for p in self.client.get(self.url, {'q': q}).data)
+
+        self.assertEqual(search('SVC'), list(range(2, 21, 2)))
+        # Digits match anywhere in the pid or ppid (every process here has ppid 1), as well as in names
+        self.assertEqual(search('1'), list(range(1, 21)))
+        self.assertEqual(search('7'), [7, 17])
+        self.assertEqual(search('nothing'), [])
+
+    def test_rejects_unknown_sort_and_fields(self):
+        self.assertEqual(self.client.get(self.url, {'sort': 'rss'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'fields': 'pid,secret'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'pid': 'abc'}).status_code, 400)
+        self.assertEqual(self.client.get(self.url, {'pid': '--1'}).status_code, 400)
+        for limit in ('abc', '0', '-1', ''):
+            self.assertEqual(self.client.get(self.url, {'limit': limit}).status_code, 400, limit)
+
+
+class ProcessTreeTests(MonitorTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        self.client.credentials(HTTP_X_API_KEY='K1')
+        payload = base_payload('T1')
+        payload['processes'] = [
+            {'pid': 1, 'ppid': 0, 'name': 'init', 'cpu_percent': 1.0, 'memory_mb': 10.0},
+            {'pid': 2, 'ppid': 1, 'name': 'sshd', 'cpu_percent': 2.0, 'memory_mb': 20.0},
+            {'pid': 3, 'ppid': 2, 'name': 'bash', 'cpu_percent': 3.0, 'memory_mb': 30.0},
+            {'pid': 4, 'ppid': 1, 'name': 'cron', 'cpu_percent': 0.5, 'memory_mb': 5.0},
+            {'pid': 9, 'ppid': 8, 'name': 'orphan', 'cpu_percent': 0.0, 'memory_mb': 1.0},
+            # PPID cycle with no root: still listed exactly once
+            {'pid': 20, 'ppid': 21, 'name': 'loop-a', 'cpu_percent': 0.0, 'memory_mb': 2.0},
+            {'pid': 21, 'ppid': 20, 'name': 'loop-b', 'cpu_percent': 0.0, 'memory_mb': 3.0},
+        ]
+        self.sid = self.client.post('/api/v1/ingest', payload, format='json').data['snapshot_id']
+        self.client.credentials()
+        self.url = f'/api/v1/snapshots/{self.sid}/tree'
+
+    def test_nested_tree_with_subtree_totals(self):
+        res = self.client.get(self.url)
+        self.assertEqual(res.status_code, 200)
+        roots = {n['pid']: n for n in res.data['nodes']}
+        self.assertEqual(set(roots), {1, 9, 20})
+        init = roots[1]
+        self.assertEqual((init['subtree_memory_mb'], init['subtree_cpu_percent'], init['subtree_size']), (65.0, 6.5, 4))
+        self.assertEqual([c['name'] for c in init['children']], ['cron', 'sshd'])
+        self.assertEqual(init['children'][1]['children'][0]['pid'], 3)
+        self.assertEqual(roots[20]['subtree_memory_mb'], 5.0)
+
+    def test_lazy_expansion_and_flat_format(self):
+        res = self.client.get(self.url, {'depth': 1})
+        self.assertTrue(all('children' not in n for n in res.data['nodes']))
+        self.assertEqual({n['pid']: n['child_count'] for n in res.data['nodes']}[1], 2)
+
+        res = self.client.get(self.url, {'root': 2, 'depth': 1})
+        self.assertEqual(res.data['root']['subtree_size'], 2)
+        self.assertEqual([n['pid'] for n in res.data['nodes']], [3])
+
+        res = self.client.get(self.url, {'root': 1, 'layout': 'flat'})
+        self.assertEqual([(n['pid'], n['level']) for n in res.data['nodes']], [(4, 0), (2, 0), (3, 1)])
+
+    def test_tree_is_built_once_per_snapshot(self):
+        self.client.get(self.url, {'depth': 1})
+        with self.assertNumQueries(1):  # snapshot lookup only; the tree itself comes from the cache
+            self.client.get(self.url, {'root': 1, 'depth': 2})
+
+    def test_tree_errors(self):
+        self.assertEqual(self.client.get(self.url, {'root': 999}).status_code, 404)
+        self.assertEqual(self.client.get(self.url, {'depth': 0}).status_code, 400)
+        self.assertEqual(self.client.get('/api/v1/snapshots/999999/tree').status_code, 404)
+
+
+class AlertTests(MonitorTestCase):
+    T0 = datetime(2025, 1, 1, 10, 0, tzinfo=timezone.utc)
+
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+        patcher = mock.patch.object(alerts.webhook, 'send')
+        self.webhook = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def _ingest(self, hostname, minutes, used_ram_gb=6.0, names=('System', 'Child')):
+        payload = base_payload(hostname)
+        payload['captured_at'] = (self.T0 + timedelta(minutes=minutes)).isoformat()
+        payload['system_info']['used_ram_gb'] = used_ram_gb
+        payload['processes'] = [
+            {'pid': pid, 'ppid': 0, 'name': name, 'cpu_percent': 1.0, 'memory_mb': 1.0, 'cmdline': ''}
+            for pid, name in enumerate(names, start=1)
+        ]
+        self.client.credentials(HTTP_X_API_KEY=f'key-{hostname}')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post('/api/v1/ingest', payload, format='json').status_code, 201)
+
+    def test_expressions_are_restricted(self):
+        with self.assertRaises(alerts.RuleError):
+            alerts.compile_expression('__import__("os").system("true") > 0')
+        with self.assertRaises(alerts.RuleError):
+            alerts.compile_expression('count == 0')  # process variable without process_name
+        with self.assertRaises(alerts.RuleError):
+            alerts.compile_expression('used_ram_gb')  # no comparison
+        with self.assertRaises(ValidationError):
+            AlertRule(name='bad', expression='ram_gb.real > 1').full_clean()
+        alerts.compile_expression('used_ram_gb / ram_gb > 0.9 and not cores < 2')
+
+    def test_fires_after_holding_for_duration_then_resolves(self):
+        AlertRule.objects.create(name='ram', expression='used_ram_gb / ram_gb > 0.9', for_seconds=300)
+        self._ingest('H1', 0, used_ram_gb=15.0)
+        self._ingest('H1', 2, used_ram_gb=15.5)
+        self.assertFalse(Alert.objects.exists())
+        self._ingest('H1', 5, used_ram_gb=15.0)
+        alert = Alert.objects.get()
+        self.assertEqual((alert.fired_at, alert.resolved_at, alert.value), (self.T0 + timedelta(minutes=5), None, 0.9375))
+        # A late snapshot from before the alert changes nothing
+        self._ingest('H1', 1, used_ram_gb=1.0)
+        self.assertIsNone(Alert.objects.get().resolved_at)
+
+        self._ingest('H1', 6, used_ram_gb=2.0)
+        self.assertEqual(Alert.objects.get().resolved_at, self.T0 + timedelta(minutes=6))
+        self.assertEqual([c.args[0]['state'] for c in self.webhook.call_args_list], ['firing', 'resolved'])
+
+    def test_process_rule_only_applies_to_matching_hosts(self):
+        AlertRule.objects.create(name='nginx down', hostname='web-*', process_name='nginx', expression='count == 0')
+        self._ingest('web-1', 0, names=('nginx', 'nginx'))
+        self._ingest('web-2', 0, names=('System',))
+        self._ingest('db-1', 0, names=('System',))
+        res = self.client.get('/api/v1/alerts')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual([(a['rule'], a['hostname']) for a in res.data['results']], [('nginx down', 'web-2')])
+        self.assertEqual(self.client.get('/api/v1/alerts', {'state': 'resolved'}).data['results'], [])
+        self.assertEqual(self.client.get('/api/v1/alerts', {'state': 'open'}).status_code, 400)
+
+    def test_open_alerts_survive_engine_restart(self):
+        AlertRule.objects.create(name='busy', process_name='java', expression='cpu_percent > 80')
+        self._ingest('H1', 0, names=('java',) * 100)
+        alerts.engine.reset()
+        self._ingest('H1', 1, names=('java',) * 100)
+        self.assertEqual(Alert.objects.count(), 1)
+        self._ingest('H1', 2, names=('java',))
+        self.assertIsNotNone(Alert.objects.get().resolved_at)
+
+    def test_disabling_rule_closes_its_alerts(self):
+        rule = AlertRule.objects.create(name='procs', expression='process_count >= 2')
+        self._ingest('H1', 0)
+        rule.enabled = False
+        rule.save()
+        self.assertIsNotNone(Alert.objects.get().resolved_at)
+        self._ingest('H1', 1)
+        self.assertEqual(Alert.objects.count(), 1)
+
+
+class BenchTests(MonitorTestCase):
+    def test_fleet_is_seeded_and_churns(self):
+        first = bench.SyntheticFleet(hosts=2, processes=50, churn=0.1, cmdline_length=40, seed=7).tick()
+        again = bench.SyntheticFleet(hosts=2, processes=50, churn=0.1, cmdline_length=40, seed=7).tick()
+        self.assertEqual([p['processes'] for p in first], [p['processes'] for p in again])
+
+        fleet = bench.SyntheticFleet(hosts=1, processes=50, churn=0.1, seed=7)
+        before = {p['pid'] for p in fleet.tick()[0]['processes']}
+        after = {p['pid'] for p in fleet.tick()[0]['processes']}
+        self.assertEqual((len(before), len(after), len(before - after)), (50, 50, 5))
+        self.assertTrue(all(len(p['cmdline']) <= 120 for p in fleet.tick()[0]['processes']))
+
+    def test_run_reports_ingest_and_reads(self):
+        fleet = bench.SyntheticFleet(hosts=2, processes=20, seed=1)
+        report = bench.run(bench.ClientTarget(), fleet, ticks=2, reads=1)
+        json.dumps(report)
+        self.assertEqual(report['ingest']['statuses'], {'201': 4})
+        self.assertGreater(report['ingest']['queries_per_request']['mean'], 0)
+        self.assertIn('fleet_top', report['reads'])
+        self.assertTrue(all(set(r['statuses']) == {'200'} for r in report['reads'].values()))
+        self.assertGreaterEqual(report['db']['bytes_after'], report['db']['bytes_before'])
+
+    def test_codec_reports_each_step(self):
+        report = bench.codec(bench.SyntheticFleet(hosts=1, processes=20, seed=1), rounds=2)
+        json.dumps(report)
+        self.assertEqual(report['config']['processes'], 20)
+        for step in ('parse', 'validate', 'render'):
+            self.assertGreater(report[step]['drf_ms'], 0)
+            self.assertGreater(report[step]['fast_ms'], 0)
+
+
+class MetricsTests(MonitorTestCase):
+    def setUp(self):
+        super().setUp()
+        metrics.reset()
+        self.client = APIClient()
+
+    def test_requests_and_ingest_are_exported(self):
+        self.client.credentials(HTTP_X_API_KEY='K1')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.post('/api/v1/ingest', base_payload('H1'), format='json').status_code, 201)
+        self.assertEqual(self.client.post('/api/v1/ingest', {}, format='json').status_code, 400)
+        self.client.credentials()
+        self.client.get('/api/v1/hosts')
+
+        self.assertEqual(metrics.REQUEST_SECONDS.count(('ingest', 'POST', '201')), 1)
+        self.assertEqual(metrics.REQUEST_SECONDS.count(('hosts', 'GET', '200')), 1)
+        self.assertEqual(metrics.VALIDATION_SECONDS.count(('JSONIngestSerializer',)), 2)
+        self.assertGreater(metrics.DB_QUERIES.value(('ingest',)), 0)
+        self.assertEqual((metrics.INGEST_SNAPSHOTS.value(), metrics.INGEST_PROCESSES.value()), (1, 2))
+
+        res = self.client.get('/metrics')
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res['Content-Type'].startswith('text/plain'))
+        text = res.content.decode()
+        self.assertIn('monitor_http_request_duration_seconds_bucket{view="ingest",method="POST",status="201",le="+Inf"} 1', text)
+        self.assertIn('monitor_ingest_snapshots_total 1', text)
+        self.assertIn('monitor_ingest_queue_depth 0', text)
+        self.assertIn('# TYPE monitor_db_queries_per_request histogram', text)
+
+
+class FastJSONTests(MonitorTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+
+    def test_json_ingest_validation_matches_nested_serializer(self):
+        def bad(**changes):
+            payload = base_payload()
+            payload['processes'] = [dict(p) for p in payload['processes']]
+            for path, value in changes.items():
+                row, field = path.split('__')
+                if value is KeyError:
+                    del payload['processes'][int(row[1:])][field]
+                else:
+                    payload['processes'][int(row[1:])][field] = value
+            return payload
+
+        cases = [
+            base_payload(),
+            bad(p0__pid='abc'),
+            bad(p1__pid=3.0, p0__ppid='7'),
+            bad(p1__pid=3.5, p0__name='', p1__cpu_percent='x'),
+            bad(p0__memory_mb=KeyError, p1__name='n' * 256),
+            bad(p1__cmdline='c' * 8193, p0__ppid=None),
+            bad(p0__pid=True, p1__memory_mb=[1]),
+            {**base_payload(), 'processes': [{'pid': 1}, 'oops']},
+            {**base_payload(), 'processes': 'oops'},
+        ]
+        delta = base_payload()
+        delta.pop('processes')
+        delta.update(base_captured_at=delta['captured_at'], delta={'added': [{'pid': 'x'}], 'removed': [1]})
+        cases.append(delta)
+
+        for payload in cases:
+            reference, fast = IngestSerializer(data=payload), JSONIngestSerializer(data=payload)
+            self.assertEqual(fast.is_valid(), reference.is_valid())
+            # ErrorDetail equality covers the error codes as well as the messages
+            self.assertEqual(fast.errors, reference.errors)
+            if not reference.errors:
+                self.assertEqual(
+                    json.loads(json.dumps(fast.validated_data, default=str)),
+                    json.loads(json.dumps(reference.validated_data, default=str)),
+                )
+
+    def test_one_pass_checks_accept_exactly_what_drf_accepts(self):
+        edge_values = {
+            'pid': [7, '7', ' 7 ', 7.0, '7.00', 7.5, True, 'nan', 1e20, 2 ** 70, '9' * 1001, [7], None],
+            'name': ['x', ' x ', 7, 7.5, True, '', '  ', 'n' * 255, 'n' * 256, 'a\x00b', 'a\ud800b', ['x'], None],
+            'cpu_percent': [1, 1.5, '1.5', True, 'nan', 'inf', '-Infinity', float('nan'), 10 ** 400, '1' * 1001, 'x', [1], None],
+            'cmdline': ['', ' ', 'c' * 8192, 'c' * 8193, 'a\x00', '\udfff', 7, False, None],
+            'started': [1700000000, '17', 7.0, 0, -1, 2 ** 63 - 1, 2 ** 63, 7.5, True, 'x', None],
+        }
+        for field, values in edge_values.items():
+            for value in values:
+                payload = base_payload()
+                payload['processes'] = [dict(p) for p in payload['processes']]
+                payload['processes'][0][field] = value
+                reference, fast = IngestSerializer(data=payload), JSONIngestSerializer(data=payload)
+                with self.subTest(field=field, value=value):
+                    self.assertEqual(fast.is_valid(), reference.is_valid())
+                    self.assertEqual(fast.errors, reference.errors)
+                    if not reference.errors:
+                        self.assertEqual(fast.validated_data['processes'], [dict(p) for p in reference.validated_data['processes']])
+                    # The batch endpoint uses the same checks with shorter errors
+                    self.assertEqual(BatchIngestItemSerializer(data=payload).is_valid(), reference.is_valid())
+
+    def test_fast_validation_can_be_switched_off(self):
+        metrics.reset()
+        self.client.credentials(HTTP_X_API_KEY='K1')
+        with override_settings(MONITOR_FAST_INGEST_VALIDATION=False):
+            self.assertEqual(self.client.post('/api/v1/ingest', base_payload(), format='json').status_code, 201)
+        self.assertEqual(metrics.VALIDATION_SECONDS.count(('IngestSerializer',)), 1)
+        self.assertEqual(metrics.VALIDATION_SECONDS.count(('JSONIngestSerializer',)), 0)
+
+    def test_renderer_and_parser_match_drf(self):
+        from rest_framework.parsers import JSONParser
+        from rest_framework.renderers import JSONRenderer
+        from io import BytesIO
+
+        data = {
+            'at': datetime(2025, 1, 1, 1, 2, 3, 4500, tzinfo=timezone.utc),
+            'text': 'line\u2028sep é',
+            'numbers': [1, 1.0, 0.1, -0.0, 1e20, 2 ** 70],
+            'nested': [{'pid': 1, 'name': None}],
+        }
+        self.assertEqual(fastjson.FastJSONRenderer().render(data), JSONRenderer().render(data))
+        body = JSONRenderer().render(data)
+        self.assertEqual(fastjson.FastJSONParser().parse(BytesIO(body)), JSONParser().parse(BytesIO(body)))
+
+        self.client.credentials(HTTP_X_API_KEY='K1')
+        res = self.client.post('/api/v1/ingest', b'{"hostname": ', content_type='application/json')
+        self.assertEqual(res.status_code, 400)
+        self.assertIn('JSON parse error', res.json()['detail'])
@@ -0,0 +1,123 @@
+"""
+Process tree of one snapshot, built once in O(n) and cached per snapshot.
+
+The cached form is flat: a dict of pid -> [ppid, name, cpu_percent, memory_mb,
+subtree_cpu_percent, subtree_memory_mb, subtree_size, child pids]. Root
+processes are those whose parent is not in the snapshot; members of a PPID
+cycle with no root are promoted to roots so every process appears exactly once.
+"""
+from .cache import get_cache, retention_timeout
+
+PPID, NAME, CPU, MEM, SUB_CPU, SUB_MEM, SUB_SIZE, KIDS = range(8)
+
+
+def tree_key(snapshot_id):
+    return f"monitor:tree:{snapshot_id}"
+
+
+def build(rows):
+    """rows: iterable of (pid, ppid, name, cpu_percent, memory_mb). Returns {"nodes", "roots"}."""
+    nodes = {}
+    for pid, ppid, name, cpu, mem in rows:
+        nodes[pid] = [ppid, name, cpu, mem, cpu, mem, 1, []]
+
+    roots = []
+    for pid, node in nodes.items():
+        parent = nodes.get(node[PPID])
+        if parent is None or node[PPID] == pid:
+            roots.append(pid)
+        else:
+            parent[KIDS].append(pid)
+
+    # Breadth-first order from the roots; anything unreached sits on a cycle
+    order = []
+    seen = set()
+
+    def walk(start):
+        queue = [start]
+        seen.add(start)
+        for pid in queue:
+            order.append(pid)
+            for kid in nodes[pid][KIDS]:
+                if kid not in seen:
+                    seen.add(kid)
+                    queue.append(kid)
+
+    for pid in roots:
+        walk(pid)
+    for pid in nodes:
+        if pid not in seen:
+            roots.append(pid)
+            # Detach from the cycle so the subtree sums below stay finite
+            parent = nodes.get(nodes[pid][PPID])
+            if parent is not None and pid in parent[KIDS]:
+                parent[KIDS].remove(pid)
+            walk(pid)
+
+    # Children before parents: fold subtree totals upwards
+    root_set = set(roots)
+    for pid in reversed(order):
+        if pid in root_set:
+            continue
+        node, parent = nodes[pid], nodes[nodes[pid][PPID]]
+        parent[SUB_CPU] += node[SUB_CPU]
+        parent[SUB_MEM] += node[SUB_MEM]
+        parent[SUB_SIZE] += node[SUB_SIZE]
+
+    by_name = lambda pid: (nodes[pid][NAME].lower(), pid)
+    for node in nodes.values():
+        node[KIDS].sort(key=by_name)
+    roots.sort(key=by_name)
+    return {"nodes": nodes, "roots": roots}
+
+
+def get_tree(snapshot):
+    cache = get_cache()
+    tree = cache.get(tree_key(snapshot.id))
+    if tree is None:
+        rows = snapshot.processes.with_text().values_list("pid", "ppid", "name", "cpu_percent", "memory_mb")
+        tree = build(rows)
+        timeout = retention_timeout(snapshot.captured_at)
+        if timeout:
+            cache.set(tree_key(snapshot.id), tree, timeout)
+    return tree
+
+
+def node_view(tree, pid):
+    n = tree["nodes"][pid]
+    return {
+        "pid": pid,
+        "ppid": n[PPID],
+        "name": n[NAME],
+        "cpu_percent": n[CPU],
+        "memory_mb": n[MEM],
+        "subtree_cpu_percent": round(n[SUB_CPU], 2),
+        "subtree_memory_mb": round(n[SUB_MEM], 2),
+        "subtree_size": n[SUB_SIZE],
+        "child_count": len(n[KIDS]),
+    }
+
+
+def nested(tree, pids, depth):
+    """Nested nodes for `pids`, expanding `depth` - 1 further levels (None = unlimited)."""
+    out = []
+    for pid in pids:
+        view = node_view(tree, pid)
+        if depth is None or depth > 1:
+            view["children"] = nested(tree, tree["nodes"][pid][KIDS], None if depth is None else depth - 1)
+        out.append(view)
+    return out
+
+
+def preorder(tree, pids, depth):
+    """Flat pre-order listing of the same nodes, each with its `level` below the requested root."""
+    out = []
+    stack = [(pid, 0) for pid in reversed(pids)]
+    while stack:
+        pid, level = stack.pop()
+        view = node_view(tree, pid)
+        view["level"] = level
+        out.append(view)
+        if depth is None or level + 1 < depth:
+            stack.extend((kid, level + 1) for kid in reversed(tree["nodes"][pid][KIDS]))
+    return out
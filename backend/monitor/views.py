@@ -1,14 +1,63 @@
-from django.shortcuts import render, get_object_or_404
-from rest_framework.decorators import api_view, permission_classes
+from datetime import datetime, timedelta, timezone as dt_timezone
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.db.models import CharField, Count, F, Max, Min, Q, Sum
+from django.db.models.functions import Cast
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, StreamingHttpResponse
+from django.shortcuts import render
+from django.utils import timezone
+from django.utils.dateparse import parse_datetime
+from rest_framework.decorators import api_view, parser_classes, permission_classes
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.parsers import JSONParser
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
+from rest_framework.settings import api_settings
 from rest_framework import status
 
-from .models import Host, Snapshot, Process
-from .serializers import IngestSerializer
+from . import history, inventory, metrics, retention, rollups, tree as process_tree
+from .cache import HOSTS_KEY, cached_response, latest_key, processes_key, query_key
+from .hostcache import hosts as hosts_cache
+from .inventory import InventoryRequired
+from .ingest import PROCESS_FIELDS, KeyframeRequired, resolve_processes, store_snapshot, store_snapshots
+from .models import Alert, Host, LatestProcess, ProcessName, Snapshot
+from .parsers import ColumnarParser
+from .serializers import BatchIngestItemSerializer, ColumnarIngestSerializer, IngestSerializer, JSONIngestSerializer, snapshot_summary
+from .stream import broker, events
+from .writer import get_writer
+
+
+def _authorized_host(hostname, api_key, authenticated=None):
+    """
+    Upsert host: auto-create if not present; None if it exists with a different API key.
+    `authenticated` is the Host APIKeyAuthentication already resolved from
+    `api_key` (request.user), which saves looking it up again.
+    """
+    if isinstance(authenticated, Host):
+        # The key belongs to exactly one host (api_key is unique)
+        return authenticated if authenticated.hostname == hostname else None
+    host = hosts_cache.by_hostname(hostname)
+    if host is None:
+        try:
+            with transaction.atomic():
+                return Host.objects.create(hostname=hostname, api_key=api_key)
+        except IntegrityError:
+            # Concurrent first ingest for this hostname, or the key is bound to another host
+            host = Host.objects.filter(hostname=hostname).first()
+            if host is None:
+                return None
+    return host if host.api_key == api_key else None
+
+
+# The JSON parser configured in REST_FRAMEWORK (monitor.fastjson's by default), plus the columnar format
+_INGEST_PARSERS = [p for p in api_settings.DEFAULT_PARSER_CLASSES if issubclass(p, JSONParser)] or [JSONParser]
 
 
 @api_view(["POST"])
+@parser_classes([*_INGEST_PARSERS, ColumnarParser])
 @permission_classes([AllowAny])
 def ingest(request):
     # Require API key in headers
@@ -16,60 +65,54 @@ def ingest(request):
     if not api_key:
         return Response({"detail": "Missing API key"}, status=status.HTTP_403_FORBIDDEN)
 
-    # Validate incoming payload
-    serializer = IngestSerializer(data=request.data)
-    if not serializer.is_valid():
+    # Validate incoming payload (columnar bodies skip per-process field validation)
+    if request.content_type.startswith(ColumnarParser.media_type):
+        serializer = ColumnarIngestSerializer(data=request.data)
+    elif settings.MONITOR_FAST_INGEST_VALIDATION:
+        serializer = JSONIngestSerializer(data=request.data)
+    else:
+        serializer = IngestSerializer(data=request.data)
+    if not metrics.validate(serializer):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
     data = serializer.validated_data
     hostname = data["hostname"]
+    retention.ensure_scheduled()
+
+    host = _authorized_host(hostname, api_key, request.user)
+    if host is None:
+        return Response({"detail": "Invalid API key for host"}, status=status.HTTP_403_FORBIDDEN)
 
-    # Upsert host: auto-create if not present; enforce API key match if it exists
+    # Checked before queueing: the agent must hear about an unknown version now
     try:
-        host = Host.objects.get(hostname=hostname)
-        if host.api_key != api_key:
-            return Response({"detail": "Invalid API key for host"}, status=status.HTTP_403_FORBIDDEN)
-    except Host.DoesNotExist:
-        host = Host.objects.create(hostname=hostname, api_key=api_key)
-
-    # Extract system info from validated serializer
-    sysinfo = data["system_info"]
-
-    # Create Snapshot entry
-    snapshot = Snapshot.objects.create(
-        host=host,
-        captured_at=data["captured_at"],
-        os=sysinfo["os"],
-        processor=sysinfo.get("processor", ""),
-        cores=sysinfo["cores"],
-        threads=sysinfo["threads"],
-        ram_gb=sysinfo["ram_gb"],
-        used_ram_gb=sysinfo["used_ram_gb"],
-        available_ram_gb=sysinfo["available_ram_gb"],
-        storage_total_gb=sysinfo["storage_total_gb"],
-        storage_used_gb=sysinfo["storage_used_gb"],
-        storage_free_gb=sysinfo["storage_free_gb"],
-        cpu_freq_mhz=sysinfo.get("cpu_freq_mhz"),
-    )
+        inventory.resolve(data)
+    except InventoryRequired as e:
+        return Response({"detail": str(e), "inventory_required": True}, status=status.HTTP_409_CONFLICT)
 
-    # Bulk insert processes
-    processes = [
-        Process(
-            snapshot=snapshot,
-            pid=p["pid"],
-            ppid=p["ppid"],
-            name=p["name"],
-            cpu_percent=p["cpu_percent"],
-            memory_mb=p["memory_mb"],
-            cmdline=p.get("cmdline", ""),
-        )
-        for p in data["processes"]
-    ]
-    Process.objects.bulk_create(processes)
+    if settings.MONITOR_INGEST_MODE == "async":
+        writer = get_writer()
+        if not writer.submit(host, data, timeout=settings.MONITOR_INGEST_ENQUEUE_TIMEOUT):
+            return Response(
+                {"detail": "ingest queue full, retry later"},
+                status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                headers={"Retry-After": "1"},
+            )
+        body = {"queued": True, "queue_depth": writer.depth()}
+        if writer.pop_keyframe_needed(host.id):
+            body["keyframe_required"] = True
+        return Response(body, status=status.HTTP_202_ACCEPTED)
 
-    # Persist process count on the snapshot for quick summaries
-    snapshot.process_count = len(processes)
-    snapshot.save(update_fields=["process_count"])
+    # Rebuild the full process list (deltas are applied to the acknowledged base)
+    # and store the snapshot atomically so a failed insert never leaves a partial row set.
+    try:
+        with transaction.atomic():
+            processes = resolve_processes(host, data)
+            snapshot = store_snapshot(host, data, processes)
+    except KeyframeRequired as e:
+        return Response(
+            {"detail": str(e), "keyframe_required": True},
+            status=status.HTTP_409_CONFLICT,
+        )
 
     return Response(
         {"snapshot_id": snapshot.id, "processes": snapshot.process_count},
@@ -77,19 +120,132 @@ def ingest(request):
     )
 
 
+def _authorized_hosts(keys):
+    """
+    Bulk form of _authorized_host for {hostname: api_key}: one query for known
+    hosts, plus one insert for new ones. Returns {hostname: Host}; hosts whose
+    key does not match are left out.
+    """
+    found = {h.hostname: h for h in Host.objects.filter(hostname__in=keys)}
+    missing = [name for name in keys if name not in found]
+    if missing:
+        taken = set(Host.objects.filter(api_key__in=[keys[n] for n in missing]).values_list("api_key", flat=True))
+        new = []
+        for name in missing:
+            # api_key is unique: a key already bound to another host cannot register a new one
+            if keys[name] not in taken:
+                taken.add(keys[name])
+                new.append(Host(hostname=name, api_key=keys[name]))
+        try:
+            with transaction.atomic():
+                Host.objects.bulk_create(new)
+        except IntegrityError:
+            # Lost a race with a concurrent first ingest; use whatever got stored
+            new = Host.objects.filter(hostname__in=missing)
+        found.update((h.hostname, h) for h in new)
+    return found
+
+
+@api_view(["POST"])
+@permission_classes([AllowAny])
+def ingest_batch(request):
+    """
+    Several snapshots in one request: {"snapshots": [<ingest payload>, ...]}, possibly
+    for several hosts (relays set a per-item "api_key"; otherwise X-API-KEY applies).
+    All items are validated first, hosts are resolved in one query, and every
+    accepted snapshot is written with one Snapshot and one Process bulk insert.
+    Each item gets an entry in "results" (same order) with the status the
+    single-item endpoint would have returned; a snapshot already stored for the
+    same host and captured_at is reported as a duplicate instead of stored twice.
+    """
+    items = request.data.get("snapshots") if isinstance(request.data, dict) else None
+    if not isinstance(items, list):
+        return Response({"detail": "snapshots must be a list"}, status=status.HTTP_400_BAD_REQUEST)
+    if len(items) > settings.MONITOR_INGEST_BATCH_MAX_ITEMS:
+        return Response(
+            {"detail": f"at most {settings.MONITOR_INGEST_BATCH_MAX_ITEMS} snapshots per request"},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    retention.ensure_scheduled()
+    header_key = request.headers.get("X-API-KEY")
+
+    results = [None] * len(items)
+    valid = []
+    for i, item in enumerate(items):
+        serializer = BatchIngestItemSerializer(data=item)
+        if not metrics.validate(serializer):
+            results[i] = {"status": 400, "errors": serializer.errors}
+            continue
+        data = serializer.validated_data
+        api_key = data.pop("api_key", None) or header_key
+        if not api_key:
+            results[i] = {"status": 403, "detail": "Missing API key"}
+            continue
+        valid.append((i, api_key, data))
+
+    with transaction.atomic():
+        keys = {}
+        for _, api_key, data in valid:
+            keys.setdefault(data["hostname"], api_key)
+        hosts_by_name = _authorized_hosts(keys) if keys else {}
+
+        accepted = []
+        for i, api_key, data in valid:
+            host = hosts_by_name.get(data["hostname"])
+            if host is None or host.api_key != api_key:
+                results[i] = {"status": 403, "detail": "Invalid API key for host"}
+                continue
+            accepted.append((i, host, data))
+
+        stored = {}
+        if accepted:
+            existing = Snapshot.objects.filter(
+                host_id__in={host.id for _, host, _ in accepted},
+                captured_at__in={data["captured_at"] for _, _, data in accepted},
+            ).values_list("host_id", "captured_at", "id")
+            stored = {(host_id, ts): sid for host_id, ts, sid in existing}
+
+        pending, versions, to_store, repeats = {}, {}, [], []
+        for i, host, data in accepted:
+            key = (host.id, data["captured_at"])
+            if key in stored:
+                results[i] = {"status": 200, "snapshot_id": stored[key], "duplicate": True}
+                continue
+            if key in pending:
+                repeats.append((i, key))
+                continue
+            try:
+                inventory.resolve(data, versions)
+            except InventoryRequired as e:
+                results[i] = {"status": 409, "detail": str(e), "inventory_required": True}
+                continue
+            try:
+                processes = resolve_processes(host, data, pending)
+            except KeyframeRequired as e:
+                results[i] = {"status": 409, "detail": str(e), "keyframe_required": True}
+                continue
+            pending[key] = processes
+            to_store.append((i, key, (host, data, processes)))
+
+        snapshots = store_snapshots([entry for _, _, entry in to_store]) if to_store else []
+        for (i, key, _), snapshot in zip(to_store, snapshots):
+            stored[key] = snapshot.id
+            results[i] = {"status": 201, "snapshot_id": snapshot.id, "processes": snapshot.process_count}
+        for i, key in repeats:
+            results[i] = {"status": 200, "snapshot_id": stored[key], "duplicate": True}
+
+    return Response({"results": results}, status=status.HTTP_200_OK)
+
+
 @api_view(["GET"])
 @permission_classes([AllowAny])
 def hosts(request):
-    latest = Snapshot.objects.select_related("host").order_by("host__hostname", "-captured_at")
-    seen = set()
-    out = []
-    for s in latest:
-        h = s.host.hostname
-        if h in seen:
-            continue
-        seen.add(h)
-        out.append({"hostname": h, "last_seen": s.captured_at})
-    return Response(out)
+    def build():
+        # last_seen is maintained by ingest, so this is one indexed scan of Host
+        rows = list(Host.objects.filter(last_seen__isnull=False).order_by("hostname").values("hostname", "last_seen"))
+        return rows, max((r["last_seen"] for r in rows), default=None)
+
+    return cached_response(request, HOSTS_KEY, build)
 
 
 @api_view(["GET"])
@@ -98,47 +254,363 @@ def latest_snapshot(request):
     hostname = request.query_params.get("hostname")
     if not hostname:
         return Response({"detail": "hostname is required"}, status=400)
+
+    def build():
+        try:
+            host = Host.objects.select_related("latest_snapshot__inventory").get(hostname=hostname)
+        except Host.DoesNotExist:
+            return Response({"detail": "unknown host"}, status=404)
+        snap = host.latest_snapshot
+        if not snap:
+            return Response({"detail": "no snapshots"}, status=404)
+        return {**snapshot_summary(host, snap), "agent": host.agent}, snap.captured_at
+
+    return cached_response(request, latest_key(hostname), build)
+
+
+_PROCESS_SORTS = {
+    "cpu": ("-cpu_percent", "pid"),
+    "mem": ("-memory_mb", "pid"),
+    "pid": ("pid",),
+    "name": ("name", "pid"),
+}
+
+
+def _relative(url):
+    if url is None:
+        return None
+    parts = urlsplit(url)
+    return f"{parts.path}?{parts.query}" if parts.query else parts.path
+
+
+class ProcessPagination(LimitOffsetPagination):
+    """
+    next/previous are relative links: pages are cached and served to clients
+    that may have reached this server under another host name or scheme.
+    """
+    max_limit = 5000
+
+    def get_next_link(self):
+        return _relative(super().get_next_link())
+
+    def get_previous_link(self):
+        return _relative(super().get_previous_link())
+
+
+@api_view(["GET"])
+@permission_classes([AllowAny])
+def snapshot_processes(request, snapshot_id: int):
+    """
+    Processes of one snapshot. Without query parameters this is the full list.
+    Optional: name= (substring, case-insensitive), pid=, q= (the UI search: name
+    substring, or digits found in the pid or ppid), sort=cpu|mem|pid|name,
+    fields=pid,name,... and limit=/offset= (response becomes {count, next, previous, results}).
+    sort=cpu|mem with a limit is a top-K read on the (snapshot, metric) indexes.
+    """
+    params = request.query_params
+    fields = PROCESS_FIELDS
+    if "fields" in params:
+        fields = tuple(f for f in params["fields"].split(",") if f)
+        if not fields or not set(fields) <= set(PROCESS_FIELDS):
+            return Response({"detail": f"fields must be a subset of {','.join(PROCESS_FIELDS)}"}, status=400)
+    if params.get("sort") and params["sort"] not in _PROCESS_SORTS:
+        return Response({"detail": f"sort must be one of {','.join(_PROCESS_SORTS)}"}, status=400)
+    try:
+        pid = int(params["pid"]) if "pid" in params else None
+    except ValueError:
+        return Response({"detail": "pid must be an integer"}, status=400)
+    if "limit" in params:
+        # LimitOffsetPagination silently ignores a limit it cannot use
+        try:
+            limit = int(params["limit"])
+        except ValueError:
+            limit = 0
+        if limit < 1:
+            return Response({"detail": "limit must be a positive integer"}, status=400)
+
+    def build():
+        try:
+            snap = Snapshot.objects.get(id=snapshot_id)
+        except Snapshot.DoesNotExist:
+            return Response({"detail": "snapshot not found"}, status=404)
+        procs = snap.processes.with_text()
+        if params.get("name"):
+            # Match against the (small) name dictionary, then look rows up by name id
+            names = ProcessName.objects.filter(value__icontains=params["name"]).values("id")
+            procs = procs.filter(name_ref__in=names)
+        if params.get("q"):
+            q = params["q"].strip()
+            match = Q(name_ref__in=ProcessName.objects.filter(value__icontains=q).values("id"))
+            if q.isdigit():
+                procs = procs.annotate(pid_text=Cast("pid", CharField()), ppid_text=Cast("ppid", CharField()))
+                match |= Q(pid_text__contains=q) | Q(ppid_text__contains=q)
+            procs = procs.filter(match)
+        if pid is not None:
+            procs = procs.filter(pid=pid)
+        if params.get("sort"):
+            procs = procs.order_by(*_PROCESS_SORTS[params["sort"]])
+        procs = procs.values(*fields)
+
+        if "limit" not in params:
+            return list(procs), snap.captured_at
+        paginator = ProcessPagination()
+        page = paginator.paginate_queryset(procs, request)
+        return paginator.get_paginated_response(page).data, snap.captured_at
+
+    # A snapshot's process list never changes after ingest
+    return cached_response(request, processes_key(snapshot_id, params.dict()), build, immutable=True)
+
+
+@api_view(["GET"])
+@permission_classes([AllowAny])
+def snapshot_tree(request, snapshot_id: int):
+    """
+    Process tree with per-subtree CPU% and memory totals.
+    ?root=<pid> lists that process's children (default: the top-level processes),
+    ?depth=N limits how many levels are expanded (child_count tells the UI what
+    can be expanded lazily), ?layout=nested|flat (flat is pre-order with `level`).
+    """
+    params = request.query_params
+    try:
+        root = int(params["root"]) if "root" in params else None
+        depth = int(params["depth"]) if "depth" in params else None
+    except ValueError:
+        return Response({"detail": "root and depth must be integers"}, status=400)
+    if depth is not None and depth < 1:
+        return Response({"detail": "depth must be >= 1"}, status=400)
+    layout = params.get("layout", "nested")
+    if layout not in ("nested", "flat"):
+        return Response({"detail": "layout must be nested or flat"}, status=400)
+
+    def build():
+        try:
+            snap = Snapshot.objects.get(id=snapshot_id)
+        except Snapshot.DoesNotExist:
+            return Response({"detail": "snapshot not found"}, status=404)
+        tree = process_tree.get_tree(snap)
+        if root is None:
+            pids, root_view = tree["roots"], None
+        elif root in tree["nodes"]:
+            pids, root_view = tree["nodes"][root][process_tree.KIDS], process_tree.node_view(tree, root)
+        else:
+            return Response({"detail": "pid not in snapshot"}, status=404)
+        shape = process_tree.nested if layout == "nested" else process_tree.preorder
+        body = {"snapshot_id": snap.id, "root": root_view, "depth": depth, "nodes": shape(tree, pids, depth)}
+        return body, snap.captured_at
+
+    return cached_response(
+        request, query_key(process_tree.tree_key(snapshot_id) + ":view", params.dict()), build, immutable=True
+    )
+
+
+_STEP_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def _parse_time(value):
+    """ISO 8601 or epoch seconds → aware datetime (None if unparseable)."""
+    try:
+        return datetime.fromtimestamp(float(value), tz=dt_timezone.utc)
+    except (TypeError, ValueError, OverflowError, OSError):
+        # Not a number, NaN, or outside the platform's timestamp range
+        pass
+    try:
+        ts = parse_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if ts is not None and timezone.is_naive(ts):
+        ts = timezone.make_aware(ts, dt_timezone.utc)
+    return ts
+
+
+def _parse_step(value):
+    """"300", "30s", "5m", "1h", "1d" → seconds (None if unparseable)."""
+    value = (value or "").strip().lower()
+    unit = _STEP_UNITS.get(value[-1:]) if value else None
+    try:
+        step = int(value[:-1]) * unit if unit else int(value)
+    except ValueError:
+        return None
+    return step if step > 0 else None
+
+
+def _parse_window(params):
+    """(start, end, step seconds) from ?from=&to=&step= (default: the last hour, ~300 points), or a 400 Response."""
+    end = _parse_time(params["to"]) if "to" in params else timezone.now()
+    if end is None:
+        return Response({"detail": "from/to must be ISO 8601 or epoch seconds with from < to"}, status=400)
+    try:
+        start = _parse_time(params["from"]) if "from" in params else end - timedelta(hours=1)
+    except OverflowError:
+        start = None  # `to` within an hour of datetime.min
+    if start is None or start >= end:
+        return Response({"detail": "from/to must be ISO 8601 or epoch seconds with from < to"}, status=400)
+    if "step" in params:
+        step = _parse_step(params["step"])
+        if step is None:
+            return Response({"detail": "step must be seconds or a duration like 30s, 5m, 1h, 1d"}, status=400)
+    else:
+        # Default to roughly 300 points over the requested range
+        step = max(1, int((end - start).total_seconds() // 300))
+    return start, end, step
+
+
+@api_view(["GET"])
+@permission_classes([AllowAny])
+def host_metrics(request, hostname: str):
     try:
         host = Host.objects.get(hostname=hostname)
     except Host.DoesNotExist:
         return Response({"detail": "unknown host"}, status=404)
-    snap = host.snapshots.order_by("-captured_at").first()
-    if not snap:
-        return Response({"detail": "no snapshots"}, status=404)
+
+    window = _parse_window(request.query_params)
+    if isinstance(window, Response):
+        return window
+    start, end, step = window
+
+    resolution, step, points = rollups.series(host, start, end, step)
     return Response(
         {
-            "snapshot_id": snap.id,
-            "captured_at": snap.captured_at,
-            "process_count": snap.process_count,
-            "system": {
-                "hostname": snap.host.hostname,
-                "os": snap.os,
-                "processor": snap.processor,
-                "cores": snap.cores,
-                "threads": snap.threads,
-                "ram_gb": snap.ram_gb,
-                "used_ram_gb": snap.used_ram_gb,
-                "available_ram_gb": snap.available_ram_gb,
-                "storage_total_gb": snap.storage_total_gb,
-                "storage_used_gb": snap.storage_used_gb,
-                "storage_free_gb": snap.storage_free_gb,
-                "cpu_freq_mhz": snap.cpu_freq_mhz,
-            },
+            "hostname": host.hostname,
+            "from": start,
+            "to": end,
+            "step": step,
+            "resolution": resolution,
+            "points": points,
         }
     )
 
 
 @api_view(["GET"])
 @permission_classes([AllowAny])
-def snapshot_processes(request, snapshot_id: int):
+def process_series(request, hostname: str, selector: str):
+    """
+    CPU / memory history of one process on one host. `selector` is a pid when
+    it is all digits, otherwise an exact process name (?by=name|pid overrides).
+    A pid yields one series per process that held it, told apart by name,
+    command line and start time (null from agents that do not report it).
+    """
+    host = hosts_cache.by_hostname(hostname)
+    if host is None:
+        return Response({"detail": "unknown host"}, status=404)
+
+    by = request.query_params.get("by") or ("pid" if selector.isdigit() else "name")
+    if by not in ("name", "pid") or (by == "pid" and not selector.isdigit()):
+        return Response({"detail": "by must be name or pid (pid must be an integer)"}, status=400)
+
+    window = _parse_window(request.query_params)
+    if isinstance(window, Response):
+        return window
+    start, end, step = window
+
+    if by == "pid":
+        found = history.series(host, start, end, step, pid=int(selector))
+    else:
+        found = history.series(host, start, end, step, name=selector)
+    return Response(
+        {
+            "hostname": host.hostname,
+            by: int(selector) if by == "pid" else selector,
+            "from": start,
+            "to": end,
+            "step": step,
+            "series": found,
+        }
+    )
+
+
+_FLEET_METRICS = ("memory_mb", "cpu_percent")
+
+
+@api_view(["GET"])
+@permission_classes([AllowAny])
+def fleet_top(request):
+    """The heaviest processes across every host's latest snapshot, from the LatestProcess table."""
+    metric = request.query_params.get("metric", "memory_mb")
+    if metric not in _FLEET_METRICS:
+        return Response({"detail": f"metric must be one of {', '.join(_FLEET_METRICS)}"}, status=400)
     try:
-        snap = Snapshot.objects.get(id=snapshot_id)
-    except Snapshot.DoesNotExist:
-        return Response({"detail": "snapshot not found"}, status=404)
-    procs = snap.processes.values(
-        "pid", "ppid", "name", "cpu_percent", "memory_mb", "cmdline"
+        n = int(request.query_params.get("n", 50))
+    except ValueError:
+        n = 0
+    if not 1 <= n <= settings.MONITOR_FLEET_TOP_K:
+        return Response({"detail": f"n must be between 1 and {settings.MONITOR_FLEET_TOP_K}"}, status=400)
+
+    rows = (
+        LatestProcess.objects.order_by(f"-{metric}")
+        .values("snapshot_id", "captured_at", "pid", "ppid", "cpu_percent", "memory_mb",
+                hostname=F("host__hostname"), name=F("name_ref__value"))[:n]
+    )
+    return Response({"metric": metric, "n": n, "results": list(rows)})
+
+
+@api_view(["GET"])
+@permission_classes([AllowAny])
+def fleet_summary(request):
+    """Totals over every host's latest snapshot, in one aggregate query."""
+    latest, inv = "latest_snapshot__", "latest_snapshot__inventory__"
+    totals = Host.objects.filter(latest_snapshot__isnull=False).aggregate(
+        hosts=Count("id"),
+        processes=Sum(latest + "process_count"),
+        cores=Sum(inv + "cores"),
+        threads=Sum(inv + "threads"),
+        ram_gb=Sum(inv + "ram_gb"),
+        used_ram_gb=Sum(latest + "used_ram_gb"),
+        available_ram_gb=Sum(latest + "available_ram_gb"),
+        storage_total_gb=Sum(inv + "storage_total_gb"),
+        storage_used_gb=Sum(latest + "storage_used_gb"),
+        storage_free_gb=Sum(latest + "storage_free_gb"),
+        oldest=Min("last_seen"),
+        newest=Max("last_seen"),
     )
-    return Response(list(procs))
+    for key, value in totals.items():
+        if isinstance(value, float):
+            totals[key] = round(value, 2)
+    return Response(totals)
+
+
+@api_view(["GET"])
+@permission_classes([AllowAny])
+def alerts(request):
+    """Alert firings, newest first. ?state=firing (default)|resolved|all, ?hostname=, ?limit= (max 1000)."""
+    state = request.query_params.get("state", "firing")
+    if state not in ("firing", "resolved", "all"):
+        return Response({"detail": "state must be firing, resolved or all"}, status=400)
+    try:
+        limit = min(int(request.query_params.get("limit", 100)), 1000)
+    except ValueError:
+        return Response({"detail": "limit must be an integer"}, status=400)
+
+    rows = Alert.objects.order_by("-fired_at", "-id")
+    if state != "all":
+        rows = rows.filter(resolved_at__isnull=state == "firing")
+    if request.query_params.get("hostname"):
+        rows = rows.filter(host__hostname=request.query_params["hostname"])
+    rows = rows.values_list(
+        "id", "rule__name", "rule__expression", "rule__process_name", "host__hostname", "fired_at", "resolved_at", "value"
+    )[:max(limit, 0)]
+    keys = ("id", "rule", "expression", "process_name", "hostname", "fired_at", "resolved_at", "value")
+    return Response({"state": state, "results": [dict(zip(keys, row)) for row in rows]})
+
+
+async def stream(request):
+    """
+    Server-Sent Events: one `snapshot` event per committed ingest (summary plus
+    process delta, or the full list for keyframes). Optional ?hostname= filter.
+    Needs an ASGI server; under WSGI the response cannot stream.
+    """
+    if not isinstance(request, ASGIRequest):
+        # Under WSGI an endless async stream would be buffered forever; let the UI fall back to polling
+        return HttpResponse("Live stream requires the ASGI server (backend.asgi).", status=501)
+    sub = broker.subscribe(request.GET.get("hostname") or None)
+    response = StreamingHttpResponse(events(sub), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
+
+
+def export_metrics(request):
+    """Request, database and ingest metrics of this server process, in the Prometheus text format."""
+    return HttpResponse(metrics.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
 
 
 from django.views.decorators.clickjacking import xframe_options_exempt
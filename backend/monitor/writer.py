@@ -0,0 +1,149 @@
+import atexit
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+
+from .ingest import KeyframeRequired, resolve_processes, store_snapshots
+
+logger = logging.getLogger(__name__)
+
+
+class IngestWriter:
+    """
+    Write-behind queue for validated ingest payloads.
+
+    The request thread only validates and enqueues; a background thread drains
+    the queue and stores up to `batch_size` snapshots per transaction. The queue
+    is bounded so a slow database pushes back on agents (503) instead of growing
+    memory without limit. If a batch fails, its snapshots are retried one per
+    savepoint and only the ones that still fail are dropped (and logged).
+    """
+
+    def __init__(self, maxsize=1000, batch_size=200):
+        self.queue = queue.Queue(maxsize=maxsize)
+        self.batch_size = batch_size
+        # Hosts whose last queued delta could not be applied; reported on their next post
+        self.keyframe_needed = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stopping = threading.Event()
+
+    def submit(self, host, data, timeout=None):
+        """Enqueue one validated payload. Returns False when the queue stays full past `timeout`."""
+        try:
+            self.queue.put((host, data), timeout=timeout)
+        except queue.Full:
+            return False
+        return True
+
+    def depth(self):
+        return self.queue.qsize()
+
+    def pop_keyframe_needed(self, host_id):
+        with self._lock:
+            if host_id in self.keyframe_needed:
+                self.keyframe_needed.discard(host_id)
+                return True
+        return False
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="monitor-ingest-writer", daemon=True)
+            self._thread.start()
+            atexit.register(self.stop)
+
+    def stop(self, timeout=5):
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+        # Whatever is left is written synchronously
+        self.drain()
+
+    def drain(self, max_items=None):
+        """Write queued payloads in the calling thread. Returns the number stored."""
+        stored = 0
+        while max_items is None or stored < max_items:
+            batch = self._take(block=False)
+            if not batch:
+                break
+            stored += self._write_batch(batch)
+        return stored
+
+    def _take(self, block):
+        batch = []
+        try:
+            batch.append(self.queue.get(block=block, timeout=0.5 if block else None))
+            while len(batch) < self.batch_size:
+                batch.append(self.queue.get_nowait())
+        except queue.Empty:
+            pass
+        return batch
+
+    def _run(self):
+        while not self._stopping.is_set():
+            batch = self._take(block=True)
+            if not batch:
+                continue
+            close_old_connections()
+            try:
+                self._write_batch(batch)
+            except Exception:
+                logger.exception("Dropped %d queued snapshots", len(batch))
+
+    def _write_batch(self, batch):
+        try:
+            with transaction.atomic():
+                return self._store(batch)
+        except Exception:
+            if len(batch) == 1:
+                raise
+            logger.exception("Writing %d queued snapshots failed; retrying them one by one", len(batch))
+        # One savepoint per snapshot, so a bad one cannot take the rest of the batch with it
+        stored = 0
+        for host, data in batch:
+            try:
+                with transaction.atomic():
+                    stored += self._store([(host, data)])
+            except Exception:
+                logger.exception("Dropped queued snapshot of %s at %s", host.hostname, data["captured_at"])
+        return stored
+
+    def _store(self, batch):
+        # Caller holds a transaction
+        items, pending = [], {}
+        for host, data in batch:
+            try:
+                # A delta may build on an earlier item of the same batch
+                processes = resolve_processes(host, data, pending)
+            except KeyframeRequired:
+                with self._lock:
+                    self.keyframe_needed.add(host.id)
+                continue
+            pending[(host.id, data["captured_at"])] = processes
+            items.append((host, data, processes))
+        if items:
+            store_snapshots(items)
+        return len(items)
+
+_writer = None
+_writer_lock = threading.Lock()
+
+
+def current_writer():
+    """The running writer, or None when async ingest has not started one."""
+    return _writer
+
+
+def get_writer():
+    global _writer
+    with _writer_lock:
+        if _writer is None:
+            _writer = IngestWriter(
+                maxsize=settings.MONITOR_INGEST_QUEUE_SIZE,
+                batch_size=settings.MONITOR_INGEST_BATCH_SIZE,
+            )
+            _writer.start()
+        return _writer